@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+"""Benchmark suite for the data toolbox, using synthetic data trees
+
+For each tree size (number of measurements), a synthetic data tree is
+generated (see ubg_data_toolbox.synthetic_tree; by default, 20 % of the sites
+are laboratory sites, see --lab-fraction) and the following benchmarks are
+run:
+
+    scan             find all measurement directories
+    metadata_chain   merge the metadata chain of (a sample of) measurements
+    get_md_values    build the metadata definitions
+    gen_db           dm_gen_db on the complete tree (requires pandas)
+    check_dirtree    dm_check_dirtree checks on the complete tree
+    id_map_build     build the id maps from the tree and write the cache
+    id_map_lookup    load the id map cache and look up ids
+
+Results are written to a JSON file, which can be compared with the results of
+a previous run:
+
+    $ python benchmarks/bench_suite.py --sizes 1000,10000
+    $ python benchmarks/bench_suite.py --sizes 1000,10000 \\
+        --compare benchmarks/results/20240610_120000_abc1234.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import contextlib
+import subprocess
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, basedir + os.sep + 'lib')
+sys.path.insert(0, basedir + os.sep + 'src')
+
+from ubg_data_toolbox.synthetic_tree import generate_synthetic_tree  # noqa
+from ubg_data_toolbox.synthetic_tree import get_parameters_for_size  # noqa
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories  # noqa
+from ubg_data_toolbox.metadata import metadata_chain  # noqa
+from ubg_data_toolbox.metadata_definitions import get_md_values  # noqa
+from ubg_data_toolbox.id_handling import data_id_handler  # noqa
+from ubg_data_toolbox.dirtree_automaton import START_STATE  # noqa
+
+
+@contextlib.contextmanager
+def _in_directory(directory):
+    pwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(pwd)
+
+
+def bench_scan(dr_root, options):
+    m_dirs = list(find_measurement_directories(dr_root))
+    return len(m_dirs)
+
+
+def bench_metadata_chain(dr_root, options):
+    m_dirs = list(find_measurement_directories(dr_root))
+    random.Random(0).shuffle(m_dirs)
+    m_dirs = m_dirs[0:options.sample]
+    for m_dir in m_dirs:
+        metadata_chain(m_dir).get_merged_metadata()
+    return len(m_dirs)
+
+
+def bench_get_md_values(dr_root, options):
+    repeat = 200
+    for i in range(repeat):
+        get_md_values()
+    return repeat
+
+
+def bench_gen_db(dr_root, options):
+    import dm_gen_db
+    argv = sys.argv
+    sys.argv = ['dm_gen_db']
+    try:
+        with _in_directory(dr_root):
+            dm_gen_db.main()
+    finally:
+        sys.argv = argv
+    return sum(1 for x in find_measurement_directories(dr_root))
+
+
+def bench_check_dirtree(dr_root, options):
+    import dm_check_dirtree
+    with _in_directory(dr_root):
+        id_handler = data_id_handler(
+            dr_root, try_cache=True, update_cache=False)
+        dm_check_dirtree.walk_and_check_dirtree(
+            dr_root,
+            START_STATE,
+            basedir=os.getcwd(),
+            id_handler=id_handler,
+            level=0,
+        )
+    return sum(1 for x in find_measurement_directories(dr_root))
+
+
+def bench_id_map_build(dr_root, options):
+    handler = data_id_handler(dr_root, try_cache=False)
+    handler.save_to_cache()
+    return len(handler.id2path)
+
+
+def bench_id_map_lookup(dr_root, options):
+    handler = data_id_handler(dr_root, try_cache=True)
+    nr_ids = len(handler.id2path)
+    repeat = 10000
+    rng = random.Random(0)
+    for i in range(repeat):
+        m_id = 'syn_{:09}'.format(rng.randrange(1, nr_ids + 1))
+        path = handler.id2path[m_id]
+        assert handler.path2id[path] == m_id
+    return repeat
+
+
+# benchmarks are run in this order (id_map_lookup requires id_map_build)
+BENCHMARKS = [
+    ('scan', bench_scan),
+    ('metadata_chain', bench_metadata_chain),
+    ('get_md_values', bench_get_md_values),
+    ('gen_db', bench_gen_db),
+    ('check_dirtree', bench_check_dirtree),
+    ('id_map_build', bench_id_map_build),
+    ('id_map_lookup', bench_id_map_lookup),
+]
+
+
+def run_benchmark(name, function, dr_root, options):
+    """Run one benchmark with suppressed output
+
+    Returns
+    -------
+    result : dict
+        benchmark, seconds, items (number of processed items),
+        us_per_item
+    """
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        start = time.perf_counter()
+        items = function(dr_root, options)
+        seconds = time.perf_counter() - start
+    except ImportError as e:
+        sys.stdout = stdout
+        print('    skipping {}: {}'.format(name, e))
+        return None
+    finally:
+        sys.stdout = stdout
+    return {
+        'benchmark': name,
+        'seconds': seconds,
+        'items': items,
+        'us_per_item': seconds / max(items, 1) * 1e6,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=basedir, stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, reference_file):
+    """Print the ratio of the run times to a previous run"""
+    with open(reference_file, 'r') as fid:
+        reference = json.load(fid)
+    old = {
+        (x['size'], x['benchmark']): x for x in reference['results']
+    }
+    print('')
+    print('Comparison with {} (commit: {})'.format(
+        reference_file, reference.get('git_commit')))
+    print('{:>8} {:<16} {:>12} {:>12} {:>8}'.format(
+        'size', 'benchmark', 'old [s]', 'new [s]', 'ratio'))
+    for result in results:
+        key = (result['size'], result['benchmark'])
+        if key not in old:
+            continue
+        print('{:>8} {:<16} {:>12.4f} {:>12.4f} {:>8.2f}'.format(
+            result['size'], result['benchmark'],
+            old[key]['seconds'], result['seconds'],
+            result['seconds'] / max(old[key]['seconds'], 1e-9),
+        ))
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Run benchmarks on synthetic data trees',
+    )
+    parser.add_argument(
+        '--sizes',
+        help='Comma-separated numbers of measurements of the synthetic ' +
+        'trees (default: 1000,10000,100000)',
+        default='1000,10000,100000',
+    )
+    parser.add_argument(
+        '--only',
+        help='Comma-separated list of benchmarks to run (default: all): ' +
+        ', '.join(x[0] for x in BENCHMARKS),
+        default=None,
+    )
+    parser.add_argument(
+        '--sample',
+        help='Number of measurements used for per-measurement benchmarks ' +
+        '(default: 1000)',
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        '--raw-files',
+        help='Number of sparse raw files per measurement (default: 0)',
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '--lab-fraction',
+        help='Fraction of the sites of the synthetic trees that are ' +
+        'laboratory sites (default: 0.2)',
+        type=float,
+        default=0.2,
+    )
+    parser.add_argument(
+        '--workdir',
+        help='Directory for the synthetic trees. Existing trees are ' +
+        'reused. If not given, a temporary directory is used and removed',
+        default=None,
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Output JSON file (default: benchmarks/results/' +
+        '[date]_[commit].json)',
+        default=None,
+    )
+    parser.add_argument(
+        '--compare',
+        help='Compare with the results of a previous run (JSON file)',
+        default=None,
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = handle_args()
+    sizes = [int(x) for x in options.sizes.split(',')]
+    benchmarks = BENCHMARKS
+    if options.only is not None:
+        selection = options.only.split(',')
+        benchmarks = [x for x in BENCHMARKS if x[0] in selection]
+
+    if options.workdir is None:
+        workdir = tempfile.mkdtemp(prefix='ubg_bench_')
+    else:
+        workdir = options.workdir
+        os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for size in sizes:
+            name = 'dr_bench_{}_lab{:03}'.format(
+                size, int(round(100 * options.lab_fraction)))
+            dr_root = os.path.abspath(workdir) + os.sep + name
+            if not os.path.isdir(dr_root):
+                print('Generating synthetic tree with {} measurements'.format(
+                    size))
+                start = time.perf_counter()
+                info = generate_synthetic_tree(
+                    workdir,
+                    name=name,
+                    raw_files=options.raw_files,
+                    **get_parameters_for_size(size, options.lab_fraction)
+                )
+                print('    {} measurements, {} directories, {:.1f} s'.format(
+                    info['nr_measurements'], info['nr_directories'],
+                    time.perf_counter() - start))
+
+            for bench_name, function in benchmarks:
+                result = run_benchmark(bench_name, function, dr_root, options)
+                if result is None:
+                    continue
+                result['size'] = size
+                results.append(result)
+                print('{:>8} {:<16} {:>10.4f} s {:>10} items {:>12.1f} '
+                      'us/item'.format(
+                          size, bench_name, result['seconds'],
+                          result['items'], result['us_per_item']))
+    finally:
+        if options.workdir is None:
+            shutil.rmtree(workdir)
+
+    git_commit = get_git_commit()
+    output = options.output
+    if output is None:
+        output = basedir + os.sep + 'benchmarks' + os.sep + 'results' + \
+            os.sep + '{}_{}.json'.format(
+                datetime.datetime.now().strftime('%Y%m%d_%H%M%S'),
+                git_commit,
+            )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fid:
+        json.dump({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'git_commit': git_commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sample': options.sample,
+            'results': results,
+        }, fid, indent=1)
+    print('Results written to {}'.format(output))
+
+    if options.compare is not None:
+        compare_results(results, options.compare)
+
+
+if __name__ == '__main__':
+    main()
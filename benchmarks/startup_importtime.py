@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""Measure the import (startup) time of all console scripts in src/
+
+Each script is imported in a fresh interpreter using "python -X importtime",
+and the cumulative import time of the script module is compared to a budget.
+In addition, heavy third-party packages must not be imported at startup, i.e.,
+they must only be imported on the code paths that need them.
+
+Usage (from the repository root):
+
+    $ python benchmarks/startup_importtime.py
+    $ python benchmarks/startup_importtime.py --repeat 10 dm_m_check_dir
+
+The exit code is 1 if any script exceeds its budget or imports one of the
+packages in HEAVY_PACKAGES.
+"""
+import os
+import sys
+import glob
+import argparse
+import subprocess
+
+# budgets in ms (cumulative import time of the script module, not including
+# interpreter startup)
+DEFAULT_BUDGET_MS = 60
+BUDGETS_MS = {
+    'dm_add': 80,
+}
+
+# packages that should never be imported at startup of a script
+HEAVY_PACKAGES = (
+    'IPython',
+    'pandas',
+    'numpy',
+    'prompt_toolkit',
+    'matplotlib',
+)
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(script, repeat=5):
+    """Import a script module in fresh interpreters
+
+    Parameters
+    ----------
+    script : str
+        Module name of the script (e.g., dm_check_dirtree)
+    repeat : int, optional
+        Number of measurements. The minimum is reported
+
+    Returns
+    -------
+    time_ms : float
+        Minimum cumulative import time of the script module in ms
+    modules : dict
+        module: self import time in us, of the last run
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [basedir + os.sep + 'lib', basedir + os.sep + 'src'] +
+        [x for x in env.get('PYTHONPATH', '').split(os.pathsep) if x != '']
+    )
+    times = []
+    modules = {}
+    for i in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import ' + script],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise Exception('Importing {} failed:\n{}'.format(
+                script, result.stderr))
+        modules = {}
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[12:].split('|')
+            modules[name.strip()] = int(self_us)
+            if name.strip() == script:
+                times.append(int(cumulative_us) / 1000)
+    return min(times), modules
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Check the startup time of the console scripts',
+    )
+    parser.add_argument(
+        'scripts',
+        nargs='*',
+        help='Scripts to check (default: all scripts in src/)',
+    )
+    parser.add_argument(
+        '-r', '--repeat',
+        help='Number of measurements per script (default: 5)',
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        '--top',
+        help='Show the N slowest imported modules of each script',
+        type=int,
+        default=0,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = handle_args()
+    scripts = args.scripts
+    if len(scripts) == 0:
+        scripts = sorted(
+            os.path.basename(x)[0:-3] for x in glob.glob(
+                basedir + os.sep + 'src' + os.sep + '*.py')
+        )
+
+    failed = []
+    for script in scripts:
+        time_ms, modules = measure_import(script, repeat=args.repeat)
+        budget = BUDGETS_MS.get(script, DEFAULT_BUDGET_MS)
+        heavy = sorted(set(
+            x.split('.')[0] for x in modules.keys()
+            if x.split('.')[0] in HEAVY_PACKAGES
+        ))
+        status = 'ok'
+        if time_ms > budget or len(heavy) > 0:
+            status = 'FAILED'
+            failed.append(script)
+        print('{:<30} {:>8.1f} ms (budget: {:>4} ms) {:<6} {}'.format(
+            script, time_ms, budget, status,
+            'imports: ' + ', '.join(heavy) if len(heavy) > 0 else '',
+        ))
+        if args.top > 0:
+            slowest = sorted(
+                modules.items(), key=lambda x: x[1], reverse=True)
+            for name, self_us in slowest[0:args.top]:
+                print(' ' * 4 + '{:<40} {:>8.1f} ms'.format(
+                    name, self_us / 1000))
+
+    if len(failed) > 0:
+        print('{} of {} scripts failed: {}'.format(
+            len(failed), len(scripts), ', '.join(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""Fast, verified and resumable copying of research data into a data tree
+
+Files are copied in parallel using kernel-side copies (os.copy_file_range or
+os.sendfile) where available. Every chunk is hashed while it is copied, and the
+destination is verified against this digest after the copy. Data are written
+to a temporary file (suffix .part) that is only renamed to the final name after
+successful verification.
+
+Each completed file is recorded in a journal (one JSON object per line), which
+is deleted once all files were transferred. If an import is interrupted, a
+subsequent run with the same journal skips all files that were already
+transferred, and only copies the missing ones. Moves are recorded before the
+source file is renamed or deleted, and target files that were written but not
+recorded yet are accepted if their digest matches the source file.
+"""
+import os
+import json
+import time
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+import ubg_data_toolbox.checks.tree as tree_check
+from ubg_data_toolbox.fixity import hash_file
+from ubg_data_toolbox.fixity import READ_BUFFER_SIZE
+from ubg_data_toolbox.fixity import get_read_buffer
+from ubg_data_toolbox import instrumentation
+
+# errors that indicate that a kernel-side copy is not supported for a given
+# combination of file systems/files
+_FALLBACK_ERRNOS = (
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF,
+    errno.ETXTBSY,
+)
+
+
+def _copy_chunks_kernel(fd_src, fd_dst, size, hasher, buffer_size, copy_fn):
+    """Copy a file using a kernel-side copy function and hash each chunk from
+    the (now hot) page cache"""
+    buf = get_read_buffer(buffer_size)
+    view = memoryview(buf)
+    offset = 0
+    while offset < size:
+        nr_copied = copy_fn(fd_src, fd_dst, min(buffer_size, size - offset),
+                            offset)
+        if nr_copied == 0:
+            break
+        nr_read = os.preadv(fd_src, [view[:nr_copied]], offset)
+        hasher.update(view[:nr_read])
+        offset += nr_copied
+    return offset
+
+
+def _copy_file_range(fd_src, fd_dst, count, offset):
+    return os.copy_file_range(fd_src, fd_dst, count, offset, offset)
+
+
+def _sendfile(fd_src, fd_dst, count, offset):
+    return os.sendfile(fd_dst, fd_src, offset, count)
+
+
+def _copy_chunks_userspace(fd_src, fd_dst, hasher, buffer_size):
+    """Plain read/write copy loop"""
+    buf = get_read_buffer(buffer_size)
+    view = memoryview(buf)
+    offset = 0
+    while True:
+        nr_read = os.readv(fd_src, [buf])
+        if nr_read == 0:
+            break
+        hasher.update(view[:nr_read])
+        written = 0
+        while written < nr_read:
+            written += os.write(fd_dst, view[written:nr_read])
+        offset += nr_read
+    return offset
+
+
+def copy_file(source, target, algorithm='sha256', verify=True,
+              buffer_size=READ_BUFFER_SIZE):
+    """Copy one file, hashing its content while copying
+
+    The data are written to target + '.part', which is renamed to target after
+    the copy (and the optional verification) succeeded.
+
+    Parameters
+    ----------
+    source : str
+        Source file
+    target : str
+        Target file
+    algorithm : str, optional
+        Hash algorithm (see ubg_data_toolbox.fixity.ALGORITHMS)
+    verify : bool, optional
+        If True, re-read the target file and compare its digest with the
+        digest of the source
+    buffer_size : int, optional
+        Chunk size in bytes
+
+    Returns
+    -------
+    digest : str
+        Hex digest of the copied content
+    nr_bytes : int
+        Number of bytes copied
+    """
+    partfile = target + '.part'
+    hasher = hashlib.new(algorithm)
+    fd_src = os.open(source, os.O_RDONLY)
+    try:
+        size = os.fstat(fd_src).st_size
+        fd_dst = os.open(partfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            nr_bytes = None
+            for name, copy_fn in (
+                    ('copy_file_range', _copy_file_range),
+                    ('sendfile', _sendfile)):
+                if not hasattr(os, name):
+                    continue
+                os.lseek(fd_dst, 0, os.SEEK_SET)
+                try:
+                    nr_bytes = _copy_chunks_kernel(
+                        fd_src, fd_dst, size, hasher, buffer_size, copy_fn)
+                    break
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                    # start over with the next method
+                    hasher = hashlib.new(algorithm)
+                    os.ftruncate(fd_dst, 0)
+            if nr_bytes is None:
+                os.lseek(fd_src, 0, os.SEEK_SET)
+                os.lseek(fd_dst, 0, os.SEEK_SET)
+                nr_bytes = _copy_chunks_userspace(
+                    fd_src, fd_dst, hasher, buffer_size)
+            if verify:
+                # make sure we verify the data on disk, not in the page cache
+                os.fsync(fd_dst)
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd_dst, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd_dst)
+    finally:
+        os.close(fd_src)
+
+    digest = hasher.hexdigest()
+    if verify:
+        digest_target, nr_target = hash_file(partfile, algorithm, buffer_size)
+        if digest_target != digest or nr_target != nr_bytes:
+            os.unlink(partfile)
+            raise IOError(
+                'Verification of copy failed: {} -> {}'.format(source, target)
+            )
+    shutil.copymode(source, partfile)
+    os.replace(partfile, target)
+    instrumentation.increment('bytes_copied', nr_bytes)
+    return digest, nr_bytes
+
+
+class import_journal(object):
+    """Record of all files already transferred during an import"""
+
+    def __init__(self, filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            Journal file. Existing entries are loaded and new entries are
+            appended to this file
+        """
+        self.filename = filename
+        # target path: entry
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._fid = None
+        if os.path.isfile(filename):
+            with open(filename, 'r') as fid:
+                for line in fid:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line of an interrupted run
+                        continue
+                    self.entries[entry['target']] = entry
+
+    def is_done(self, source, target):
+        """Check if a file was already transferred, and did not change
+        since"""
+        entry = self.entries.get(target)
+        if entry is None or not os.path.isfile(target):
+            return False
+        if os.stat(target).st_size != entry['size']:
+            return False
+        if entry.get('pending', False):
+            # a move was started: it completed if the source is gone
+            return not os.path.exists(source)
+        if entry['moved']:
+            # the source file does not exist anymore
+            return True
+        stat_src = os.stat(source)
+        return (stat_src.st_size == entry['size'] and
+                stat_src.st_mtime_ns == entry['mtime_ns'])
+
+    def record(self, source, target, stat_src, digest, moved,
+               pending=False):
+        """Record a transferred file. Moves are recorded (pending=True)
+        before the source is renamed or deleted, so that an interrupted move
+        can be recognized when resuming (see is_done)"""
+        entry = {
+            'source': source,
+            'target': target,
+            'size': stat_src.st_size,
+            'mtime_ns': stat_src.st_mtime_ns,
+            'digest': digest,
+            'moved': moved,
+        }
+        if pending:
+            entry['pending'] = True
+        with self._lock:
+            if self._fid is None:
+                os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+                self._fid = open(self.filename, 'a')
+            self._fid.write(json.dumps(entry) + '\n')
+            self._fid.flush()
+            self.entries[target] = entry
+
+    def close(self):
+        if self._fid is not None:
+            self._fid.close()
+            self._fid = None
+
+    def remove(self):
+        """Close and delete the journal file (after a completed import)"""
+        self.close()
+        if os.path.isfile(self.filename):
+            os.unlink(self.filename)
+        self.entries = {}
+
+
+def get_journal_filename(dir_to_m_dir):
+    """Return the journal file used for an import into a given measurement
+    directory
+
+    Journals are stored in .management/import_journals of the data root. If the
+    measurement directory is not located in a data tree, the journal is placed
+    in the measurement directory itself.
+    """
+    m_dir = os.path.abspath(dir_to_m_dir)
+    dr_root = find_data_root(m_dir)
+    if dr_root is None:
+        return m_dir + os.sep + '.import_journal'
+    name = os.path.relpath(m_dir, dr_root).replace(os.sep, '__')
+    return os.sep.join((
+        dr_root, '.management', 'import_journals', name + '.journal'))
+
+
+def plan_directory_transfer(source_dir, target_dir, act_on_files=True):
+    """Generate (source, target) file pairs required to transfer the content
+    of one directory into another one
+
+    Parameters
+    ----------
+    source_dir : str
+        Source directory
+    target_dir : str
+        Target directory
+    act_on_files : bool, optional
+        If True, transfer also the files located directly in source_dir.
+        Otherwise only subdirectories are transferred.
+
+    Returns
+    -------
+    jobs : list of (source, target) tuples
+    """
+    jobs = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        if root == source_dir and not act_on_files:
+            continue
+        rel = os.path.relpath(root, source_dir)
+        for filename in sorted(files):
+            jobs.append((
+                os.path.join(root, filename),
+                os.path.normpath(os.path.join(target_dir, rel, filename)),
+            ))
+    return jobs
+
+
+def plan_research_data_transfer(data_input, dir_to_m_dir):
+    """Generate (source, target) file pairs required to import research data
+    into a measurement directory
+
+    File(s): all files are transferred into dir_to_m_dir/RawData/
+
+    Directory: If the directory is a measurement directory, all of its
+    subdirectories are transferred into dir_to_m_dir (note that metadata.ini
+    files located directly in the directory will NOT be transferred).
+    Otherwise, the complete content is transferred into dir_to_m_dir/RawData/
+
+    Parameters
+    ----------
+    data_input : list of str
+        Input files, or one input directory
+    dir_to_m_dir : str
+        Measurement directory
+
+    Returns
+    -------
+    jobs : list of (source, target) tuples
+    source_dir : None|str
+        The input directory, None if files were provided
+    """
+    if len(data_input) > 1 or os.path.isfile(data_input[0]):
+        rawdata_dir = dir_to_m_dir + os.sep + 'RawData'
+        jobs = [
+            (filename, rawdata_dir + os.sep + os.path.basename(filename))
+            for filename in data_input
+        ]
+        return jobs, None
+
+    source_dir = data_input[0]
+    if not os.path.isdir(source_dir):
+        raise IOError('Input does not exist: {}'.format(source_dir))
+    if tree_check.is_measurement_directory(source_dir):
+        # transfer the subdirectories
+        jobs = plan_directory_transfer(
+            source_dir, dir_to_m_dir, act_on_files=False)
+    else:
+        print(
+            'Input is not a measurement directory. It will be ' +
+            'treated as a data directory and all contents will be ' +
+            'moved into the RawData/ subdirectory'
+        )
+        jobs = plan_directory_transfer(
+            source_dir,
+            dir_to_m_dir + os.sep + 'RawData',
+            act_on_files=True,
+        )
+    return jobs, source_dir
+
+
+def remove_empty_directories(directory):
+    """Remove empty directories below (and including) the given directory"""
+    for root, dirs, files in os.walk(directory, topdown=False):
+        try:
+            os.rmdir(root)
+        except OSError:
+            pass
+
+
+def _complete_copy_exists(source, target, algorithm, journal, move):
+    """Check if a target file that is not (or no longer) recorded in the
+    journal is a complete copy of the source, i.e., the transfer was
+    interrupted after the target file was written. If so, the transfer is
+    completed (the source is removed for moves) and recorded"""
+    if not os.path.isfile(source):
+        return False
+    stat_src = os.stat(source)
+    if os.stat(target).st_size != stat_src.st_size:
+        return False
+    digest_src, nr_src = hash_file(source, algorithm)
+    digest_target, nr_target = hash_file(target, algorithm)
+    if digest_src != digest_target:
+        return False
+    if move:
+        journal.record(source, target, stat_src, digest_src, move,
+                       pending=True)
+        os.unlink(source)
+    journal.record(source, target, stat_src, digest_src, move)
+    return True
+
+
+def transfer_files(jobs, journal=None, move=False, verify=True, workers=4,
+                   algorithm='sha256', verbose=True, logger=None):
+    """Copy or move files in parallel
+
+    Parameters
+    ----------
+    jobs : list of (source, target) tuples
+        Files to transfer. Target directories are created if required
+    journal : None|import_journal
+        If given, skip all files that were already transferred according to
+        the journal and record all completed transfers. The journal is
+        deleted once all files were transferred, so that it only persists
+        for interrupted transfers
+    move : bool, optional
+        If True, move files. Moves on the same file system are renames, moves
+        across file systems are verified copies followed by a deletion of the
+        source file
+    verify : bool, optional
+        If True, verify each copy by re-reading the target file
+    workers : int, optional
+        Number of files that are copied in parallel
+    algorithm : str, optional
+        Hash algorithm used for the verification
+    verbose : bool, optional
+        Print each transferred file
+    logger : None|logging.Logger
+
+    Returns
+    -------
+    report : dict
+        Number of transferred and skipped files, number of bytes copied and
+        the duration
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    time_start = time.time()
+    report = {
+        'transferred': 0,
+        'skipped': 0,
+        'bytes_copied': 0,
+    }
+    lock = threading.Lock()
+
+    pending = []
+    for source, target in jobs:
+        source = os.path.abspath(source)
+        target = os.path.abspath(target)
+        if journal is not None and journal.is_done(source, target):
+            report['skipped'] += 1
+            continue
+        if journal is not None and os.path.isfile(target) and \
+                _complete_copy_exists(
+                    source, target, algorithm, journal, move):
+            # transferred, but interrupted before it was recorded
+            report['skipped'] += 1
+            continue
+        assert not os.path.exists(target) or (
+            journal is not None and target in journal.entries), \
+            'target file exists ' + target
+        pending.append((source, target))
+
+    for target_dir in sorted(set(os.path.dirname(x[1]) for x in pending)):
+        os.makedirs(target_dir, exist_ok=True)
+
+    def _transfer(job):
+        source, target = job
+        stat_src = os.stat(source)
+        digest = None
+        nr_bytes = 0
+        if move and stat_src.st_dev == os.stat(
+                os.path.dirname(target)).st_dev:
+            if journal is not None:
+                journal.record(
+                    source, target, stat_src, digest, move, pending=True)
+            os.rename(source, target)
+        else:
+            digest, nr_bytes = copy_file(
+                source, target, algorithm=algorithm, verify=verify)
+            if move:
+                if journal is not None:
+                    journal.record(
+                        source, target, stat_src, digest, move, pending=True)
+                os.unlink(source)
+        if journal is not None:
+            journal.record(source, target, stat_src, digest, move)
+        with lock:
+            report['transferred'] += 1
+            report['bytes_copied'] += nr_bytes
+        if verbose:
+            print('{} {} to {}'.format(
+                'Moved' if move else 'Copied', source, target))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_transfer, pending))
+
+    if journal is not None:
+        # only reached if no transfer failed
+        journal.remove()
+    report['seconds'] = time.time() - time_start
+    logger.debug('transfer report: {}'.format(report))
+    return report
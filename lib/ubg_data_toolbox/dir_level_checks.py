@@ -5,7 +5,6 @@ See ubg_data_toolbox.dir_levels for usage
 Naming convention: check_[level abbreviation]_[short_description]
 """
 import os
-import datetime
 
 
 CHECK_OK = 0
@@ -70,29 +69,12 @@ def _check_metadata_datetime_is_correct_format(md):
         ('general', 'datetime_end'),
     ]
 
-    allowed_formats = (
-        '%Y%m%d',
-        '%Y%m%d_%H%M',
-        '%Y%m%d_%H%M_%S',
-    )
-    # import IPython
-    # IPython.embed()
+    # the allowed formats are defined by the data type of the entries
+    # (ubg_data_toolbox.md_types.DATETIME)
     all_good = True
     for (section, entry) in entries_to_check:
-        value = md[section][entry].value
-        if value is not None and value != '':
-            valid_conversion = False
-            for dt_format in allowed_formats:
-                try:
-                    datetime.datetime.strptime(
-                        md[section][entry].value,
-                        dt_format
-                    )
-                    valid_conversion = True
-                except ValueError:
-                    # print(e)
-                    # ignore the conversion error
-                    pass
+        if not md[section][entry].is_empty():
+            valid_conversion = md[section][entry].is_valid()
             all_good = all_good & valid_conversion
             if valid_conversion:
                 msg = 'OK: [{}][{}]\n'.format(section, entry)
@@ -104,6 +86,19 @@ def _check_metadata_datetime_is_correct_format(md):
     return all_good, error_msg
 
 
+def _check_electrode_positions(chain):
+    """Check shape and spacing of the electrode positions (if present)"""
+    from ubg_data_toolbox.electrode_positions import check_chain
+    problems = check_chain(chain)
+    if problems is None:
+        return True, ''
+    if len(problems) == 0:
+        return True, 'OK: [geoelectrics][electrode_positions]\n'
+    error_msg = 'FAIL: [geoelectrics][electrode_positions]: {}\n'.format(
+        '; '.join(problems))
+    return False, error_msg
+
+
 def check_m_metadata_contents(directory, id_handler):
     """Overall check for all metadata contents (i.e., correct date formats,
     etc)
@@ -116,6 +111,9 @@ def check_m_metadata_contents(directory, id_handler):
     # now call the subchecks
     check_result, error_msg = _check_metadata_datetime_is_correct_format(md)
     # place additional checks here
+    electrode_check, electrode_msg = _check_electrode_positions(chain)
+    check_result = check_result and electrode_check
+    error_msg += electrode_msg
 
     # for now just return this. When we get more checks, return values need to
     # be aggregated
@@ -130,6 +128,8 @@ def check_m_metadata_has_required_and_nonempty_entries(directory, id_handler):
     # be careful with importing at the beginning of the file: circular imports
     # possible!
     from ubg_data_toolbox.metadata import metadata_chain
+    from ubg_data_toolbox.metadata_definitions import \
+        get_missing_required_entries
     chain = metadata_chain(directory)
     md = chain.get_merged_metadata()
 
@@ -138,66 +138,15 @@ def check_m_metadata_has_required_and_nonempty_entries(directory, id_handler):
         error_msg += 'fully assess the presence of required fields!'
         return CHECK_NOT_OK, error_msg
 
-    # we have a survey type
-    survey_type = md['general']['survey_type'].value
-    assert survey_type in ['field', 'laboratory'], \
-        "metadata.ini: [general] survey_type must be 'field' or 'laboratory'"
-
-    # later we need to check if a given entry is required for this survey_type
-    check_key = 'required_{}'.format(
-        {
-            'field': 'field',
-            'laboratory': 'lab',
-        }[survey_type]
-    )
-
-    # import IPython
-    # IPython.embed()
-    # exit()
-
     error_msg = ''
     check_result = CHECK_OK
-    for section in md.keys():
-        for key, item in md[section].items():
-            # is this item required
-            if getattr(item, check_key):
-                # now check if there are conditions to be met
-                if getattr(item, 'conditions') is not None:
-                    conditions = item.conditions
-                    all_met = True
-                    # import IPython
-                    # IPython.embed()
-                    for cond_obj, condition in conditions.items():
-                        # check if this condition is met
-                        # test_value = getattr(item, cond_obj.name)
-                        if isinstance(condition, tuple):
-                            test_result = cond_obj.value in condition
-                        else:
-                            test_result = cond_obj.value == condition
-                        all_met = all_met & test_result
-                        # print('all_met', all_met)
-                    if not all_met:
-                        continue
-                # print('Checking required item', item, item.name, item.value)
-                # if .value is None, this means we do not have this entry in
-                # the metadata.ini file
-                if item.value is None:
-                    error_msg += ''.join((
-                        'Required entry [{}]-{} is missing\n'.format(
-                            section,
-                            key
-                        )
-                    ))
-                    check_result = CHECK_NOT_OK
-                # check if it is empty
-                elif item.value == '':
-                    error_msg += ''.join((
-                        'Required entry [{}]-{} is empty\n'.format(
-                            section,
-                            key
-                        )
-                    ))
-                    check_result = CHECK_NOT_OK
+    for section, key, reason in get_missing_required_entries(md):
+        error_msg += 'Required entry [{}]-{} is {}\n'.format(
+            section,
+            key,
+            reason
+        )
+        check_result = CHECK_NOT_OK
     if check_result == CHECK_OK:
         error_msg = 'ok'
     else:
@@ -0,0 +1,156 @@
+"""Resolve directory names to the levels of the directory structure
+
+The directory structure (ubg_data_toolbox.dirtree.tree) is compiled once
+into a transition table: a walker keeps a state (the level of the current
+directory and, for levels with conditional children, the value of the
+directory) and resolves the level of a subdirectory by a single dict lookup
+with the prefix of the subdirectory name:
+
+    (level, value, prefix) -> level of the subdirectory
+
+    >>> automaton = get_automaton()
+    >>> node, state = automaton.step(START_STATE, 'dr_data')
+    >>> node, state = automaton.step(state, 'tc_Hydrogeophysics')
+    >>> node.name
+    'theme_complex'
+    >>> [x.abbreviation for x in automaton.classify_path(
+    ...     'dr_data/tc_Hydro/t_field/s_Spiekeroog')[0]]
+    ['dr', 'tc', 't', 's']
+"""
+import os
+
+from ubg_data_toolbox.dirtree import tree
+
+# state of a walker before entering the data root directory
+START_STATE = (None, None)
+
+_automaton = None
+
+
+def split_directory_name(name):
+    """Split a directory name into prefix and value, e.g., m_01_20230415 into
+    ('m', '01_20230415'). Return (None, None) for names without prefix"""
+    index = name.find('_')
+    if index == -1:
+        return None, None
+    return name[0:index], name[index + 1:]
+
+
+class dirtree_automaton(object):
+    """Transition table of a directory structure
+
+    States are (node, value) tuples: node is the directory level of the
+    current directory, value the value of the directory (only for levels with
+    conditional children, None otherwise).
+    """
+    def __init__(self, root):
+        self.root = root
+        # (node, value, prefix): child node
+        self.transitions = {}
+        # state: allowed child nodes
+        self.children = {START_STATE: (root, )}
+        self.conditional_nodes = set()
+        self.nodes = []
+
+        self.transitions[START_STATE + (root.abbreviation, )] = root
+        self._compile(root)
+
+    def _compile(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        if len(node.conditional_children) > 0:
+            # normal children are ignored for levels with conditional
+            # children
+            self.conditional_nodes.add(node)
+            for value, child in node.conditional_children.items():
+                self.children[(node, value)] = (child, )
+                self.transitions[(node, value, child.abbreviation)] = child
+        else:
+            self.children[(node, None)] = tuple(node.children)
+            for child in node.children:
+                self.transitions[(node, None, child.abbreviation)] = child
+        for child in self.children.get((node, None), ()):
+            self._compile(child)
+        for child in node.conditional_children.values():
+            self._compile(child)
+
+    def get_state(self, node, value):
+        """Return the state of a walker in a directory of level node with the
+        given value"""
+        if node in self.conditional_nodes:
+            return (node, value)
+        return (node, None)
+
+    def get_allowed_children(self, state):
+        """Return the levels allowed for subdirectories of a directory with
+        the given state. Returns None if the value of a directory with
+        conditional children is not one of the allowed values"""
+        return self.children.get(state, None)
+
+    def step(self, state, name):
+        """Resolve the level of a subdirectory
+
+        Parameters
+        ----------
+        state : tuple
+            State of the parent directory (START_STATE for the data root)
+        name : str
+            Name of the subdirectory
+
+        Returns
+        -------
+        node : None|ubg_data_toolbox.dir_levels.directory_level
+            Level of the subdirectory, None if the name does not match any of
+            the allowed levels
+        state : None|tuple
+            State of the subdirectory
+        """
+        prefix, value = split_directory_name(name)
+        node = self.transitions.get((state[0], state[1], prefix), None)
+        if node is None:
+            return None, None
+        if node in self.conditional_nodes:
+            return node, (node, value)
+        return node, (node, None)
+
+    def classify_path(self, path):
+        """Resolve the levels of all directories of a path that starts with
+        the data root directory (e.g., dr_data/tc_Hydro/t_field)
+
+        Returns
+        -------
+        nodes : list
+            Levels of the directories. If a directory cannot be resolved, the
+            list ends with the last resolved level
+        state : None|tuple
+            State of the last directory, None if not all directories could be
+            resolved
+        """
+        nodes = []
+        state = START_STATE
+        for name in path.split(os.sep):
+            if name == '' or name == '.':
+                continue
+            node, state = self.step(state, name)
+            if node is None:
+                return nodes, None
+            nodes.append(node)
+        return nodes, state
+
+    def classify_directory(self, directory, dr_root):
+        """Resolve the levels of a directory within the data tree dr_root, see
+        classify_path"""
+        return self.classify_path(os.path.relpath(
+            os.path.abspath(directory),
+            os.path.dirname(os.path.abspath(dr_root)),
+        ))
+
+
+def get_automaton():
+    """Return the (compiled once) automaton of ubg_data_toolbox.dirtree.tree
+    """
+    global _automaton
+    if _automaton is None:
+        _automaton = dirtree_automaton(tree)
+    return _automaton
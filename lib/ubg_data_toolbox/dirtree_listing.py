@@ -0,0 +1,302 @@
+"""Check the structure of a data tree using a listing of its paths
+
+Walking a data tree on tape/HSM or remote storage can be very slow, while
+listings of its paths are cheap to produce. The following listing formats
+are recognized (from the first line of the listing):
+
+    paths       one path per line, e.g., the output of
+                find dr_data
+    typed       tab-separated type (d: directory, f: file), size, mtime and
+                path, e.g., the output of
+                find dr_data -printf '%y\\t%s\\t%T@\\t%p\\n'
+    rsync       the output of
+                rsync -r --list-only dr_data
+
+Paths are interpreted relative to the data root (the outermost directory
+starting with dr_), or, if no such directory is part of the paths, as
+relative to the data root itself.
+
+The listing is processed line by line. Only the directory levels of the
+directories above the measurement directories and the measurement directories
+themselves are kept in memory, so that listings with millions of files can
+be checked. For plain path listings, directories are only known as such if
+they contain at least one listed entry (i.e., empty directories cannot be
+checked); use typed or rsync listings to check them, too.
+
+The following problems are reported:
+
+    unknown_level     directory that does not match any of the allowed
+                      directory levels
+    invalid_branch    directory with an invalid value for a level with
+                      conditional children (e.g., t_fieldwork)
+    missing_metadata  measurement directory without metadata.ini
+"""
+import os
+import re
+
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import START_STATE
+
+# directories that can contain arbitrary content (see dm_check_dirtree)
+PASSIVE_DIRECTORIES = ('Documentation', )
+
+_rsync_line = re.compile(
+    r'^([dl\-])[rwxsStT\-]{9}\s+([\d,.]+)\s+'
+    r'(\d{4}/\d\d/\d\d \d\d:\d\d:\d\d) (.*)$'
+)
+
+# states of directories that are not checked
+_IGNORED = 'ignored'
+_INVALID = 'invalid'
+
+
+def detect_format(line):
+    """Return the format (paths, typed or rsync) of a listing, given its first
+    line"""
+    if _rsync_line.match(line) is not None:
+        return 'rsync'
+    fields = line.split('\t')
+    if len(fields) >= 4 and fields[0] in ('d', 'f', 'l'):
+        return 'typed'
+    return 'paths'
+
+
+def parse_line(line, listing_format):
+    """Parse one line of a listing
+
+    Returns
+    -------
+    path : str
+    is_dir : None|bool
+        True for directories, False for other entries, None if unknown
+        (paths listings). Paths ending with / are always directories
+    size : None|int
+    """
+    line = line.rstrip('\n')
+    if listing_format == 'typed':
+        entry_type, size, mtime, path = line.split('\t', 3)
+        return path, entry_type == 'd', int(size)
+    if listing_format == 'rsync':
+        match = _rsync_line.match(line)
+        if match is None:
+            return None, None, None
+        entry_type, size, mtime, path = match.groups()
+        if entry_type == 'l' and ' -> ' in path:
+            path = path.split(' -> ', 1)[0]
+        return path, entry_type == 'd', int(re.sub('[,.]', '', size))
+    if line.endswith('/'):
+        return line, True, None
+    return line, None, None
+
+
+class listing_checker(object):
+    """Check the paths of a listing, one path at a time (see feed)
+
+    Attributes
+    ----------
+    problems : list
+        (kind, path, message) of problems found by the last call to feed
+    stats : dict
+        Number of lines, directories, measurements, files and bytes
+    """
+    def __init__(self):
+        self.automaton = get_automaton()
+        # directory (relative to the data root, '' for the data root): state
+        self.states = {}
+        # measurement directory: metadata.ini found
+        self.measurements = {}
+        self.root_name = None
+        # path of the data root in the listing, e.g., /archive/dr_data
+        self.root_prefix = None
+        self._root_start = None
+        # last directory found to be within a measurement directory
+        self._last_ignored = None
+        self.problems = []
+        self.stats = dict.fromkeys((
+            'lines', 'directories', 'measurements', 'files', 'bytes',
+        ), 0)
+
+    def _split(self, path):
+        """Return the path relative to the data root, or None for paths
+        outside of the data root"""
+        # fast path: normalized path below the data root
+        if self._root_start is not None and \
+                path.startswith(self._root_start) and \
+                '//' not in path and '/.' not in path:
+            return path[len(self._root_start):].rstrip('/')
+
+        parts = [x for x in path.split('/') if x not in ('', '.')]
+        if self.root_prefix is None:
+            for nr, part in enumerate(parts):
+                if part.startswith('dr_'):
+                    self.root_name = part
+                    self.root_prefix = '/'.join(parts[0:nr + 1])
+                    self._root_start = path[0:path.find(part)] + part + '/'
+                    return '/'.join(parts[nr + 1:])
+            return '/'.join(parts)
+        path = '/'.join(parts)
+        if path == self.root_prefix:
+            return ''
+        if path.startswith(self.root_prefix + '/'):
+            return path[len(self.root_prefix) + 1:]
+        return None
+
+    def _get_state(self, relpath):
+        """Return the state of a directory, resolving (and checking) the
+        directory and its parents if required. Directories below the
+        measurement directories are not stored"""
+        state = self.states.get(relpath, None)
+        if state is not None:
+            return state
+
+        if relpath == '':
+            name = self.root_name if self.root_name is not None else 'dr_'
+            parent_state = START_STATE
+        else:
+            index = relpath.rfind('/')
+            parent = relpath[0:index] if index >= 0 else ''
+            name = relpath[index + 1:]
+            parent_state = self._get_state(parent)
+            if parent_state in (_IGNORED, _INVALID):
+                return parent_state
+            allowed = self.automaton.get_allowed_children(parent_state)
+            if allowed is not None and len(allowed) == 0:
+                # content of a measurement directory
+                return _IGNORED
+            if name in PASSIVE_DIRECTORIES or name.startswith('.'):
+                self.states[relpath] = _IGNORED
+                return _IGNORED
+
+        self.stats['directories'] += 1
+        node, state = self.automaton.step(parent_state, name)
+        if node is None:
+            self.problems.append((
+                'unknown_level',
+                relpath,
+                'allowed levels: {}'.format(', '.join(
+                    '{} ({})'.format(x.name, x.abbreviation)
+                    for x in self.automaton.get_allowed_children(
+                        parent_state)
+                )),
+            ))
+            self.states[relpath] = _INVALID
+            return _INVALID
+
+        allowed = self.automaton.get_allowed_children(state)
+        if allowed is None:
+            self.problems.append((
+                'invalid_branch',
+                relpath,
+                '"{}" is not one of the allowed values {}'.format(
+                    state[1], list(node.conditional_children.keys())),
+            ))
+            self.states[relpath] = _INVALID
+            return _INVALID
+        if len(allowed) == 0:
+            self.measurements.setdefault(relpath, False)
+            self.stats['measurements'] += 1
+        self.states[relpath] = state
+        return state
+
+    def feed(self, path, is_dir=None, size=None):
+        """Check one path of the listing
+
+        Parameters
+        ----------
+        path : str
+        is_dir : None|bool
+            True for directories, False for files, None if unknown
+        size : None|int
+            Size of files
+
+        Returns
+        -------
+        problems : list
+            (kind, path, message) of the problems found
+        """
+        self.problems = []
+        self.stats['lines'] += 1
+        relpath = self._split(path)
+        if relpath is None:
+            return self.problems
+        if is_dir:
+            self._get_state(relpath)
+            return self.problems
+
+        if relpath != '':
+            index = relpath.rfind('/')
+            parent = relpath[0:index] if index >= 0 else ''
+            # consecutive files of one directory within a measurement
+            # directory are not resolved again
+            if parent != self._last_ignored and \
+                    self._get_state(parent) == _IGNORED:
+                self._last_ignored = parent
+            if is_dir is False:
+                self.stats['files'] += 1
+                if size is not None:
+                    self.stats['bytes'] += size
+            if relpath[index + 1:] == 'metadata.ini' and \
+                    parent in self.measurements:
+                self.measurements[parent] = True
+        return self.problems
+
+    def finish(self):
+        """Return the problems that can only be determined after all paths
+        were read (measurement directories without metadata.ini)"""
+        return [
+            ('missing_metadata', relpath, 'no metadata.ini')
+            for relpath, found in sorted(self.measurements.items())
+            if not found
+        ]
+
+
+def check_listing(fid, checker=None):
+    """Check a listing, read line by line from an open file
+
+    Parameters
+    ----------
+    fid : file object
+    checker : None|listing_checker
+        Checker to use, e.g., to access its stats afterwards
+
+    Yields
+    ------
+    kind : str
+        Kind of the problem, see module documentation
+    path : str
+        Directory, relative to the data root
+    message : str
+    """
+    if checker is None:
+        checker = listing_checker()
+    listing_format = None
+    for line in fid:
+        if line.strip() == '':
+            continue
+        if listing_format is None:
+            listing_format = detect_format(line)
+        path, is_dir, size = parse_line(line, listing_format)
+        if path is None:
+            continue
+        yield from checker.feed(path, is_dir, size)
+    yield from checker.finish()
+
+
+def open_listing(filename):
+    """Open a listing file for reading (- for stdin, .gz files are
+    decompressed)"""
+    import sys
+    if filename == '-':
+        return sys.stdin
+    if filename.endswith('.gz'):
+        import gzip
+        return gzip.open(filename, 'rt', encoding='utf-8', errors='replace')
+    return open(filename, 'r', encoding='utf-8', errors='replace')
+
+
+def get_relative_path(relpath, root_name):
+    """Return a path for display, starting with the data root"""
+    root_name = root_name if root_name is not None else '.'
+    if relpath == '':
+        return root_name
+    return root_name + os.sep + relpath
@@ -1,6 +1,8 @@
 # navigate within a dirtree
 import os
 
+from ubg_data_toolbox import instrumentation
+
 
 def find_data_root(directory):
     """Given a relative or absolute directory path, try to find a directory
@@ -60,3 +62,30 @@ def get_dirtree_values(directory):
                 value = item[index + 1:]
                 presets[abbreviation] = value
     return presets
+
+
+def find_measurement_directories(start_dir):
+    """Find all measurement directories (m_*) that contain a metadata.ini file
+    below a given directory
+
+    Parameters
+    ----------
+    start_dir : str
+        Directory to start the search from
+
+    Yields
+    ------
+    m_dir : str
+        Path of a measurement directory. Paths are generated by joining
+        start_dir with the subdirectories, i.e., they are relative if start_dir
+        is relative.
+    """
+    for root, dirs, files in os.walk(start_dir):
+        instrumentation.increment('directories_visited')
+        # never descend into .management or other hidden directories
+        dirs[:] = sorted(x for x in dirs if not x.startswith('.'))
+        if os.path.basename(root).startswith('m_'):
+            if 'metadata.ini' in files:
+                yield root
+            # measurement directories cannot contain further measurements
+            dirs[:] = []
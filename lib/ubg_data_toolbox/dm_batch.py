@@ -0,0 +1,298 @@
+"""Non-interactive (batch) import of multiple measurements into a data tree
+
+The measurements to import are described in a manifest file, with one row per
+measurement. Two formats are supported:
+
+CSV (file ending .csv): The column "input" holds the input path(s) of the
+measurement (multiple files are separated by ";"). All other columns are
+metadata entries, named [section].[key]. An optional column "name" can be used
+to label the rows in the output. Empty cells are ignored. Example:
+
+    name,input,general.label,general.method,field.profile
+    first,data/m1.dat,20240610_01_p1,ERT,p_01
+    second,data/m2.dat;data/m2.log,20240610_02_p1,ERT,p_01
+
+INI (all other file endings): Each section describes one measurement. The key
+"input" holds the input path(s) (one per line), all other keys are metadata
+entries named [section].[key]. Example:
+
+    [first]
+    input = data/m1.dat
+    general.label = 20240610_01_p1
+    general.method = ERT
+
+Relative input paths are interpreted relative to the location of the
+manifest file.
+
+All rows are validated before any data is written: required metadata entries
+(see ubg_data_toolbox.metadata_definitions.get_missing_required_entries),
+allowed values, existence of inputs, and collisions of the target directories.
+"""
+import os
+import csv
+import logging
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.metadata_definitions import get_md_values
+from ubg_data_toolbox.metadata_definitions import md_entry
+from ubg_data_toolbox.metadata_definitions import get_missing_required_entries
+from ubg_data_toolbox.metadata import write_md_nested_dict_to_file
+from ubg_data_toolbox.dm_dirtree import plan_dirtrees
+from ubg_data_toolbox.dm_dirtree import PLAN_OK
+from ubg_data_toolbox.dm_dirtree import PLAN_DUPLICATE
+from ubg_data_toolbox.dm_dirtree import PLAN_EXISTS
+import ubg_data_toolbox.copy_engine as copy_engine
+
+
+def _split_key(column):
+    """Split a manifest column name [section].[key]"""
+    index = column.find('.')
+    if index <= 0:
+        raise ValueError(
+            'Metadata columns must be named [section].[key]: {}'.format(
+                column))
+    return column[0:index], column[index + 1:]
+
+
+def read_manifest(filename):
+    """Read a manifest file (CSV or INI)
+
+    Parameters
+    ----------
+    filename : str
+        Path to the manifest file
+
+    Returns
+    -------
+    rows : list of dicts
+        Each row is a dict with the keys 'name' (label of the row), 'input'
+        (list of input paths) and 'values' (dict with (section, key) tuples as
+        keys and the metadata values as values)
+    """
+    basedir = os.path.dirname(os.path.abspath(filename))
+    raw_rows = []
+    if filename.lower().endswith('.csv'):
+        with open(filename, 'r', newline='') as fid:
+            reader = csv.DictReader(fid)
+            for nr, line in enumerate(reader):
+                name = line.pop('name', None) or 'row {}'.format(nr + 1)
+                inputs = (line.pop('input', None) or '').split(';')
+                raw_rows.append((name, inputs, line))
+    else:
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(filename)
+        for section in config.sections():
+            line = dict(config[section].items())
+            inputs = (line.pop('input', None) or '').split('\n')
+            raw_rows.append((section, inputs, line))
+
+    rows = []
+    for name, inputs, line in raw_rows:
+        values = {}
+        for column, value in line.items():
+            if value is None or value.strip() == '':
+                continue
+            values[_split_key(column)] = value.strip()
+        rows.append({
+            'name': name,
+            'input': [
+                os.path.normpath(os.path.join(basedir, x.strip()))
+                for x in inputs if x.strip() != ''
+            ],
+            'values': values,
+        })
+    return rows
+
+
+def build_metadata(values, defaults=None):
+    """Generate the metadata of one row
+
+    Parameters
+    ----------
+    values : dict
+        (section, key): value pairs of the row
+    defaults : None|dict
+        Nested metadata dict (e.g., from the configuration file) with default
+        values that are overwritten by the values of the row
+
+    Returns
+    -------
+    md : ubg_data_toolbox.metadata_definitions.metadata_tree
+    """
+    md = get_md_values()
+
+    def _set(section, name, value):
+        if section not in md:
+            md[section] = {}
+        if name in md[section]:
+            md[section][name].value = value
+        else:
+            md[section][name] = md_entry(
+                name=name,
+                value=value,
+                is_extra=True,
+            )
+
+    if defaults is not None:
+        for section in defaults.keys():
+            for name, item in defaults[section].items():
+                if item.value is not None:
+                    _set(section, name, item.value)
+    for (section, name), value in values.items():
+        _set(section, name, value)
+    return md
+
+
+def validate_rows(rows, tree, defaults=None, resume=False):
+    """Validate all rows and compute their target directories
+
+    Parameters
+    ----------
+    rows : list of dicts
+        Rows as returned by read_manifest
+    tree : str
+        Path to the data tree (dr_ directory)
+    defaults : None|dict
+        Default metadata, see build_metadata
+    resume : bool, optional
+        If True, existing target directories are allowed (resuming an
+        interrupted import)
+
+    Returns
+    -------
+    rows : list of dicts
+        The input rows, amended by the keys 'metadata', 'target' and 'errors'
+        (list of error messages, empty for valid rows)
+    """
+    # directory paths of all rows, computed at once from the flat values
+    flat_defaults = {}
+    if defaults is not None:
+        for section in defaults.keys():
+            for name, item in defaults[section].items():
+                if item.value is not None:
+                    flat_defaults[section + '.' + name] = item.value
+    records = []
+    for row in rows:
+        record = dict(flat_defaults)
+        for (section, name), value in row['values'].items():
+            record[section + '.' + name] = value
+        records.append(record)
+    plan = plan_dirtrees(records, dr_root=tree)
+    first_names = {}
+    for nr, path in enumerate(plan['path']):
+        if plan['status'].iat[nr] in (PLAN_OK, PLAN_EXISTS):
+            first_names.setdefault(path, rows[nr]['name'])
+
+    for nr, row in enumerate(rows):
+        errors = []
+        if len(row['input']) == 0:
+            errors.append('no input given')
+        for item in row['input']:
+            if not os.path.exists(item):
+                errors.append('input does not exist: {}'.format(item))
+        if len(row['input']) > 1 and not all(
+                os.path.isfile(x) for x in row['input']):
+            errors.append('only one directory is allowed as input')
+
+        md = build_metadata(row['values'], defaults)
+        row['metadata'] = md
+        row['target'] = None
+
+        for section in md.keys():
+            for name, item in md[section].items():
+                if item.allowed_values is not None and \
+                        item.value is not None and \
+                        item.value not in item.allowed_values:
+                    errors.append(
+                        '[{}] {}: "{}" is not one of {}'.format(
+                            section, name, item.value, item.allowed_values)
+                    )
+
+        if md['general']['survey_type'].value in ('field', 'laboratory'):
+            for section, key, reason in get_missing_required_entries(md):
+                errors.append('required entry [{}] {} is {}'.format(
+                    section, key, reason))
+
+            status = plan['status'].iat[nr]
+            path = plan['path'].iat[nr]
+            target = None
+            if path is not None:
+                target = os.path.abspath(tree + os.sep + path)
+            if status == PLAN_DUPLICATE:
+                errors.append(
+                    'same target directory as "{}": {}'.format(
+                        first_names[path], target))
+            elif status == PLAN_EXISTS and not resume:
+                errors.append(
+                    'target directory already exists: {}'.format(target))
+            elif status not in (PLAN_OK, PLAN_EXISTS):
+                errors.append('incomplete directory path: {} ({})'.format(
+                    target, plan['message'].iat[nr]))
+            else:
+                row['target'] = target
+        elif md['general']['survey_type'].value is None:
+            errors.append('required entry [general] survey_type is missing')
+
+        row['errors'] = errors
+    return rows
+
+
+def ingest_rows(rows, move=False, verify=True, workers=4, logger=None):
+    """Import all (validated) rows into the data tree
+
+    Measurements are imported in parallel. For each row, the measurement
+    directory is created, the metadata.ini file is written and the data are
+    transferred using ubg_data_toolbox.copy_engine (including journals that
+    allow resuming an interrupted import).
+
+    Parameters
+    ----------
+    rows : list of dicts
+        Rows as returned by validate_rows. All rows must be free of errors
+    move : bool, optional
+        If True, move the input data instead of copying it
+    verify : bool, optional
+        If True, verify each copy using checksums
+    workers : int, optional
+        Number of measurements imported in parallel
+    logger : None|logging.Logger
+
+    Returns
+    -------
+    reports : list of dicts
+        Transfer report for each row (see copy_engine.transfer_files)
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    assert all(len(row['errors']) == 0 for row in rows), \
+        'Only valid rows can be imported'
+
+    def _ingest(row):
+        target = row['target']
+        os.makedirs(target, exist_ok=True)
+        write_md_nested_dict_to_file(
+            row['metadata'],
+            target + os.sep + 'metadata.ini'
+        )
+        jobs, source_dir = copy_engine.plan_research_data_transfer(
+            row['input'], target)
+        report = copy_engine.transfer_files(
+            jobs,
+            journal=copy_engine.import_journal(
+                copy_engine.get_journal_filename(target)),
+            move=move,
+            verify=verify,
+            workers=1,
+            verbose=False,
+            logger=logger,
+        )
+        if move and source_dir is not None:
+            copy_engine.remove_empty_directories(source_dir)
+        logger.info('Imported "{}" into {} ({} files)'.format(
+            row['name'], target, report['transferred']))
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reports = list(executor.map(_ingest, rows))
+    return reports
@@ -1,40 +1,143 @@
 import os
 import json
+import time
+import atexit
+import threading
+
+from ubg_data_toolbox.dm_file_utils import file_lock
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
 
 
 class md_cache_default_values(object):
     """
     A cache object for default values. This is basically a key-value storage
+
+    For each key, a bounded history of the most recently used values is kept.
+    The most recent value is used as the default value (see .get).
+
+    If a filename is given, changes are persisted in a write-behind fashion:
+    .set only marks the key as changed, and the file is written after
+    flush_interval seconds, or at program exit at the latest. Writes take a
+    file lock, merge the histories with the current content of the file (to
+    retain updates of concurrent sessions) and atomically replace the file.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, max_history=10, flush_interval=2.0):
+        """
+        Parameters
+        ----------
+        filename : None|str
+            Cache file. If None, the cache only exists in memory
+        max_history : int, optional
+            Number of values retained for each key
+        flush_interval : float, optional
+            Seconds after which changes are written to disk
+        """
+        # key: current default value
         self.cache = {}
+        # key: [[value, timestamp], ...], most recently used first
+        self.history = {}
         self.filename = filename
+        self.max_history = max_history
+        self.flush_interval = flush_interval
+
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.Lock()
 
         if self.filename is not None and os.path.isfile(self.filename):
             self.load_cache()
+        if self.filename is not None:
+            atexit.register(self.flush)
 
-    def load_cache(self):
+    @staticmethod
+    def _read_history(filename):
+        """Read the history stored in a cache file. Old cache files only
+        contain one value per key and are converted on the fly"""
         try:
-            with open(self.filename, 'r') as fid:
-                self.cache = json.load(fid)
-        except json.JSONDecodeError:
-            pass
+            with open(filename, 'r') as fid:
+                data = json.load(fid)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+        if data.get('version', None) == 2:
+            return data['history']
+        # old format: key: value
+        return {
+            key: [[value, 0]] for key, value in data.items()
+            if isinstance(value, str)
+        }
+
+    def _merge_histories(self, first, second):
+        """Merge two value histories of one key, retaining the latest use of
+        each value"""
+        latest = {}
+        for value, timestamp in first + second:
+            if timestamp >= latest.get(value, -1):
+                latest[value] = timestamp
+        merged = sorted(
+            ([value, ts] for value, ts in latest.items()),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+        return merged[0:self.max_history]
+
+    def load_cache(self):
+        with file_lock(self.filename, shared=True):
+            self.history = self._read_history(self.filename)
+        for key, values in self.history.items():
+            if len(values) > 0:
+                self.cache[key] = values[0][0]
 
     def save_cache(self):
+        """Write all changed keys to the cache file"""
         if self.filename is None:
             return
-        with open(self.filename, 'w') as fid:
-            json.dump(self.cache, fid)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            dirty = self._dirty
+            self._dirty = set()
+            with file_lock(self.filename):
+                on_disk = self._read_history(self.filename)
+                for key in dirty:
+                    on_disk[key] = self._merge_histories(
+                        self.history.get(key, []), on_disk.get(key, []))
+                # pick up changes of other sessions
+                self.history.update(on_disk)
+                atomic_write_json(
+                    self.filename,
+                    {'version': 2, 'history': on_disk},
+                )
+
+    def flush(self):
+        """Write pending changes to disk, if there are any"""
+        if len(self._dirty) > 0:
+            self.save_cache()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
 
-        # import IPython
-        # IPython.embed()
     def get(self, key):
         """Get the item associated with a given key"""
         return self.cache.get(key, '')
 
+    def get_history(self, key):
+        """Return the most recently used values of a key, most recent first"""
+        return [value for value, timestamp in self.history.get(key, [])]
+
     def set(self, key, value):
-        self.cache[key] = value
-        self.save_cache()
+        with self._lock:
+            self.cache[key] = value
+            self.history[key] = self._merge_histories(
+                [[value, time.time()]], self.history.get(key, []))
+            if self.filename is None:
+                return
+            self._dirty.add(key)
+        self._schedule_flush()
 
     def __str__(self):
         out_str = '<red>' + 80 * '=' + '</red>\n'
@@ -0,0 +1,337 @@
+"""Options shared by all console scripts
+
+The main() functions of all scripts in src/ are decorated with
+script_main, which handles the following options before the script parses
+its own command line arguments:
+
+    --profile[=FILE]
+        Run the script under cProfile, write the statistics to FILE (default:
+        [script]_[date].pstats) and print the functions with the highest
+        cumulative run times. The statistics can be analysed further, e.g.,
+        with "python -m pstats FILE" or snakeviz.
+
+    --profile-sampling[=FILE]
+        Low-overhead statistical profiling for long runs: the stack of the
+        main thread is sampled in regular intervals (see SAMPLING_INTERVAL).
+        The collapsed stacks are written to FILE (default:
+        [script]_[date].collapsed, usable with flamegraph.pl or speedscope),
+        and the functions with the most samples are printed.
+
+    --stats[=FILE]
+        The counters and per-phase timings of the run (see
+        ubg_data_toolbox.instrumentation) are logged (logging module, logger
+        ubg_data_toolbox.dm_cli) at the end of every run, at level DEBUG.
+        With --stats, the report is logged at level INFO and shown even if
+        logging is not configured. If FILE is given, the report is also
+        written to FILE as JSON. No report is made if the script exits while
+        parsing its arguments (e.g., --help or usage errors).
+
+Example:
+
+    $ dm_check_dirtree --profile
+    $ dm_check_dirtree --profile=check.pstats -t dr_data
+    $ dm_check_dirtree --stats=check_stats.json
+
+Since the options are removed from the command line before the script parses
+it, values must be given as --option=FILE (not --option FILE). The options
+are listed in the --help output of the scripts that use the argparse parent
+parser returned by get_common_options().
+"""
+import os
+import sys
+import time
+import logging
+import datetime
+import functools
+import threading
+
+from ubg_data_toolbox import instrumentation
+
+# interval between two samples of --profile-sampling, seconds
+SAMPLING_INTERVAL = 0.005
+# number of functions printed after profiling
+NR_HOTSPOTS = 25
+
+
+def _extract_option(argv, name):
+    """Remove an option of the form --name or --name=value from argv
+
+    Returns
+    -------
+    present : bool
+        True if the option was given
+    value : None|str
+        Value of the option, if given using --name=value
+    argv : list
+        Remaining arguments
+    """
+    present = False
+    value = None
+    remaining = []
+    for nr, item in enumerate(argv):
+        if item == '--':
+            # everything after -- belongs to the script
+            remaining += argv[nr:]
+            break
+        if item == name:
+            present = True
+        elif item.startswith(name + '='):
+            present = True
+            value = item[len(name) + 1:]
+        else:
+            remaining.append(item)
+    return present, value, remaining
+
+
+def get_common_options():
+    """Return an argparse parser (without -h) that documents the options
+    handled by script_main, to be used as parent parser of the scripts:
+
+        parser = argparse.ArgumentParser(parents=[get_common_options()])
+
+    The options never reach the parser of the script (see script_main), they
+    are only listed in its --help output.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group(
+        'profiling and statistics',
+        'Values must be given as --option=FILE',
+    )
+    group.add_argument(
+        '--profile',
+        help='Run under cProfile, write the statistics to FILE (default: ' +
+        '[script]_[date].pstats) and print the hotspots',
+        nargs='?',
+        metavar='FILE',
+        dest='_profile',
+        default=argparse.SUPPRESS,
+    )
+    group.add_argument(
+        '--profile-sampling',
+        help='Low-overhead sampling profile of long runs, write the ' +
+        'collapsed stacks to FILE (default: [script]_[date].collapsed) ' +
+        'and print the hotspots',
+        nargs='?',
+        metavar='FILE',
+        dest='_profile_sampling',
+        default=argparse.SUPPRESS,
+    )
+    group.add_argument(
+        '--stats',
+        help='Always print the counters and phase timings of the run, and ' +
+        'write them to FILE as JSON, if given',
+        nargs='?',
+        metavar='FILE',
+        dest='_stats',
+        default=argparse.SUPPRESS,
+    )
+    return parser
+
+
+def _default_filename(script_name, suffix):
+    return '{}_{}.{}'.format(
+        script_name,
+        datetime.datetime.now().strftime('%Y%m%d_%H%M%S'),
+        suffix,
+    )
+
+
+def _run_with_cprofile(function, filename, args, kwargs):
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(filename)
+        sys.stderr.write('\n' + '=' * 80 + '\n')
+        sys.stderr.write('Profile written to {}\n'.format(filename))
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(NR_HOTSPOTS)
+
+
+class stack_sampler(object):
+    """Sample the stack of a thread in regular intervals
+
+    The samples are stored as collapsed stacks (one string per stack, frames
+    separated by ";", outermost frame first) and their counts.
+    """
+    def __init__(self, thread_id, interval=SAMPLING_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.nr_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return '{}:{}:{}'.format(
+            os.path.basename(code.co_filename),
+            code.co_name,
+            code.co_firstlineno,
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id, None)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.nr_samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, filename):
+        with open(filename, 'w') as fid:
+            for stack, count in sorted(self.stacks.items()):
+                fid.write('{} {}\n'.format(stack, count))
+
+    def get_hotspots(self):
+        """Return a list of (function, inclusive samples, self samples),
+        sorted by inclusive samples"""
+        inclusive = {}
+        exclusive = {}
+        for stack, count in self.stacks.items():
+            names = stack.split(';')
+            # recursive functions are only counted once per stack
+            for name in set(names):
+                inclusive[name] = inclusive.get(name, 0) + count
+            exclusive[names[-1]] = exclusive.get(names[-1], 0) + count
+        return sorted(
+            ((x, inclusive[x], exclusive.get(x, 0)) for x in inclusive),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+
+
+def _run_with_sampling(function, filename, args, kwargs):
+    sampler = stack_sampler(threading.get_ident())
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sampler.stop()
+        duration = time.perf_counter() - start
+        sampler.write_collapsed(filename)
+        total = max(sampler.nr_samples, 1)
+        sys.stderr.write('\n' + '=' * 80 + '\n')
+        sys.stderr.write(
+            'Sampling profile written to {} ({} samples in {:.1f} s)\n'
+            .format(filename, sampler.nr_samples, duration))
+        sys.stderr.write('{:>8} {:>8}  {}\n'.format(
+            'total%', 'self%', 'function'))
+        for name, nr_inclusive, nr_self in \
+                sampler.get_hotspots()[0:NR_HOTSPOTS]:
+            sys.stderr.write('{:>8.1f} {:>8.1f}  {}\n'.format(
+                100 * nr_inclusive / total, 100 * nr_self / total, name))
+
+
+def _is_argparse_exit(exception):
+    """Return True if a SystemExit was raised while parsing the command line
+    arguments (--help, usage errors)"""
+    argparse = sys.modules.get('argparse', None)
+    if argparse is None:
+        return False
+    traceback = exception.__traceback__
+    while traceback is not None:
+        if traceback.tb_frame.f_code.co_filename == argparse.__file__:
+            return True
+        traceback = traceback.tb_next
+    return False
+
+
+def _report_stats(script_name, show, filename, duration):
+    """Log the instrumentation report (level DEBUG). If show is True, log at
+    level INFO and make sure that the report is shown on stderr, even if
+    logging is not configured"""
+    logger = logging.getLogger(__name__)
+    handler = None
+    level = logger.level
+    report_level = logging.DEBUG
+    if show:
+        if not logger.hasHandlers():
+            handler = logging.StreamHandler(sys.stderr)
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        report_level = logging.INFO
+    try:
+        logger.log(report_level, 'Statistics of {} ({:.3f} s)\n{}'.format(
+            script_name, duration, instrumentation.format_report()))
+        if filename is not None:
+            instrumentation.write_report(filename, extra={
+                'script': script_name,
+                'argv': sys.argv[1:],
+                'timestamp': datetime.datetime.now().isoformat(),
+                'seconds': duration,
+            })
+            logger.log(
+                report_level, 'Statistics written to {}'.format(filename))
+    finally:
+        logger.setLevel(level)
+        if handler is not None:
+            logger.removeHandler(handler)
+
+
+def script_main(function):
+    """Decorator for the main() functions of the console scripts, which
+    handles the options described in the module documentation"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        script_name = os.path.basename(sys.argv[0])
+        if script_name.endswith('.py'):
+            script_name = script_name[0:-3]
+
+        profile, profile_file, argv = _extract_option(
+            sys.argv[1:], '--profile')
+        sampling, sampling_file, argv = _extract_option(
+            argv, '--profile-sampling')
+        stats, stats_file, argv = _extract_option(argv, '--stats')
+        sys.argv[1:] = argv
+
+        def run():
+            if sampling:
+                filename = sampling_file
+                if filename is None:
+                    filename = _default_filename(script_name, 'collapsed')
+                return _run_with_sampling(function, filename, args, kwargs)
+            if profile:
+                filename = profile_file
+                if filename is None:
+                    filename = _default_filename(script_name, 'pstats')
+                return _run_with_cprofile(function, filename, args, kwargs)
+            return function(*args, **kwargs)
+
+        instrumentation.reset()
+        start = time.perf_counter()
+        try:
+            result = run()
+        except SystemExit as e:
+            if not _is_argparse_exit(e):
+                _report_stats(script_name, stats, stats_file,
+                              time.perf_counter() - start)
+            raise
+        except BaseException:
+            _report_stats(
+                script_name, stats, stats_file, time.perf_counter() - start)
+            raise
+        _report_stats(
+            script_name, stats, stats_file, time.perf_counter() - start)
+        return result
+
+    return wrapper
@@ -80,7 +80,7 @@ def get_configuration(get_default_metadata=False, create_if_required=False):
     get_default_metadata : bool, optional
         If True, also import metadata from config files. This basically imports
         the config file into a configparser object and ignores the "settings"
-        section
+        and "federation" (see ubg_data_toolbox.federation) sections
     create_if_required : bool, optional
         If True, create a configuration file in
         $HOME/.data_toolbox/ub_geoph_dm.cfg for further use
@@ -102,7 +102,7 @@ def get_configuration(get_default_metadata=False, create_if_required=False):
             mgr = metadata_manager(None)
             metadata = mgr.import_metadata_files_to_md_dict(
                 config_raw,
-                ignore_sections=['settings', ]
+                ignore_sections=['settings', 'federation']
             )
     else:
         # we did not find a suitable configuration file
@@ -4,11 +4,11 @@
 import os
 
 from ubg_data_toolbox.dirtree_nav import find_data_root
-from ubg_data_toolbox.dirtree_nav import get_dirtree_values
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import split_directory_name
 from ubg_data_toolbox.dirtree import tree
-from ubg_data_toolbox.metadata_definitions import metadata_tree
 from ubg_data_toolbox.metadata_definitions import get_empty_metadata_tree
-import ubg_data_toolbox.dir_levels
+from ubg_data_toolbox.metadata_definitions import get_md_values
 
 
 def _dirtree_next_level(node, md_entries, override_name=None):
@@ -84,6 +84,201 @@ def gen_dirtree_from_metadata(
     return dirtree
 
 
+# status values of plan_dirtrees
+PLAN_OK = 'ok'
+PLAN_MISSING = 'missing'
+PLAN_INVALID_BRANCH = 'invalid_branch'
+PLAN_INVALID_VALUE = 'invalid_value'
+PLAN_DUPLICATE = 'duplicate'
+PLAN_EXISTS = 'exists'
+
+
+def get_dirtree_branches(node=tree, conditions=()):
+    """Return the sequences of directory levels used by
+    gen_dirtree_from_metadata, one per conditional branch of the tree
+
+    At each level, gen_dirtree_from_metadata either follows the conditional
+    child selected by the value of the level or the first normal child.
+    Therefore, for each combination of conditional values, the levels of a
+    directory path form one linear sequence.
+
+    Returns
+    -------
+    branches : list
+        (conditions, levels) tuples. conditions is a tuple of (level, value)
+        pairs, levels the list of directory levels, starting with node
+    """
+    if len(node.conditional_children) > 0:
+        branches = []
+        for value, child in node.conditional_children.items():
+            for sub_conditions, levels in get_dirtree_branches(
+                    child, conditions + ((node, value), )):
+                branches.append((sub_conditions, [node] + levels))
+        return branches
+    if len(node.children) > 0:
+        return [
+            (sub_conditions, [node] + levels)
+            for sub_conditions, levels in get_dirtree_branches(
+                node.children[0], conditions)
+        ]
+    return [(conditions, [node])]
+
+
+def plan_dirtrees(records, dr_root=None):
+    """Compute the directory paths of many measurements at once
+
+    This is the batch version of gen_dirtree_from_metadata: instead of
+    building a metadata tree for each measurement, each directory level of
+    each branch of the tree is processed once for all measurements (column
+    operations).
+
+    Parameters
+    ----------
+    records : pandas.DataFrame|list of dicts
+        One row per measurement, with metadata columns named [section].[key]
+        (e.g., general.survey_type). Missing columns and empty values are
+        treated as not set.
+    dr_root : None|str, optional
+        If given, planned paths that already exist in this data tree are
+        flagged
+
+    Returns
+    -------
+    plan : pandas.DataFrame
+        Same index as records, with the columns:
+
+        path : directory path relative to the data root. For rows with
+            missing required levels, the path up to the first missing level.
+            None for invalid branches and values.
+        branch : value of the conditional level (e.g., field, laboratory)
+        status : one of PLAN_OK, PLAN_MISSING (required level not set),
+            PLAN_INVALID_BRANCH (conditional level without a valid value),
+            PLAN_INVALID_VALUE (value contains a path separator),
+            PLAN_DUPLICATE (same path as a previous row), PLAN_EXISTS
+            (directory already present in dr_root)
+        message : description of the problem, empty for valid rows
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(records, pd.DataFrame):
+        data = records
+    else:
+        data = pd.DataFrame.from_records(list(records))
+    nr_rows = len(data)
+    md_entries = get_md_values()
+
+    columns = {}
+
+    def _get_column(md_mapping):
+        name = '.'.join(md_mapping)
+        if name not in columns:
+            values = np.full(nr_rows, None, dtype=object)
+            if name in data.columns:
+                raw = data[name].to_numpy(dtype=object)
+                is_set = np.array([
+                    isinstance(x, str) and x.strip() != '' for x in raw
+                ], dtype=bool)
+                values[is_set] = [x.strip() for x in raw[is_set]]
+            columns[name] = values
+        return columns[name]
+
+    paths = np.full(nr_rows, '', dtype=object)
+    branches = np.full(nr_rows, None, dtype=object)
+    status = np.full(nr_rows, PLAN_INVALID_BRANCH, dtype=object)
+    messages = np.full(nr_rows, '', dtype=object)
+
+    for conditions, levels in get_dirtree_branches():
+        selected = np.ones(nr_rows, dtype=bool)
+        for node, value in conditions:
+            selected &= _get_column(node.md_mapping) == value
+        if not selected.any():
+            continue
+        if len(conditions) > 0:
+            branches[selected] = conditions[-1][1]
+        status[selected] = PLAN_OK
+        # the data root is not part of the relative path
+        for node in levels[1:]:
+            section, key = node.md_mapping
+            entry = md_entries[section][key]
+            values = _get_column(node.md_mapping)
+            active = selected & (status == PLAN_OK)
+            is_set = active & (values != None)  # noqa: E711
+            if entry.required_lab or entry.required_field:
+                missing = active & ~is_set
+                status[missing] = PLAN_MISSING
+                messages[missing] = \
+                    'required directory level {} ([{}] {}) is not set'.format(
+                        node.name, section, key)
+            invalid = is_set & np.array([
+                os.sep in x if x is not None else False for x in values
+            ], dtype=bool)
+            status[invalid] = PLAN_INVALID_VALUE
+            messages[invalid] = 'invalid value for [{}] {}'.format(
+                section, key)
+            is_set &= ~invalid
+            paths[is_set] = paths[is_set] + (
+                os.sep + node.abbreviation + '_') + values[is_set]
+
+    # report the first conditional level without a valid value
+    conditional_nodes = []
+    for conditions, levels in get_dirtree_branches():
+        for node, value in conditions:
+            if node not in conditional_nodes:
+                conditional_nodes.append(node)
+    for node in conditional_nodes:
+        node_values = _get_column(node.md_mapping)
+        for nr in np.where(
+                (status == PLAN_INVALID_BRANCH) & (messages == ''))[0]:
+            if node_values[nr] not in node.conditional_children:
+                messages[nr] = '[{}] {}: "{}" is not one of {}'.format(
+                    node.md_mapping[0], node.md_mapping[1], node_values[nr],
+                    list(node.conditional_children.keys()))
+    paths = np.array([x[1:] for x in paths], dtype=object)
+    paths[(status == PLAN_INVALID_BRANCH) | (status == PLAN_INVALID_VALUE)] \
+        = None
+
+    plan = pd.DataFrame({
+        'path': pd.Series(paths, dtype=object, index=data.index),
+        'branch': pd.Series(branches, dtype=object, index=data.index),
+        'status': pd.Series(status, dtype=object, index=data.index),
+        'message': pd.Series(messages, dtype=object, index=data.index),
+    })
+
+    # collisions between rows
+    valid = plan['status'] == PLAN_OK
+    duplicates = valid & plan['path'].duplicated(keep='first')
+    if duplicates.any():
+        first_rows = {}
+        for index, path in plan.loc[valid, 'path'].items():
+            first_rows.setdefault(path, index)
+        plan.loc[duplicates, 'status'] = PLAN_DUPLICATE
+        plan.loc[duplicates, 'message'] = [
+            'same path as row {}'.format(first_rows[x])
+            for x in plan.loc[duplicates, 'path']
+        ]
+
+    # collisions with existing directories: each parent directory is listed
+    # once
+    if dr_root is not None:
+        listings = {}
+        exists = np.zeros(nr_rows, dtype=bool)
+        for nr, path in enumerate(plan['path'].to_numpy()):
+            if plan['status'].iat[nr] != PLAN_OK:
+                continue
+            parent, name = os.path.split(path)
+            if parent not in listings:
+                try:
+                    listings[parent] = set(
+                        os.listdir(dr_root + os.sep + parent))
+                except FileNotFoundError:
+                    listings[parent] = set()
+            exists[nr] = name in listings[parent]
+        plan.loc[exists, 'status'] = PLAN_EXISTS
+        plan.loc[exists, 'message'] = 'directory already exists'
+    return plan
+
+
 def check_mdir_is_proper(mdir):
     """Check that a given directory path points to a valid measurement
     directory
@@ -123,29 +318,12 @@ def gen_metadata_from_mdir(mdir, metadata=None):
         # get an empty metadata tree
         metadata = get_empty_metadata_tree()
 
-    presets = get_dirtree_values('.')
-
-    def update_md(
-            metadata: metadata_tree,
-            node: ubg_data_toolbox.dir_levels.directory_level,
-            presets: dict):
-
-        if node.abbreviation not in presets:
-            return
-        value = presets[node.abbreviation]
-        presets.pop(node.abbreviation)
-
+    # resolve the directory levels of all parts of the path
+    dr_root = find_data_root(mdir_full)
+    relpath = os.path.relpath(mdir_full, os.path.dirname(dr_root))
+    nodes, state = get_automaton().classify_path(relpath)
+    for node, part in zip(nodes, relpath.split(os.sep)):
         if node.md_mapping is not None:
             category, key = node.md_mapping
-            metadata[category][key].value = value
-
-        if len(node.conditional_children) > 0:
-            if value not in node.conditional_children:
-                return
-            update_md(metadata, node.conditional_children[value], presets)
-        else:
-            for child in node.children:
-                update_md(metadata, child, presets)
-
-    update_md(metadata, tree, presets)
+            metadata[category][key].value = split_directory_name(part)[1]
     return metadata
@@ -0,0 +1,88 @@
+"""Helpers for safely writing files that can be accessed by multiple
+processes at the same time (e.g., cache files)
+
+Note: file locking uses fcntl and therefore only works on POSIX systems.
+"""
+import os
+import json
+import stat
+import fcntl
+import tempfile
+import contextlib
+
+# the umask can only be read by setting it. Read it once at import time,
+# before any worker threads create files
+_umask = os.umask(0o022)
+os.umask(_umask)
+
+
+@contextlib.contextmanager
+def file_lock(filename, shared=False):
+    """Hold an advisory lock for a given file
+
+    The lock is taken on a separate file (filename + '.lock'), so that the file
+    itself can be atomically replaced while the lock is held.
+
+    Parameters
+    ----------
+    filename : str
+        File to lock. The file itself does not need to exist
+    shared : bool, optional
+        If True, acquire a shared (read) lock, otherwise an exclusive lock
+    """
+    lockfile = filename + '.lock'
+    os.makedirs(os.path.dirname(os.path.abspath(lockfile)), exist_ok=True)
+    with open(lockfile, 'a') as fid:
+        fcntl.flock(fid, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fid, fcntl.LOCK_UN)
+
+
+def get_file_mode(filename):
+    """Return the permissions a replacement of a file should get: the
+    permissions of the existing file, or the default permissions of new files
+    (0666 minus the umask)"""
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_umask
+
+
+def atomic_write(filename, content, mode='w'):
+    """Write a file atomically: the content is written to a temporary file in
+    the same directory, which then replaces the target file
+
+    Parameters
+    ----------
+    filename : str
+        Target file
+    content : str|bytes
+        Content to write
+    mode : str, optional
+        'w' for str content, 'wb' for bytes
+
+    The file gets the permissions of the file it replaces, or those of a
+    newly created file (see get_file_mode), not the 0600 of the temporary
+    file.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmpfile = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(filename) + '.')
+    try:
+        os.fchmod(fd, get_file_mode(filename))
+        with os.fdopen(fd, mode) as fid:
+            fid.write(content)
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.replace(tmpfile, filename)
+    except BaseException:
+        os.unlink(tmpfile)
+        raise
+
+
+def atomic_write_json(filename, data):
+    """Atomically write data to a json file, see atomic_write"""
+    atomic_write(filename, json.dumps(data))
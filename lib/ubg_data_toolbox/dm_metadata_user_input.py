@@ -45,6 +45,9 @@ from prompt_toolkit.validation import Validator
 from prompt_toolkit import PromptSession
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.completion import Completer
+from prompt_toolkit.completion import Completion
+from prompt_toolkit.completion import merge_completers
 from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit import print_formatted_text, HTML
@@ -88,6 +91,25 @@ def _(event):
     event.app.current_buffer.validate_and_handle()
 
 
+class md_value_index_completer(Completer):
+    """Complete the input using the values already used in the data tree
+    (see ubg_data_toolbox.md_value_index), most frequent values first"""
+    def __init__(self, value_index, key, limit=20):
+        self.value_index = value_index
+        self.key = key
+        self.limit = limit
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        for value, count in self.value_index.complete(
+                self.key, text, limit=self.limit):
+            yield Completion(
+                value,
+                start_position=-len(text),
+                display_meta='used {}x'.format(count),
+            )
+
+
 def get_default_value(entry, cache_default_values):
     """
     Determine a default value for metadata input.
@@ -123,10 +145,17 @@ def ask_user_for_metadata(
 
     Other Parameters
     ----------------
+    cache_default_values : ubg_data_toolbox.dm_caches.md_cache_default_values
+        Default values. The history of previous inputs is used for the
+        input history (arrow keys) of the prompts
+    value_index : ubg_data_toolbox.md_value_index.md_value_index, optional
+        If given, values already used in the data tree are offered for
+        auto-completion
 
     """
     # used for default values
     cache_default_values = kwargs.get('cache_default_values',)
+    value_index = kwargs.get('value_index', None)
 
     if md_entries is None:
         # start fresh with an empty metadata set
@@ -179,6 +208,25 @@ def ask_user_for_metadata(
                 history = None
                 allowed_value_completer = None
 
+            if value_index is not None and not entry.multiline:
+                index_completer = md_value_index_completer(
+                    value_index, '{}.{}'.format(section, entry.name))
+                if allowed_value_completer is None:
+                    allowed_value_completer = index_completer
+                else:
+                    allowed_value_completer = merge_completers(
+                        [index_completer, allowed_value_completer],
+                        deduplicate=True,
+                    )
+
+        # previous inputs of this entry, most recent one last
+        previous_values = cache_default_values.get_history(entry.name)
+        if len(previous_values) > 0:
+            if history is None:
+                history = InMemoryHistory()
+            for word in reversed(previous_values):
+                history.append_string(word)
+
         session = PromptSession(
             history=history,
             auto_suggest=AutoSuggestFromHistory(),
@@ -221,7 +269,7 @@ def ask_user_for_metadata(
             pass
             # info_text = ['', ]
 
-        if history is not None:
+        if allowed_value_completer is not None:
             info_text = info_text + [
                 HTML('There are autocomplete values available (Press TAB).'),
             ]
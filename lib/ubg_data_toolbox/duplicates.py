@@ -0,0 +1,310 @@
+"""Find duplicate files in the measurement directories of a data tree
+
+Files are compared in three stages, each stage only looking at the candidates
+of the previous one:
+
+    1) group by file size
+    2) group by a partial hash (first and last block of the file)
+    3) group by the hash of the full file content
+
+Only files that survive the first two stages are read completely. The list of
+files and the digests stored by dm_fixity are kept in a temporary sqlite
+database, so that memory usage is bounded by the largest group of
+equally-sized files instead of the number of files in the tree.
+"""
+import os
+import stat
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
+from ubg_data_toolbox.fixity import hash_file
+from ubg_data_toolbox.fixity import file_signature
+from ubg_data_toolbox.fixity import iter_manifest_entries
+from ubg_data_toolbox.fixity import get_cache_file
+from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox import instrumentation
+
+# size of the head and tail blocks used for the partial hash
+PARTIAL_BLOCK_SIZE = 64 * 1024
+
+
+def hash_file_partial(filename, size, block_size=PARTIAL_BLOCK_SIZE):
+    """Hash the first and the last block of a file
+
+    For files smaller than two blocks the complete content is hashed, i.e.,
+    the partial hash is then equal to a full hash.
+
+    Parameters
+    ----------
+    filename : str
+        File to hash
+    size : int
+        Size of the file in bytes
+    block_size : int, optional
+        Size of the head and tail blocks
+
+    Returns
+    -------
+    digest : str
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb', buffering=0) as fid:
+        if size <= 2 * block_size:
+            hasher.update(fid.read())
+        else:
+            hasher.update(fid.read(block_size))
+            fid.seek(size - block_size)
+            hasher.update(fid.read(block_size))
+    return hasher.hexdigest()
+
+
+class duplicate_finder(object):
+    """Find duplicate files in the measurement directories of a data tree"""
+
+    def __init__(self, datatree, min_size=1, workers=None,
+                 use_fixity_cache=True, loglevel=logging.INFO):
+        """
+        Parameters
+        ----------
+        datatree : str
+            Path to data tree. This can also be a subdirectory of the tree -
+            the data root is then found automatically
+        min_size : int, optional
+            Ignore files smaller than this size (in bytes)
+        workers : None|int, optional
+            Number of worker threads used for hashing. If None, use the number
+            of available CPUs
+        use_fixity_cache : bool, optional
+            If True, reuse sha256 digests stored by dm_fixity for files whose
+            signature did not change
+        loglevel : valid log-level of the logging module
+            Defaults to logging.INFO
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(loglevel)
+
+        assert os.path.isdir(datatree), "datatree is not a directory"
+        dr_root = find_data_root(datatree)
+        assert dr_root is not None, 'Could not find a data root directory'
+        self.dr_root = dr_root
+        self.min_size = max(min_size, 1)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+
+        # sha256 digests stored by dm_fixity, read in find_duplicates
+        self.fixity_file = None
+        if use_fixity_cache:
+            self.fixity_file = get_cache_file(dr_root, 'sha256')
+
+        # number of files that were read completely in the last run
+        self.nr_full_reads = 0
+        self._count_lock = threading.Lock()
+        # (path, error) of files that could not be read in the last run
+        self.errors = []
+        # measurement directory: id
+        self._ids = {}
+
+    def get_measurement_id(self, m_rel):
+        """Return the id of a measurement directory (relative to the data
+        root), or None if no id was assigned yet"""
+        if m_rel not in self._ids:
+            chain = metadata_chain(self.dr_root + os.sep + m_rel)
+            md = chain.get_merged_metadata()
+            m_id = None
+            if 'id' in md['general']:
+                m_id = md['general']['id'].value
+            self._ids[m_rel] = m_id
+        return self._ids[m_rel]
+
+    def _collect_files(self, db, start_dir):
+        """Store (size, inode, path, measurement directory) of all files in
+        the database"""
+        cursor = db.cursor()
+        nr_files = 0
+        for mdir in find_measurement_directories(start_dir):
+            m_rel = os.path.relpath(mdir, self.dr_root)
+            rows = []
+            for root, dirs, files in os.walk(mdir):
+                instrumentation.increment('directories_visited')
+                instrumentation.increment('stat_calls', len(files))
+                for filename in files:
+                    fullpath = root + os.sep + filename
+                    try:
+                        stat_result = os.stat(
+                            fullpath, follow_symlinks=False)
+                    except OSError as e:
+                        self.logger.warning('Cannot read {}: {}'.format(
+                            fullpath, e))
+                        self.errors.append((
+                            os.path.relpath(fullpath, self.dr_root), str(e)))
+                        continue
+                    if not stat.S_ISREG(stat_result.st_mode):
+                        continue
+                    if stat_result.st_size < self.min_size:
+                        continue
+                    rows.append((
+                        stat_result.st_size,
+                        stat_result.st_dev,
+                        stat_result.st_ino,
+                        os.path.relpath(fullpath, self.dr_root),
+                        m_rel,
+                    ))
+            cursor.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?)', rows)
+            nr_files += len(rows)
+        db.commit()
+        return nr_files
+
+    def _load_fixity_digests(self, db):
+        """Store the digests of the fixity cache file in the database. The
+        file is read one entry at a time"""
+        db.execute(
+            'CREATE TABLE fixity (path TEXT PRIMARY KEY, ino INTEGER, '
+            'size INTEGER, mtime_ns INTEGER, digest TEXT)'
+        )
+        if self.fixity_file is None or not os.path.isfile(self.fixity_file):
+            return
+        try:
+            db.executemany(
+                'INSERT OR REPLACE INTO fixity VALUES (?, ?, ?, ?, ?)',
+                ((relpath, entry[0], entry[1], entry[2], entry[3])
+                 for relpath, entry in iter_manifest_entries(
+                     self.fixity_file, 'sha256'))
+            )
+        except ValueError as e:
+            self.logger.warning('Ignoring fixity cache {}: {}'.format(
+                self.fixity_file, e))
+            db.execute('DELETE FROM fixity')
+        db.commit()
+
+    def _full_digest(self, item):
+        """Return the sha256 digest of a candidate (relpath, mdir, stored
+        signature and digest of the fixity cache, or None)"""
+        relpath = item[0]
+        fullpath = self.dr_root + os.sep + relpath
+        if item[2] is not None:
+            if list(item[2:5]) == file_signature(os.stat(fullpath)):
+                return item[5]
+        digest = hash_file(fullpath, 'sha256')[0]
+        with self._count_lock:
+            self.nr_full_reads += 1
+        return digest
+
+    def _group_by(self, executor, function, items):
+        """Group the items (relpath, m_dir, ...) by the result of the function
+        applied to each item. Only return groups with more than one member.
+        Files that cannot be read (e.g., removed since they were listed) are
+        reported in self.errors and not included in any group"""
+        def _call(item):
+            try:
+                return function(item), None
+            except OSError as e:
+                return None, e
+
+        groups = {}
+        results = executor.map(_call, items)
+        for (key, error), item in zip(results, items):
+            if error is not None:
+                self.logger.warning('Cannot read {}: {}'.format(
+                    item[0], error))
+                self.errors.append((item[0], str(error)))
+                continue
+            groups.setdefault(key, []).append(item)
+        return {
+            key: group for key, group in groups.items() if len(group) > 1
+        }
+
+    def find_duplicates(self, subdir=None):
+        """Find sets of files with identical content
+
+        Parameters
+        ----------
+        subdir : None|str
+            If provided with a valid path, only consider files below this
+            directory
+
+        Yields
+        ------
+        duplicate_set : dict
+            Dictionary with the keys 'size', 'digest' (sha256), 'files' (list
+            of dicts with the keys 'path' (relative to the data root), 'mdir'
+            (measurement directory) and 'id' (measurement id)) and
+            'reclaimable' (bytes that could be saved by keeping only one copy)
+        """
+        if subdir is None:
+            start_dir = self.dr_root
+        else:
+            start_dir = os.path.abspath(subdir)
+        self.nr_full_reads = 0
+        self.errors = []
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = sqlite3.connect(tmpdir + os.sep + 'files.db')
+            db.execute(
+                'CREATE TABLE files '
+                '(size INTEGER, dev INTEGER, ino INTEGER, path TEXT, '
+                'mdir TEXT)'
+            )
+            nr_files = self._collect_files(db, start_dir)
+            self.logger.info('Found {} files'.format(nr_files))
+
+            # hard links do not waste storage: only keep one path (the
+            # smallest) per inode, together with its measurement directory
+            db.execute(
+                'CREATE TABLE candidates AS SELECT size, path, mdir FROM '
+                '(SELECT size, path, mdir, ROW_NUMBER() OVER '
+                '(PARTITION BY dev, ino ORDER BY path) AS nr FROM files) '
+                'WHERE nr = 1'
+            )
+            db.execute('CREATE INDEX idx_size ON candidates (size)')
+            self._load_fixity_digests(db)
+            sql_sizes = 'SELECT size FROM candidates GROUP BY size ' + \
+                'HAVING COUNT(*) > 1'
+            nr_sizes = db.execute(
+                'SELECT COUNT(*) FROM ({})'.format(sql_sizes)).fetchone()[0]
+            self.logger.info(
+                '{} file sizes occur more than once'.format(nr_sizes))
+
+            sizes = db.cursor()
+            sizes.execute(sql_sizes + ' ORDER BY size DESC')
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for (size, ) in sizes:
+                    items = db.execute(
+                        'SELECT c.path, c.mdir, f.ino, f.size, f.mtime_ns, '
+                        'f.digest FROM candidates c LEFT JOIN fixity f '
+                        'ON f.path = c.path WHERE c.size = ? '
+                        'ORDER BY c.path', (size, )
+                    ).fetchall()
+
+                    if size <= 2 * PARTIAL_BLOCK_SIZE:
+                        # the partial hash would read the complete file anyway
+                        partial_groups = {None: items}
+                    else:
+                        partial_groups = self._group_by(
+                            executor,
+                            lambda item: hash_file_partial(
+                                self.dr_root + os.sep + item[0], size),
+                            items
+                        )
+                    for group in partial_groups.values():
+                        full_groups = self._group_by(
+                            executor, self._full_digest, group)
+                        for digest, files in sorted(full_groups.items()):
+                            yield {
+                                'size': size,
+                                'digest': digest,
+                                'files': [{
+                                    'path': relpath,
+                                    'mdir': m_rel,
+                                    'id': self.get_measurement_id(m_rel),
+                                } for relpath, m_rel, *_ in files],
+                                'reclaimable': size * (len(files) - 1),
+                            }
+            db.close()
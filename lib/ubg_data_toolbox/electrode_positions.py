@@ -0,0 +1,245 @@
+"""Parsed electrode positions ([geoelectrics] electrode_positions)
+
+The electrode positions are stored as a multi-line text block in the
+metadata.ini files (one electrode per line, (x, z) for 2D profiles or
+(x, y, z)). Parsing the text is done once: the resulting array is cached as
+.npy file in .management/electrode_positions/ of the data tree, keyed by the
+path, modification time and size of the metadata.ini file that defines the
+positions. Cached arrays are memory-mapped when loaded. Cache files of
+outdated metadata files are removed with prune_cache (dm_check_dirtree
+--prune-cache).
+
+    >>> chain = metadata_chain('dr_data/.../m_20230415_1330')
+    >>> positions = chain.get_electrode_positions()
+    >>> positions.shape
+    (48, 2)
+    >>> validate_electrode_positions(positions, spacing=1.0)
+    []
+"""
+import os
+import io
+import hashlib
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
+from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.metadata import _parse_metadata_file
+from ubg_data_toolbox.dm_file_utils import atomic_write
+import ubg_data_toolbox.md_types as md_types
+from ubg_data_toolbox import instrumentation
+
+SECTION = 'geoelectrics'
+KEY = 'electrode_positions'
+CACHE_DIR = 'electrode_positions'
+# maximum relative deviation of electrode distances from the spacing
+SPACING_TOLERANCE = 0.05
+
+def get_cache_directory(dr_root):
+    return dr_root + os.sep + '.management' + os.sep + CACHE_DIR
+
+
+def get_cache_key(filename, dr_root):
+    """Return the cache key of the electrode positions defined in a
+    metadata.ini file"""
+    stat_result = os.stat(filename)
+    instrumentation.increment('stat_calls')
+    return hashlib.sha1('{}\0{}\0{}'.format(
+        os.path.relpath(filename, dr_root),
+        stat_result.st_mtime_ns,
+        stat_result.st_size,
+    ).encode('utf-8')).hexdigest()
+
+
+def find_definition(md_files, get_content=_parse_metadata_file):
+    """Return the metadata file that defines the electrode positions of a
+    metadata chain, or None. md_files are given in the order in which they
+    are merged (see metadata_chain.get_available_metadata_files).
+    get_content returns the parsed content {section: {key: value}} of a
+    file (default: parse the file)."""
+    source = None
+    for filename in md_files:
+        if KEY in get_content(filename).get(SECTION, {}):
+            source = filename
+    return source
+
+
+def load_electrode_positions(filename, dr_root=None, mmap=True):
+    """Return the electrode positions defined in a metadata.ini file
+
+    The parsed array is cached (see module documentation). If the cache
+    cannot be written (e.g., read-only data tree), the array is returned
+    anyway.
+
+    Parameters
+    ----------
+    filename : str
+        metadata.ini file with a [geoelectrics] electrode_positions entry
+    dr_root : None|str, optional
+        Data root of the tree, determined from the filename if not given
+    mmap : bool, optional
+        If True, return cached arrays as read-only memory maps
+
+    Returns
+    -------
+    positions : numpy.ndarray
+        (n, 2) or (n, 3) array
+
+    Raises
+    ------
+    ValueError
+        If the entry cannot be parsed
+    """
+    import numpy as np
+
+    filename = os.path.abspath(filename)
+    if dr_root is None:
+        dr_root = find_data_root(os.path.dirname(filename))
+    dr_root = os.path.abspath(dr_root)
+    cache_name = get_cache_key(filename, dr_root) + '.npy'
+    cache_file = get_cache_directory(dr_root) + os.sep + cache_name
+    if os.path.isfile(cache_file):
+        return np.load(cache_file, mmap_mode='r' if mmap else None)
+
+    text = _parse_metadata_file(filename)[SECTION][KEY]
+    positions = md_types.POSITIONS.parse(text)
+    buffer = io.BytesIO()
+    np.save(buffer, positions)
+    try:
+        atomic_write(cache_file, buffer.getvalue(), mode='wb')
+    except OSError:
+        pass
+    return positions
+
+
+def validate_electrode_positions(positions, spacing=None,
+                                 tolerance=SPACING_TOLERANCE):
+    """Check an array of electrode positions
+
+    Checks: 2D array with two (x, z) or three (x, y, z) columns, at least two
+    electrodes, finite values, no two consecutive electrodes at the same
+    position and, if given, distances between consecutive electrodes that
+    match the electrode spacing (relative tolerance).
+
+    Returns
+    -------
+    problems : list
+        Descriptions of all problems found (empty if all checks passed)
+    """
+    import numpy as np
+
+    positions = np.asarray(positions)
+    if positions.ndim != 2 or positions.shape[1] not in (2, 3):
+        return ['expected an (n, 2) or (n, 3) array, got shape {}'.format(
+            positions.shape)]
+    problems = []
+    if positions.shape[0] < 2:
+        problems.append('less than two electrodes')
+    if not np.all(np.isfinite(positions)):
+        problems.append('non-finite coordinates in rows {}'.format(
+            np.where(~np.all(np.isfinite(positions), axis=1))[0].tolist()))
+        return problems
+
+    distances = np.linalg.norm(np.diff(positions, axis=0), axis=1)
+    duplicates = np.where(distances == 0)[0]
+    if len(duplicates) > 0:
+        problems.append('identical positions of electrodes {}'.format(
+            [(int(x) + 1, int(x) + 2) for x in duplicates]))
+    if spacing is not None and len(distances) > 0:
+        deviation = np.abs(distances - spacing) / spacing
+        wrong = np.where(deviation > tolerance)[0]
+        if len(wrong) > 0:
+            problems.append(
+                '{} of {} electrode distances deviate from the spacing {} '
+                '(e.g., electrodes {}-{}: {:.3f})'.format(
+                    len(wrong), len(distances), spacing,
+                    wrong[0] + 1, wrong[0] + 2, distances[wrong[0]]))
+    return problems
+
+
+def check_chain(chain, dr_root=None):
+    """Validate the electrode positions of a metadata chain
+
+    Returns
+    -------
+    problems : None|list
+        None if the chain defines no electrode positions, otherwise the list
+        of problems (see validate_electrode_positions)
+    """
+    md_files = chain.get_available_metadata_files()
+    source = find_definition(md_files)
+    if source is None:
+        return None
+    try:
+        positions = load_electrode_positions(source, dr_root=dr_root)
+    except ValueError as e:
+        return ['cannot parse electrode positions in {}: {}'.format(
+            source, e)]
+
+    spacing = None
+    for filename in md_files:
+        value = _parse_metadata_file(filename).get(SECTION, {}).get(
+            'spacing', None)
+        if value is not None and value.strip() != '':
+            spacing = value
+    if spacing is not None:
+        try:
+            spacing = md_types.FLOAT.parse(spacing)
+        except ValueError:
+            return ['invalid spacing: {}'.format(spacing)]
+    return validate_electrode_positions(positions, spacing=spacing)
+
+
+def validate_tree(start_dir):
+    """Validate the electrode positions of all measurements below a
+    directory
+
+    Yields
+    ------
+    m_dir : str
+        Measurement directory
+    problems : list
+        Problems found (only measurements with electrode positions and at
+        least one problem are returned)
+    """
+    dr_root = find_data_root(start_dir)
+    for m_dir in find_measurement_directories(start_dir):
+        problems = check_chain(metadata_chain(m_dir), dr_root=dr_root)
+        if problems:
+            yield m_dir, problems
+
+
+def prune_cache(dr_root):
+    """Remove cached arrays that do not belong to the current metadata files
+    of the tree. The cache files to keep are determined by walking the tree,
+    so that arrays written concurrently for current metadata files are kept.
+
+    Parameters
+    ----------
+    dr_root : str
+        Data root of the tree
+
+    Returns
+    -------
+    nr_removed : int
+    """
+    dr_root = os.path.abspath(dr_root)
+    cache_dir = get_cache_directory(dr_root)
+    if not os.path.isdir(cache_dir):
+        return 0
+    keep = set()
+    for root, dirs, files in os.walk(dr_root):
+        dirs[:] = [x for x in dirs if not x.startswith('.')]
+        filename = root + os.sep + 'metadata.ini'
+        if 'metadata.ini' in files and \
+                KEY in _parse_metadata_file(filename).get(SECTION, {}):
+            keep.add(get_cache_key(filename, dr_root) + '.npy')
+    nr_removed = 0
+    for filename in os.listdir(cache_dir):
+        if filename not in keep and filename.endswith('.npy'):
+            try:
+                os.unlink(cache_dir + os.sep + filename)
+                nr_removed += 1
+            except FileNotFoundError:
+                # removed by a concurrent run
+                pass
+    return nr_removed
@@ -0,0 +1,300 @@
+"""Query the measurement ids of multiple data trees at once
+
+Each data tree (data root, dr_ directory) is registered under a namespace in
+the [federation] section of the configuration file (ub_geoph_dm.cfg, see
+ubg_data_toolbox.dm_config). Relative paths are interpreted relative to the
+directory of the configuration file:
+
+    [federation]
+    hydro = /data/hydrogeophysics/dr_data
+    sip_lab = /data/laboratory/dr_sip
+
+The federation does not merge the trees into one data structure. Each tree
+keeps its own id map (.management/id_maps.idx, see
+ubg_data_toolbox.id_map_index), which is memory-mapped and queried in place:
+
+    * id lookups are binary searches in the id map of each tree
+    * listings are a merge of the (sorted) id maps of all trees, i.e., they
+      are produced one entry at a time
+    * ids used in more than one tree are found in the same pass
+
+Trees without id map are scanned when the federation is opened. Trees are
+opened (and scanned) in parallel. Results are namespaced, i.e., measurement
+directories are reported as [namespace]:[path relative to the data root].
+
+    >>> fed = federation(get_federation_roots())
+    >>> fed.open()
+    >>> fed.lookup('abc123')
+    [('abc123', 'hydro', 'tc_Hydro/t_field/s_Spiekeroog/.../m_01')]
+    >>> for m_id, entries in fed.find_duplicates():
+    ...     print(m_id, [get_namespaced_path(x[1], x[2]) for x in entries])
+"""
+import os
+import bisect
+import heapq
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.dm_config import find_config_highest_priority
+from ubg_data_toolbox.dm_config import parse_config_file
+from ubg_data_toolbox.id_handling import data_id_handler
+import ubg_data_toolbox.id_map_index as id_map_index
+from ubg_data_toolbox import instrumentation
+
+# section of the configuration file
+SECTION = 'federation'
+# separator of namespace and path in namespaced paths
+NAMESPACE_SEPARATOR = ':'
+
+
+def get_federation_roots(config_file=None):
+    """Return the data roots registered in the [federation] section of the
+    configuration file
+
+    Parameters
+    ----------
+    config_file : None|str, optional
+        Configuration file. Default: configuration file with the highest
+        priority (see dm_config.find_config_highest_priority)
+
+    Returns
+    -------
+    roots : dict
+        namespace: path of the data root
+    """
+    if config_file is None:
+        config_file = find_config_highest_priority()
+    if config_file is None or not os.path.isfile(config_file):
+        return {}
+    config = parse_config_file(config_file)
+    if not config.has_section(SECTION):
+        return {}
+    basedir = os.path.dirname(os.path.abspath(config_file))
+    roots = {}
+    for namespace, path in config.items(SECTION, raw=True):
+        if namespace in config.defaults():
+            continue
+        path = os.path.expanduser(path.strip())
+        if not os.path.isabs(path):
+            path = basedir + os.sep + path
+        roots[namespace] = os.path.normpath(path)
+    return roots
+
+
+def get_namespaced_path(namespace, relpath):
+    """Return the namespaced path [namespace]:[relpath]"""
+    return namespace + NAMESPACE_SEPARATOR + relpath
+
+
+def split_namespaced_path(path):
+    """Split a namespaced path into (namespace, relpath)"""
+    assert NAMESPACE_SEPARATOR in path, \
+        '{} is not a namespaced path'.format(path)
+    return tuple(path.split(NAMESPACE_SEPARATOR, 1))
+
+
+class _memory_index(object):
+    """Id map kept in memory, used for trees whose id map cannot be written
+    (e.g., read-only trees). Same interface as id_map_index.id_map_index"""
+    def __init__(self, id2relpath):
+        self.items = sorted(id2relpath.items())
+        self.ids = [x[0] for x in self.items]
+        self.nr_entries = len(self.items)
+
+    def get_path(self, m_id):
+        position = bisect.bisect_left(self.ids, m_id)
+        if position < self.nr_entries and self.ids[position] == m_id:
+            return self.items[position][1]
+        return None
+
+    def iter_items(self, prefix=''):
+        position = bisect.bisect_left(self.ids, prefix)
+        while position < self.nr_entries:
+            m_id, relpath = self.items[position]
+            if not m_id.startswith(prefix):
+                break
+            yield m_id, relpath
+            position += 1
+
+
+class federated_root(object):
+    """One data tree of a federation
+
+    Attributes
+    ----------
+    namespace : str
+    dr_root : str
+        Absolute path of the data root
+    index : None|id_map_index.id_map_index
+        Id map of the tree, None if the tree was not opened (successfully)
+    error : None|str
+        Reason why the tree could not be opened
+    """
+    def __init__(self, namespace, dr_root):
+        self.namespace = namespace
+        self.dr_root = os.path.abspath(dr_root)
+        self.index = None
+        self.error = None
+        self.logger = logging.getLogger(__name__)
+
+    def open(self, rescan=False):
+        """Open the id map of the tree. The tree is scanned if no id map
+        exists, or if rescan is True. The new id map is stored in the tree.
+
+        Errors (missing tree, ids used twice in the tree, ...) are not
+        raised, but stored in self.error.
+        """
+        self.index = None
+        self.error = None
+        try:
+            if not os.path.basename(self.dr_root).startswith('dr_') or \
+                    not os.path.isdir(self.dr_root):
+                raise IOError(
+                    '{} is not a data root directory'.format(self.dr_root))
+            handler = data_id_handler(
+                self.dr_root,
+                try_cache=not rescan,
+                update_cache=True,
+                loglevel=logging.WARNING,
+            )
+            if isinstance(handler.id2path, id_map_index.id2path_view):
+                self.index = handler.id2path.index
+                return self
+            instrumentation.increment('trees_scanned')
+            try:
+                handler.save_to_cache()
+                handler.load_from_cache()
+                self.index = handler.id2path.index
+            except OSError as e:
+                self.logger.warning(
+                    'Could not store the id map of {}, keeping it in '
+                    'memory: {}'.format(self.dr_root, e))
+                self.index = _memory_index({
+                    m_id: os.path.relpath(path, handler.dr_root_abs)
+                    for m_id, path in handler.id2path.items()
+                })
+        except Exception as e:
+            self.error = str(e)
+        return self
+
+    def get_absolute_path(self, relpath):
+        return self.dr_root + os.sep + relpath.replace('/', os.sep)
+
+    def iter_entries(self, prefix=''):
+        """Yield (id, namespace, relative path) in order of the ids"""
+        if self.index is None:
+            return
+        namespace = self.namespace
+        for m_id, relpath in self.index.iter_items(prefix=prefix):
+            yield m_id, namespace, relpath
+
+
+class federation(object):
+    """Multiple data trees, see module documentation"""
+    def __init__(self, roots, workers=None):
+        """
+        Parameters
+        ----------
+        roots : dict
+            namespace: path of the data root (see get_federation_roots)
+        workers : None|int, optional
+            Number of trees opened in parallel (default: number of trees)
+        """
+        self.roots = [
+            federated_root(namespace, path)
+            for namespace, path in sorted(roots.items())
+        ]
+        self.workers = workers
+
+    def open(self, rescan=False, namespaces=None):
+        """Open (and if required, scan) all trees in parallel
+
+        Parameters
+        ----------
+        rescan : bool, optional
+            Scan the trees even if their id maps exist
+        namespaces : None|list, optional
+            Only rescan these trees
+
+        Returns
+        -------
+        errors : dict
+            namespace: error of the trees that could not be opened
+        """
+        workers = self.workers or max(len(self.roots), 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(
+                lambda root: root.open(
+                    rescan and (
+                        namespaces is None or root.namespace in namespaces)
+                ),
+                self.roots
+            ))
+        return {
+            root.namespace: root.error for root in self.roots
+            if root.error is not None
+        }
+
+    def get_root(self, namespace):
+        for root in self.roots:
+            if root.namespace == namespace:
+                return root
+        raise KeyError(namespace)
+
+    def resolve(self, namespaced_path):
+        """Return the absolute path of a namespaced path"""
+        namespace, relpath = split_namespaced_path(namespaced_path)
+        return self.get_root(namespace).get_absolute_path(relpath)
+
+    def lookup(self, m_id):
+        """Return (id, namespace, relative path) of all measurements with the
+        given id (more than one if the id is used in multiple trees)"""
+        entries = []
+        for root in self.roots:
+            if root.index is None:
+                continue
+            relpath = root.index.get_path(m_id)
+            if relpath is not None:
+                entries.append((m_id, root.namespace, relpath))
+        return entries
+
+    def iter_entries(self, prefix='', namespaces=None):
+        """Yield (id, namespace, relative path) of the measurements of all
+        trees, in order of the ids (and namespaces)
+
+        Parameters
+        ----------
+        prefix : str, optional
+            Only return ids starting with this prefix
+        namespaces : None|list, optional
+            Only return measurements of these trees
+        """
+        return heapq.merge(*[
+            root.iter_entries(prefix) for root in self.roots
+            if namespaces is None or root.namespace in namespaces
+        ])
+
+    def find_duplicates(self, prefix=''):
+        """Find ids used in more than one tree
+
+        Ids are unique within each tree, so that ids used multiple times are
+        adjacent in iter_entries.
+
+        Yields
+        ------
+        m_id : str
+        entries : list
+            (id, namespace, relative path) of all measurements with this id
+        """
+        for m_id, group in itertools.groupby(
+                self.iter_entries(prefix), key=lambda x: x[0]):
+            entries = list(group)
+            if len(entries) > 1:
+                yield m_id, entries
+
+    def close(self):
+        for root in self.roots:
+            if isinstance(root.index, id_map_index.id_map_index):
+                root.index.close()
+            root.index = None
@@ -0,0 +1,476 @@
+"""Fixity information (content checksums) for files in measurement directories
+
+Digests of all files located in measurement directories (m_*) are stored in
+the .management subdirectory of the data root. Each entry is keyed by the path
+of the file (relative to the data root) and stores the signature (inode, size,
+mtime_ns) of the file at the time of hashing. Updating the fixity information
+only rehashes files that are new, or whose signature changed.
+
+Verification re-reads the files and compares the digests against the stored
+ones. Only files whose signature did not change can be judged: a digest
+mismatch for such a file indicates silent data corruption (bit rot). Files with
+a changed signature were modified through the file system and are reported
+separately.
+"""
+import os
+import json
+import stat
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
+from ubg_data_toolbox import instrumentation
+
+# supported hash algorithms (names as understood by hashlib.new)
+ALGORITHMS = ('sha256', 'blake2b')
+
+# large read buffers keep the number of system calls down for large raw files
+READ_BUFFER_SIZE = 8 * 1024 * 1024
+
+_thread_buffers = threading.local()
+
+
+def get_read_buffer(buffer_size):
+    """Return a (per-thread) reusable read buffer"""
+    buf = getattr(_thread_buffers, 'buffer', None)
+    if buf is None or len(buf) != buffer_size:
+        buf = bytearray(buffer_size)
+        _thread_buffers.buffer = buf
+    return buf
+
+
+def hash_file(filename, algorithm='sha256', buffer_size=READ_BUFFER_SIZE):
+    """Compute the digest of a file
+
+    Parameters
+    ----------
+    filename : str
+        File to hash
+    algorithm : str, optional
+        Hash algorithm, one of ALGORITHMS
+    buffer_size : int, optional
+        Size of the read buffer in bytes
+
+    Returns
+    -------
+    digest : str
+        Hex digest of the file content
+    nr_bytes : int
+        Number of bytes read
+    """
+    hasher = hashlib.new(algorithm)
+    buf = get_read_buffer(buffer_size)
+    view = memoryview(buf)
+    nr_bytes = 0
+    with open(filename, 'rb', buffering=0) as fid:
+        while True:
+            nr_read = fid.readinto(buf)
+            if not nr_read:
+                break
+            hasher.update(view[:nr_read])
+            nr_bytes += nr_read
+    instrumentation.increment('bytes_hashed', nr_bytes)
+    return hasher.hexdigest(), nr_bytes
+
+
+def file_signature(stat_result):
+    """Return the signature (inode, size, mtime_ns) of a stat result"""
+    return [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+
+def format_throughput(nr_bytes, seconds):
+    """Return a human-readable throughput string"""
+    if seconds <= 0:
+        return 'n/a'
+    return '{:.1f} MiB/s'.format(nr_bytes / seconds / 1024 ** 2)
+
+
+def get_cache_file(dr_root, algorithm):
+    """Return the fixity cache file of a data tree"""
+    return dr_root + os.sep + '.management' + os.sep + \
+        'fixity_{}.cache'.format(algorithm)
+
+
+class _json_stream(object):
+    """Incremental reader of a JSON document, which decodes one value at a
+    time from a buffer that is refilled from the file as required"""
+    def __init__(self, fid, chunk_size=READ_BUFFER_SIZE):
+        self.fid = fid
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.fid.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self.position < len(self.buffer) and \
+                    self.buffer[self.position] in ' \t\n\r':
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return
+
+    def next_char(self):
+        """Consume and return the next structural character"""
+        self._skip_whitespace()
+        if self.position >= len(self.buffer):
+            raise ValueError('Unexpected end of JSON document')
+        char = self.buffer[self.position]
+        self.position += 1
+        return char
+
+    def value(self):
+        """Consume and return the next complete value"""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if not self._fill():
+                    raise
+                continue
+            # numbers at the end of the buffer may be incomplete
+            if end < len(self.buffer) or not self._fill():
+                self.position = end
+                return value
+
+    def iter_object(self):
+        """Yield the keys of an object; the caller must consume the value of
+        each key (value() or iter_object()) before the next key"""
+        if self.next_char() != '{':
+            raise ValueError('JSON object expected')
+        self._skip_whitespace()
+        if self.buffer[self.position:self.position + 1] == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            if self.next_char() != ':':
+                raise ValueError('Invalid JSON object')
+            yield key
+            char = self.next_char()
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Invalid JSON object')
+
+
+def iter_manifest_entries(filename, algorithm='sha256'):
+    """Read the entries of a fixity cache file one at a time, without loading
+    the complete file into memory (see fixity_manifest)
+
+    Yields
+    ------
+    relpath : str
+    entry : list
+        [inode, size, mtime_ns, digest, last verification]
+
+    Raises
+    ------
+    ValueError
+        If the file is corrupt or was generated with a different algorithm
+    """
+    with open(filename, 'r') as fid:
+        reader = _json_stream(fid)
+        for key in reader.iter_object():
+            if key == 'files':
+                for relpath in reader.iter_object():
+                    yield relpath, reader.value()
+            elif key == 'algorithm':
+                if reader.value() != algorithm:
+                    raise ValueError(
+                        'fixity cache was generated with a different '
+                        'algorithm')
+            else:
+                reader.value()
+
+
+class fixity_manifest(object):
+    """Digests of all files in the measurement directories of a data tree"""
+
+    def __init__(self, datatree, algorithm='sha256', workers=None,
+                 loglevel=logging.INFO):
+        """
+        Parameters
+        ----------
+        datatree : str
+            Path to data tree. This can also be a subdirectory of the tree -
+            the data root is then found automatically
+        algorithm : str, optional
+            Hash algorithm, one of ALGORITHMS
+        workers : None|int, optional
+            Number of worker threads used for hashing. If None, use the number
+            of available CPUs
+        loglevel : valid log-level of the logging module
+            Defaults to logging.INFO
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(loglevel)
+
+        assert algorithm in ALGORITHMS, \
+            'algorithm must be one of {}'.format(ALGORITHMS)
+        self.algorithm = algorithm
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+
+        assert os.path.isdir(datatree), "datatree is not a directory"
+        dr_root = find_data_root(datatree)
+        assert dr_root is not None, 'Could not find a data root directory'
+        self.dr_root = dr_root
+
+        self.mgt_dir = dr_root + os.sep + '.management'
+        self.cachefile = get_cache_file(dr_root, algorithm)
+
+        # relative path: [inode, size, mtime_ns, digest, last verification]
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """Load the fixity information from the .management directory
+
+        Returns
+        -------
+        cache_found: bool
+            True if we found a cache, False if not
+        """
+        if not os.path.isfile(self.cachefile):
+            return False
+        try:
+            with open(self.cachefile, 'r') as fid:
+                data = json.load(fid)
+        except json.JSONDecodeError:
+            self.logger.warning(
+                'Ignoring corrupt fixity cache {}'.format(self.cachefile))
+            return False
+        assert data.get('algorithm') == self.algorithm, \
+            'fixity cache was generated with a different algorithm'
+        self.entries = data['files']
+        return True
+
+    def save(self):
+        """Write the fixity information to the .management directory"""
+        atomic_write_json(
+            self.cachefile,
+            {
+                'version': 1,
+                'algorithm': self.algorithm,
+                'files': self.entries,
+            },
+        )
+
+    def _get_start_dir(self, subdir):
+        if subdir is None:
+            return self.dr_root
+        start_dir = os.path.abspath(subdir)
+        assert os.path.isdir(start_dir), '{} directory must exist'.format(
+            start_dir)
+        relpath = os.path.relpath(start_dir, self.dr_root)
+        if relpath.startswith(os.pardir):
+            raise Exception('The subdir must be located in the data root')
+        return start_dir
+
+    def _relative_prefix(self, subdir):
+        """Relative path prefix of all entries located below subdir"""
+        if subdir is None:
+            return ''
+        relpath = os.path.relpath(self._get_start_dir(subdir), self.dr_root)
+        if relpath == os.curdir:
+            return ''
+        return relpath + os.sep
+
+    def scan_files(self, subdir=None):
+        """Find all files located in measurement directories
+
+        Parameters
+        ----------
+        subdir : None|str
+            If provided with a valid path, only consider files below this
+            directory
+
+        Yields
+        ------
+        relpath : str
+            Path of the file, relative to the data root
+        stat_result : os.stat_result
+        """
+        start_dir = self._get_start_dir(subdir)
+        for mdir in find_measurement_directories(start_dir):
+            for root, dirs, files in os.walk(mdir):
+                instrumentation.increment('directories_visited')
+                instrumentation.increment('stat_calls', len(files))
+                dirs.sort()
+                for filename in sorted(files):
+                    fullpath = root + os.sep + filename
+                    stat_result = os.stat(fullpath, follow_symlinks=False)
+                    if not stat.S_ISREG(stat_result.st_mode):
+                        continue
+                    yield os.path.relpath(fullpath, self.dr_root), stat_result
+
+    def _hash_many(self, relpaths):
+        """Hash the given files on the worker pool
+
+        Yields
+        ------
+        relpath : str
+        digest : str|None
+            None if the file could not be read
+        nr_bytes : int
+        """
+        def _work(relpath):
+            try:
+                digest, nr_bytes = hash_file(
+                    self.dr_root + os.sep + relpath, self.algorithm)
+            except OSError as e:
+                self.logger.warning('Cannot read {}: {}'.format(relpath, e))
+                return relpath, None, 0
+            return relpath, digest, nr_bytes
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(_work, relpaths)
+
+    def update(self, subdir=None):
+        """Hash all new or changed files and store the results
+
+        Parameters
+        ----------
+        subdir : None|str
+            If provided with a valid path, only update the files below this
+            directory
+
+        Returns
+        -------
+        report : dict
+            Number of new, changed, unchanged and removed files, as well as the
+            number of bytes hashed and the duration
+        """
+        time_start = time.time()
+        prefix = self._relative_prefix(subdir)
+        report = {
+            'new': 0,
+            'changed': 0,
+            'unchanged': 0,
+            'removed': 0,
+            'bytes_hashed': 0,
+        }
+
+        signatures = {}
+        to_hash = []
+        for relpath, stat_result in self.scan_files(subdir):
+            signature = file_signature(stat_result)
+            signatures[relpath] = signature
+            entry = self.entries.get(relpath)
+            if entry is None:
+                report['new'] += 1
+                to_hash.append(relpath)
+            elif entry[0:3] != signature:
+                report['changed'] += 1
+                to_hash.append(relpath)
+            else:
+                report['unchanged'] += 1
+
+        # entries of files that disappeared
+        for relpath in [
+                x for x in self.entries if x.startswith(prefix) and
+                x not in signatures]:
+            del self.entries[relpath]
+            report['removed'] += 1
+
+        self.logger.info('Hashing {} new or changed files'.format(
+            len(to_hash)))
+        now = time.time()
+        for relpath, digest, nr_bytes in self._hash_many(to_hash):
+            if digest is None:
+                self.entries.pop(relpath, None)
+                continue
+            self.entries[relpath] = signatures[relpath] + [digest, now]
+            report['bytes_hashed'] += nr_bytes
+
+        self.save()
+        report['seconds'] = time.time() - time_start
+        return report
+
+    def verify(self, sample=None, subdir=None, seed=None):
+        """Re-read files and compare their digests with the stored ones
+
+        Parameters
+        ----------
+        sample : None|int|float
+            If None, verify all files. An integer selects this number of
+            randomly chosen files, a float between 0 and 1 the corresponding
+            fraction of all files
+        subdir : None|str
+            If provided with a valid path, only verify the files below this
+            directory
+        seed : None|int
+            Seed of the random number generator used for sampling
+
+        Returns
+        -------
+        report : dict
+            Lists of 'ok', 'corrupted', 'modified' and 'missing' files (paths
+            relative to the data root), as well as the number of bytes read and
+            the duration
+        """
+        time_start = time.time()
+        prefix = self._relative_prefix(subdir)
+        candidates = sorted(x for x in self.entries if x.startswith(prefix))
+        if sample is not None:
+            if isinstance(sample, float):
+                assert 0 < sample <= 1, 'sample fraction must be in (0, 1]'
+                sample = max(1, int(round(sample * len(candidates))))
+            sample = min(sample, len(candidates))
+            candidates = sorted(random.Random(seed).sample(
+                candidates, sample))
+
+        report = {
+            'ok': [],
+            'corrupted': [],
+            'modified': [],
+            'missing': [],
+            'bytes_read': 0,
+        }
+        to_hash = []
+        for relpath in candidates:
+            try:
+                instrumentation.increment('stat_calls')
+                stat_result = os.stat(self.dr_root + os.sep + relpath)
+            except FileNotFoundError:
+                report['missing'].append(relpath)
+                continue
+            if self.entries[relpath][0:3] != file_signature(stat_result):
+                report['modified'].append(relpath)
+                continue
+            to_hash.append(relpath)
+
+        now = time.time()
+        for relpath, digest, nr_bytes in self._hash_many(to_hash):
+            report['bytes_read'] += nr_bytes
+            if digest is None:
+                report['missing'].append(relpath)
+            elif digest == self.entries[relpath][3]:
+                report['ok'].append(relpath)
+                self.entries[relpath][4] = now
+            else:
+                report['corrupted'].append(relpath)
+
+        self.save()
+        report['seconds'] = time.time() - time_start
+        return report
@@ -0,0 +1,333 @@
+/*
+ * Overview table of a data tree, generated by dm_gen_html
+ * (see ubg_data_toolbox.html_site for the format of the data files).
+ *
+ * All data files are small scripts that call ubgSite.register(), so that the
+ * site also works when opened directly from disk (file://), where fetch() and
+ * XMLHttpRequest are blocked by most browsers. Only the metadata and the rows
+ * of the current page are loaded; sort orders and search index shards are
+ * loaded on demand.
+ */
+(function () {
+    'use strict';
+
+    var loaded = {};
+    var pending = {};
+
+    var state = {
+        meta: null,
+        // row numbers in display order (null: order of the data files)
+        order: null,
+        sortColumn: null,
+        sortDescending: false,
+        // set of row numbers matching the search, or null
+        matches: null,
+        rows: null,
+        page: 0,
+        pageSize: 50,
+        renderCounter: 0
+    };
+
+    window.ubgSite = {
+        register: function (kind, key, payload) {
+            var name = kind + ':' + key;
+            loaded[name] = payload;
+            if (pending[name] !== undefined) {
+                pending[name].resolve(payload);
+                delete pending[name];
+            }
+        }
+    };
+
+    function load(kind, key, src) {
+        var name = kind + ':' + key;
+        if (name in loaded) {
+            return Promise.resolve(loaded[name]);
+        }
+        if (pending[name] !== undefined) {
+            return pending[name].promise;
+        }
+        var entry = {};
+        entry.promise = new Promise(function (resolve, reject) {
+            entry.resolve = resolve;
+            entry.reject = reject;
+        });
+        pending[name] = entry;
+        var script = document.createElement('script');
+        script.src = src;
+        script.onload = function () {
+            if (!(name in loaded)) {
+                delete pending[name];
+                entry.reject(new Error('No data in ' + src));
+            }
+        };
+        script.onerror = function () {
+            delete pending[name];
+            entry.reject(new Error('Could not load ' + src));
+        };
+        document.head.appendChild(script);
+        return entry.promise;
+    }
+
+    function loadChunk(nr) {
+        return load('chunk', nr, 'data/chunk_' + nr + '.js');
+    }
+
+    function loadSortOrder(column) {
+        return load('sort', column, 'sort/column_' + column + '.js');
+    }
+
+    function loadSearchShard(shard) {
+        return load('search', shard, 'search/' + state.meta.shards[shard]);
+    }
+
+    function decodeDeltas(deltas) {
+        var result = new Array(deltas.length);
+        var value = 0;
+        for (var i = 0; i < deltas.length; i++) {
+            value += deltas[i];
+            result[i] = value;
+        }
+        return result;
+    }
+
+    // keep in sync with _tokenize() in ubg_data_toolbox/html_site.py
+    function tokenize(text) {
+        return text.toLowerCase().split(/[^\p{L}\p{N}_]+/u).filter(
+            function (token) {
+                return token.length >= state.meta.min_token_length;
+            }
+        );
+    }
+
+    function setStatus(text) {
+        document.getElementById('status').textContent = text;
+    }
+
+    // update state.rows, the list of row numbers to show
+    function updateRows() {
+        var order = state.order;
+        if (order === null) {
+            order = [];
+            for (var i = 0; i < state.meta.nr_rows; i++) {
+                order.push(i);
+            }
+        }
+        if (state.sortDescending) {
+            order = order.slice().reverse();
+        }
+        if (state.matches !== null) {
+            order = order.filter(function (row) {
+                return state.matches.has(row);
+            });
+        }
+        state.rows = order;
+    }
+
+    function search(text) {
+        var tokens = tokenize(text);
+        if (tokens.length === 0) {
+            state.matches = null;
+            updateRows();
+            state.page = 0;
+            return render();
+        }
+        setStatus('searching...');
+        // shards that can contain words starting with each token (shards
+        // are named by a common prefix of their words, of varying length)
+        var shards = tokens.map(function (token) {
+            return Object.keys(state.meta.shards).filter(function (shard) {
+                return token.startsWith(shard) || shard.startsWith(token);
+            });
+        });
+        var needed = Array.from(new Set([].concat.apply([], shards)));
+        return Promise.all(needed.map(loadSearchShard)).then(function () {
+            var matches = null;
+            tokens.forEach(function (token, nr) {
+                // all tokens of the query must match (as prefix of a word)
+                var rows = new Set();
+                shards[nr].forEach(function (shard) {
+                    var index = loaded['search:' + shard];
+                    Object.keys(index).forEach(function (word) {
+                        if (word.startsWith(token)) {
+                            decodeDeltas(index[word]).forEach(function (row) {
+                                rows.add(row);
+                            });
+                        }
+                    });
+                });
+                if (matches === null) {
+                    matches = rows;
+                } else {
+                    matches = new Set(Array.from(matches).filter(
+                        function (row) {
+                            return rows.has(row);
+                        }
+                    ));
+                }
+            });
+            state.matches = matches;
+            updateRows();
+            state.page = 0;
+            return render();
+        });
+    }
+
+    function sortBy(column) {
+        if (state.sortColumn === column) {
+            state.sortDescending = !state.sortDescending;
+            updateRows();
+            return render();
+        }
+        setStatus('sorting...');
+        return loadSortOrder(column).then(function (order) {
+            state.order = order;
+            state.sortColumn = column;
+            state.sortDescending = false;
+            updateRows();
+            state.page = 0;
+            return render();
+        });
+    }
+
+    function renderHeader() {
+        var row = document.createElement('tr');
+        state.meta.columns.forEach(function (column, nr) {
+            var cell = document.createElement('th');
+            var label = column.label;
+            if (state.sortColumn === nr) {
+                cell.className = 'sorted';
+                label += state.sortDescending ? ' ▼' : ' ▲';
+            }
+            cell.textContent = label;
+            cell.title = column.name;
+            cell.onclick = function () {
+                sortBy(nr).catch(showError);
+            };
+            row.appendChild(cell);
+        });
+        var head = document.querySelector('#data_table thead');
+        head.replaceChildren(row);
+    }
+
+    function renderCell(value, column) {
+        var cell = document.createElement('td');
+        if (column.link !== undefined && value !== '') {
+            var link = document.createElement('a');
+            // keep in sync with get_page_name() in html_site.py
+            link.href = column.link.replace(
+                '{}', value.replace(/[^A-Za-z0-9._-]/g, '_'));
+            link.textContent = value;
+            cell.appendChild(link);
+        } else {
+            cell.textContent = value;
+        }
+        return cell;
+    }
+
+    function render() {
+        var counter = ++state.renderCounter;
+        var meta = state.meta;
+        var nrPages = Math.max(
+            1, Math.ceil(state.rows.length / state.pageSize));
+        state.page = Math.min(Math.max(state.page, 0), nrPages - 1);
+        var start = state.page * state.pageSize;
+        var rows = state.rows.slice(start, start + state.pageSize);
+
+        var chunks = new Set(rows.map(function (row) {
+            return Math.floor(row / meta.chunk_size);
+        }));
+        setStatus('loading...');
+        return Promise.all(Array.from(chunks).map(loadChunk)).then(
+            function () {
+                if (counter !== state.renderCounter) {
+                    // a newer request is already being rendered
+                    return;
+                }
+                renderHeader();
+                var body = document.createElement('tbody');
+                rows.forEach(function (row) {
+                    var chunk = loaded['chunk:' +
+                        Math.floor(row / meta.chunk_size)];
+                    var values = chunk[row % meta.chunk_size];
+                    var line = document.createElement('tr');
+                    values.forEach(function (value, nr) {
+                        line.appendChild(renderCell(value, meta.columns[nr]));
+                    });
+                    body.appendChild(line);
+                });
+                var table = document.getElementById('data_table');
+                table.replaceChild(body, table.querySelector('tbody'));
+
+                var info = 'no rows';
+                if (rows.length > 0) {
+                    info = 'rows ' + (start + 1) + '-' +
+                        (start + rows.length) + ' of ' + state.rows.length;
+                }
+                if (state.matches !== null) {
+                    info += ' (filtered from ' + meta.nr_rows + ')';
+                }
+                document.getElementById('page_info').textContent = info;
+                setStatus('');
+            }
+        );
+    }
+
+    function showError(error) {
+        setStatus('Error: ' + error.message);
+    }
+
+    function connectControls() {
+        var goTo = function (page) {
+            return function () {
+                state.page = page(state.page);
+                render().catch(showError);
+            };
+        };
+        var lastPage = function () {
+            return Math.ceil(state.rows.length / state.pageSize) - 1;
+        };
+        document.getElementById('first').onclick = goTo(function () {
+            return 0;
+        });
+        document.getElementById('previous').onclick = goTo(function (page) {
+            return page - 1;
+        });
+        document.getElementById('next').onclick = goTo(function (page) {
+            return page + 1;
+        });
+        document.getElementById('last').onclick = goTo(lastPage);
+        document.getElementById('page_size').onchange = function (event) {
+            var first = state.page * state.pageSize;
+            state.pageSize = parseInt(event.target.value, 10);
+            state.page = Math.floor(first / state.pageSize);
+            render().catch(showError);
+        };
+        document.getElementById('search').onkeydown = function (event) {
+            if (event.key === 'Enter') {
+                search(event.target.value).catch(showError);
+            }
+        };
+        document.getElementById('search').onsearch = function (event) {
+            // the clear button of the search field
+            if (event.target.value === '') {
+                search('').catch(showError);
+            }
+        };
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        load('meta', 0, 'data/meta.js').then(function (meta) {
+            state.meta = meta;
+            state.pageSize = parseInt(
+                document.getElementById('page_size').value, 10);
+            document.title = meta.title;
+            document.getElementById('title').textContent = meta.title;
+            document.getElementById('info').textContent =
+                meta.nr_rows + ' measurements, generated ' + meta.generated;
+            connectControls();
+            updateRows();
+            return render();
+        }).catch(showError);
+    });
+}());
@@ -0,0 +1,558 @@
+"""Static HTML overview of the metadata database of a data tree
+
+The site works offline and without a web server (it can be opened directly
+from disk), and its initial page load does not depend on the size of the
+tree. Layout of the output directory:
+
+    index.html            entry page
+    assets/               style sheet and JavaScript (see html_assets/)
+    data/meta.js          title, columns, number of rows, search shards
+    data/chunk_[nr].js    rows of the table, CHUNK_SIZE rows per file
+    sort/column_[nr].js   precomputed sort order (row numbers) of each column
+    search/shard_[nr].js  search index: word -> row numbers, split into
+                          shards by the first characters of the words
+    measurements/         one detail page per measurement (optional, see
+                          write_measurement_pages)
+
+Each data file contains one JSON object, wrapped in a call of
+ubgSite.register(kind, key, data), so that the files can be loaded with
+<script> tags (fetch() does not work for file:// URLs in most browsers).
+Only meta.js and the chunks of the displayed page are loaded initially; sort
+orders and search shards are loaded when needed. Row numbers in the search
+index are delta-encoded.
+"""
+import os
+import re
+import html
+import json
+import shutil
+import hashlib
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
+from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.metadata import _parse_metadata_file
+from ubg_data_toolbox.md_database import flatten_columns
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
+from ubg_data_toolbox import instrumentation
+
+# rows per data chunk
+CHUNK_SIZE = 250
+# words are grouped into search shards by their first SHARD_LENGTH
+# characters. Shards with more than MAX_SHARD_WORDS words are split further
+# using one more character.
+SHARD_LENGTH = 2
+MAX_SHARD_WORDS = 2000
+# shorter words are not indexed
+MIN_TOKEN_LENGTH = 2
+
+# columns shown by default ([section].[key])
+DEFAULT_COLUMNS = [
+    'general.id',
+    'general.label',
+    'general.survey_type',
+    'general.method',
+    'field.site',
+    'field.area',
+    'field.profile',
+    'general.datetime_start',
+    'general.person_responsible',
+    'general.completed',
+    'general.description',
+]
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep + \
+    'html_assets'
+ASSETS = ['site.js', 'site.css']
+# subdirectories of the output directory written by write_overview_site
+DATA_DIRS = ['assets', 'data', 'sort', 'search']
+
+# directory of the detail pages, relative to the output directory
+PAGE_DIR = 'measurements'
+# increase if the layout of the detail pages changes, so that all pages are
+# rendered again
+PAGE_VERSION = 1
+# maximum number of files listed on a detail page
+MAX_LISTED_FILES = 1000
+
+
+def _write_js(filename, kind, key, data):
+    """Write a data file of the site (see module documentation)"""
+    with open(filename, 'w', encoding='utf-8') as fid:
+        fid.write('ubgSite.register({},{},'.format(
+            json.dumps(kind), json.dumps(key)))
+        json.dump(data, fid, ensure_ascii=False, separators=(',', ':'))
+        fid.write(');\n')
+
+
+def _tokenize(text):
+    """Split a value into lower case words for the search index. Keep in
+    sync with tokenize() in html_assets/site.js"""
+    return [
+        x for x in re.split(r'[^\w]+', text.lower())
+        if len(x) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def _to_string(value):
+    if value is None:
+        return ''
+    if value != value:
+        # NaN/NaT: missing entry
+        return ''
+    return str(value)
+
+
+def get_table(data, columns=None):
+    """Extract the columns of the overview table from the metadata database
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Database generated by dm_gen_db (see
+        ubg_data_toolbox.md_database.load_database)
+    columns : None|list, optional
+        Columns to use, given as [section].[key]. Columns that are not
+        present in the database are ignored. If None, use DEFAULT_COLUMNS.
+        Use 'all' for all columns of the database.
+
+    Returns
+    -------
+    names : list
+        [section].[key] names of the columns
+    rows : list
+        One list of strings per measurement, sorted by id
+    """
+    data = flatten_columns(data)
+    available = list(data.columns)
+    if columns is None:
+        columns = DEFAULT_COLUMNS
+    if columns == 'all':
+        names = available
+    else:
+        names = [x for x in columns if x in available]
+    assert len(names) > 0, 'none of the requested columns is available'
+
+    data = data.sort_index()
+    positions = [available.index(x) for x in names]
+    rows = [
+        [_to_string(values[x]) for x in positions]
+        for values in data.itertuples(index=False, name=None)
+    ]
+    return names, rows
+
+
+def get_sort_order(values):
+    """Return the row numbers in ascending order of the values (list of str).
+    If all non-empty values are numbers, they are sorted numerically,
+    otherwise case-insensitively. Empty values are placed last."""
+    def _number(value):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    numbers = [_number(x) for x in values if x != '']
+    if len(numbers) > 0 and all(x is not None for x in numbers):
+        def key(nr):
+            value = values[nr]
+            return (value == '', float(value) if value != '' else 0)
+    else:
+        def key(nr):
+            return (values[nr] == '', values[nr].lower())
+    return sorted(range(len(values)), key=key)
+
+
+def get_search_index(rows):
+    """Build the search index of the table
+
+    Returns
+    -------
+    shards : dict
+        shard: {word: delta-encoded row numbers}
+    """
+    words = {}
+    for nr, row in enumerate(rows):
+        for value in row:
+            for word in _tokenize(value):
+                entry = words.setdefault(word, [])
+                if len(entry) == 0 or entry[-1] != nr:
+                    entry.append(nr)
+
+    def _split(word_list, length):
+        groups = {}
+        for word in word_list:
+            groups.setdefault(word[0:length], []).append(word)
+        for prefix, group in groups.items():
+            if len(group) > MAX_SHARD_WORDS and \
+                    any(len(x) > length for x in group):
+                yield from _split(group, length + 1)
+            else:
+                yield prefix, group
+
+    shards = {}
+    for prefix, group in _split(sorted(words), SHARD_LENGTH):
+        shard = shards.setdefault(prefix, {})
+        for word in group:
+            row_numbers = words[word]
+            shard[word] = [row_numbers[0]] + [
+                row_numbers[x] - row_numbers[x - 1]
+                for x in range(1, len(row_numbers))
+            ]
+    return shards
+
+
+def write_overview_site(data, output, columns=None, title=None,
+                        chunk_size=CHUNK_SIZE, column_links=None):
+    """Write the static overview site of a metadata database
+
+    Files of a previous run in the output directory are replaced.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Database generated by dm_gen_db
+    output : str
+        Output directory
+    columns : None|list|str, optional
+        Columns of the table, see get_table
+    title : None|str, optional
+        Title of the page
+    chunk_size : int, optional
+        Number of rows per data file
+    column_links : None|dict, optional
+        [section].[key]: link pattern. Values of these columns are rendered
+        as links, with {} in the pattern replaced by the value
+
+    Returns
+    -------
+    info : dict
+        nr_rows, nr_chunks, nr_shards
+    """
+    assert chunk_size > 0
+    names, rows = get_table(data, columns)
+
+    os.makedirs(output, exist_ok=True)
+    for subdir in DATA_DIRS:
+        if os.path.isdir(output + os.sep + subdir):
+            shutil.rmtree(output + os.sep + subdir)
+        os.makedirs(output + os.sep + subdir)
+
+    shutil.copyfile(
+        ASSET_DIR + os.sep + 'index.html', output + os.sep + 'index.html')
+    for asset in ASSETS:
+        shutil.copyfile(
+            ASSET_DIR + os.sep + asset,
+            output + os.sep + 'assets' + os.sep + asset,
+        )
+
+    nr_chunks = 0
+    for start in range(0, len(rows), chunk_size):
+        _write_js(
+            output + os.sep + 'data' + os.sep + 'chunk_{}.js'.format(
+                nr_chunks),
+            'chunk', nr_chunks, rows[start:start + chunk_size],
+        )
+        nr_chunks += 1
+
+    for nr in range(len(names)):
+        _write_js(
+            output + os.sep + 'sort' + os.sep + 'column_{}.js'.format(nr),
+            'sort', nr, get_sort_order([x[nr] for x in rows]),
+        )
+
+    shard_files = {}
+    for nr, (shard, index) in enumerate(
+            sorted(get_search_index(rows).items())):
+        shard_files[shard] = 'shard_{}.js'.format(nr)
+        _write_js(
+            output + os.sep + 'search' + os.sep + shard_files[shard],
+            'search', shard, index,
+        )
+
+    if column_links is None:
+        column_links = {}
+    column_info = []
+    for name in names:
+        entry = {'name': name, 'label': name.split('.', 1)[1]}
+        if name in column_links:
+            entry['link'] = column_links[name]
+        column_info.append(entry)
+
+    _write_js(output + os.sep + 'data' + os.sep + 'meta.js', 'meta', 0, {
+        'title': title or 'Data tree overview',
+        'generated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'nr_rows': len(rows),
+        'chunk_size': chunk_size,
+        'columns': column_info,
+        'shards': shard_files,
+        'min_token_length': MIN_TOKEN_LENGTH,
+    })
+    return {
+        'nr_rows': len(rows),
+        'nr_chunks': nr_chunks,
+        'nr_shards': len(shard_files),
+    }
+
+
+def get_page_name(m_id):
+    """Return the file name of the detail page of a measurement id"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', m_id) + '.html'
+
+
+def _get_page_sources(m_dir):
+    """Return the metadata files of a measurement (in the order in which they
+    are merged), and the files of the measurement directory
+
+    Returns
+    -------
+    md_files : list
+        Absolute paths of the metadata.ini files
+    files : list
+        (path relative to m_dir, size, mtime_ns) of all files
+    signature : str
+        Hash of the modification times and sizes of all sources
+    """
+    md_files = metadata_chain(m_dir).get_available_metadata_files()
+    hasher = hashlib.sha1(str(PAGE_VERSION).encode('utf-8'))
+    for filename in md_files:
+        stat_result = os.stat(filename)
+        hasher.update('{}\0{}\0{}\n'.format(
+            filename, stat_result.st_mtime_ns, stat_result.st_size
+        ).encode('utf-8'))
+    instrumentation.increment('stat_calls', len(md_files))
+
+    files = []
+    for root, dirs, filenames in os.walk(m_dir):
+        instrumentation.increment('directories_visited')
+        dirs[:] = sorted(x for x in dirs if not x.startswith('.'))
+        for filename in sorted(filenames):
+            fullpath = root + os.sep + filename
+            try:
+                stat_result = os.stat(fullpath)
+            except FileNotFoundError:
+                # e.g., a broken symlink
+                continue
+            files.append((
+                os.path.relpath(fullpath, m_dir),
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+            ))
+        instrumentation.increment('stat_calls', len(filenames))
+    for entry in files:
+        hasher.update('{}\0{}\0{}\n'.format(*entry).encode('utf-8'))
+    return md_files, files, hasher.hexdigest()
+
+
+def _get_chain_entries(md_files):
+    """Merge the metadata files and remember where each value came from
+
+    Returns
+    -------
+    entries : dict
+        {section: {key: [(value, source file), ...]}}, the last item of each
+        list is the effective value, previous items were overridden
+    """
+    entries = {}
+    for filename in md_files:
+        content = _parse_metadata_file(filename)
+        for section, values in content.items():
+            for key, value in values.items():
+                entries.setdefault(section, {}).setdefault(key, []).append(
+                    (value, filename))
+    return entries
+
+
+def _format_size(size):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+    if unit == 'B':
+        return '{} B'.format(size)
+    return '{:.1f} {}'.format(size, unit)
+
+
+def render_measurement_page(m_id, m_dir, dr_root, md_files, files):
+    """Return the HTML of the detail page of a measurement"""
+    esc = html.escape
+    m_rel = os.path.relpath(m_dir, os.path.dirname(dr_root))
+
+    def _source(filename):
+        return os.path.relpath(
+            os.path.dirname(filename), os.path.dirname(dr_root))
+
+    lines = [
+        '<!DOCTYPE html>',
+        '<html>',
+        '<head>',
+        '<meta charset="utf-8">',
+        '<title>{}</title>'.format(esc(m_id)),
+        '<link rel="stylesheet" type="text/css" href="../assets/site.css">',
+        '</head>',
+        '<body>',
+        '<p><a href="../index.html">&larr; Overview</a></p>',
+        '<h1>{}</h1>'.format(esc(m_id)),
+        '<div id="info">{}</div>'.format(esc(m_rel)),
+        '<h2>Metadata</h2>',
+        '<table id="data_table">',
+        '<thead><tr><th>Section</th><th>Key</th><th>Value</th>'
+        '<th>Defined in</th></tr></thead>',
+        '<tbody>',
+    ]
+    for section, values in sorted(_get_chain_entries(md_files).items()):
+        for key, history in sorted(values.items()):
+            value, source = history[-1]
+            overridden = ''.join(
+                '<br><del title="{}">{}</del>'.format(
+                    esc(_source(x[1])), esc(x[0]))
+                for x in reversed(history[0:-1])
+            )
+            lines.append(
+                '<tr><td>{}</td><td>{}</td><td>{}{}</td><td>{}</td>'
+                '</tr>'.format(
+                    esc(section), esc(key),
+                    esc(value).replace('\n', '<br>'), overridden,
+                    esc(_source(source)),
+                )
+            )
+    lines += [
+        '</tbody>',
+        '</table>',
+        '<h2>Metadata files</h2>',
+        '<ol>',
+    ]
+    for filename in md_files:
+        lines.append('<li>{}</li>'.format(esc(
+            os.path.relpath(filename, os.path.dirname(dr_root)))))
+    lines += [
+        '</ol>',
+        '<h2>Files ({}, {})</h2>'.format(
+            len(files), _format_size(sum(x[1] for x in files))),
+        '<table id="file_table">',
+        '<thead><tr><th>File</th><th>Size</th><th>Modified</th></tr></thead>',
+        '<tbody>',
+    ]
+    for relpath, size, mtime_ns in files[0:MAX_LISTED_FILES]:
+        lines.append('<tr><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+            esc(relpath), _format_size(size),
+            datetime.datetime.fromtimestamp(mtime_ns / 1e9).strftime(
+                '%Y-%m-%d %H:%M:%S'),
+        ))
+    lines += ['</tbody>', '</table>']
+    if len(files) > MAX_LISTED_FILES:
+        lines.append('<p>... {} more files not shown</p>'.format(
+            len(files) - MAX_LISTED_FILES))
+    lines += ['</body>', '</html>', '']
+    return '\n'.join(lines)
+
+
+def _update_measurement_page(task):
+    """Worker function of write_measurement_pages: render the page of one
+    measurement if its signature changed
+
+    Returns
+    -------
+    result : tuple
+        (m_id, m_dir, signature, rendered, counters). m_id is None if the
+        measurement has no id.
+    """
+    m_dir, dr_root, page_dir, old_signature = task
+    instrumentation.reset()
+    md_files, files, signature = _get_page_sources(m_dir)
+    merged = _get_chain_entries(md_files)
+    m_id = merged.get('general', {}).get('id', [(None, None)])[-1][0]
+    rendered = False
+    if m_id is not None:
+        filename = page_dir + os.sep + get_page_name(m_id)
+        if signature != old_signature or not os.path.isfile(filename):
+            page = render_measurement_page(
+                m_id, m_dir, dr_root, md_files, files)
+            with open(filename, 'w', encoding='utf-8') as fid:
+                fid.write(page)
+            rendered = True
+    return m_id, m_dir, signature, rendered, instrumentation.get_counters()
+
+
+def write_measurement_pages(dr_root, output, workers=None):
+    """Write one detail page per measurement (merged metadata, the metadata
+    file each value comes from, and the files of the measurement directory)
+
+    Pages are rendered in parallel on a process pool. The signatures
+    (modification times and sizes of the metadata files and of all files in
+    the measurement directory) of the rendered pages are stored in
+    [output]/measurements/signatures.json, and in subsequent runs only pages
+    with changed signatures are rendered again. Pages of measurements that no
+    longer exist are removed.
+
+    Parameters
+    ----------
+    dr_root : str
+        Data root of the tree
+    output : str
+        Output directory of the site (see write_overview_site)
+    workers : None|int, optional
+        Number of worker processes, default: number of CPUs
+
+    Returns
+    -------
+    info : dict
+        nr_pages, nr_rendered, nr_removed, missing_ids (list of measurement
+        directories without id)
+    """
+    dr_root = os.path.abspath(dr_root)
+    page_dir = os.path.abspath(output) + os.sep + PAGE_DIR
+    os.makedirs(page_dir, exist_ok=True)
+    signature_file = page_dir + os.sep + 'signatures.json'
+    # id: [measurement directory relative to the data root, signature]
+    old_signatures = {}
+    if os.path.isfile(signature_file):
+        with open(signature_file, 'r') as fid:
+            data = json.load(fid)
+        if data.get('version', None) == 1:
+            old_signatures = data['signatures']
+    signature_by_path = {x[0]: x[1] for x in old_signatures.values()}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with instrumentation.phase('scan'):
+        m_dirs = list(find_measurement_directories(dr_root))
+
+    info = {
+        'nr_pages': 0,
+        'nr_rendered': 0,
+        'nr_removed': 0,
+        'missing_ids': [],
+    }
+    signatures = {}
+    tasks = [
+        (x, dr_root, page_dir, signature_by_path.get(
+            os.path.relpath(x, dr_root), None))
+        for x in m_dirs
+    ]
+    with instrumentation.phase('write'):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                _update_measurement_page, tasks,
+                chunksize=max(1, min(64, len(tasks) // (4 * workers))),
+            )
+            for m_id, m_dir, signature, rendered, counters in results:
+                instrumentation.add_counters(counters)
+                if m_id is None:
+                    info['missing_ids'].append(m_dir)
+                    continue
+                signatures[m_id] = [os.path.relpath(m_dir, dr_root), signature]
+                info['nr_rendered'] += int(rendered)
+
+        for m_id in set(old_signatures) - set(signatures):
+            filename = page_dir + os.sep + get_page_name(m_id)
+            if os.path.isfile(filename):
+                os.unlink(filename)
+            info['nr_removed'] += 1
+
+        atomic_write_json(
+            signature_file, {'version': 1, 'signatures': signatures})
+    info['nr_pages'] = len(signatures)
+    return info
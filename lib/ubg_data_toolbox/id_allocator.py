@@ -0,0 +1,170 @@
+"""Allocation of new measurement ids
+
+Ids are generated using the schema
+
+    [PREFIX_][SITE]_[METHOD]_[YEAR]_[RUNNING_NR:%08i]
+
+with one running number per (prefix, site, method, year). The next free number
+of each counter is stored in .management/id_counters.json of the data tree.
+Numbers are reserved in blocks: the counter file is only locked and updated
+once per block, not for each id. Numbers of a block that are not used (e.g.,
+because the program ended) are simply skipped, i.e., ids are unique, but not
+necessarily consecutive.
+
+Every allocated id is checked against the id map of the data tree
+(ubg_data_toolbox.id_handling.data_id_handler), so that ids assigned by other
+means are never handed out twice.
+"""
+import os
+import json
+
+from ubg_data_toolbox.dm_file_utils import file_lock
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
+
+
+class id_allocator(object):
+    """Allocate unique ids for measurements
+
+    Examples
+    --------
+    >>> handler = data_id_handler('dr_data', try_cache=True,
+    ...                           update_cache=True)
+    >>> allocator = id_allocator(handler, prefix='ubg')
+    >>> allocator.allocate('Spiek', 'ERT', 2023)
+    'ubg_spiek_ert_2023_00000001'
+    """
+    def __init__(self, handler, prefix=None, block_size=100, persist=True):
+        """
+        Parameters
+        ----------
+        handler : ubg_data_toolbox.id_handling.data_id_handler
+            Id handler of the data tree, used to check for existing ids
+        prefix : None|str, optional
+            Prefix of all ids
+        block_size : int, optional
+            Number of ids reserved at once
+        persist : bool, optional
+            If False, do not update the counter file (dry runs)
+        """
+        self.handler = handler
+        if prefix is None or prefix == '':
+            self.prefix = ''
+        else:
+            self.prefix = prefix + '_'
+        assert block_size > 0
+        self.block_size = block_size
+        self.persist = persist
+        self.counterfile = handler.mgt_dir + os.sep + 'id_counters.json'
+
+        # key: [next number, end of reserved block (exclusive)]
+        self.blocks = {}
+        # dry runs: next number of each counter, kept in memory instead of
+        # the counter file
+        self.counters = {}
+        # all ids handed out by this allocator
+        self.allocated = set()
+
+    def _read_counters(self):
+        if not os.path.isfile(self.counterfile):
+            return {}
+        with open(self.counterfile, 'r') as fid:
+            data = json.load(fid)
+        assert data.get('version', None) == 1, \
+            'Unknown format of {}'.format(self.counterfile)
+        return data['counters']
+
+    def _max_existing_number(self, id_base):
+        """Return the highest running number of all existing ids that start
+        with id_base, or 0"""
+        max_nr = 0
+        for m_id in self.handler.get_ids_with_prefix(id_base):
+            running_nr = m_id[len(id_base):]
+            if running_nr.isdigit():
+                max_nr = max(max_nr, int(running_nr))
+        return max_nr
+
+    def _reserve_block(self, id_base):
+        """Reserve a new block of numbers for a given id base, protected by a
+        lock of the counter file
+
+        When a counter is used for the first time, it starts after the highest
+        existing number of the id map. In dry runs (persist=False), the
+        counters are advanced in memory only.
+        """
+        if not self.persist:
+            if id_base not in self.counters:
+                self.counters[id_base] = self._read_counters().get(
+                    id_base, self._max_existing_number(id_base) + 1)
+            start = self.counters[id_base]
+            self.counters[id_base] = start + self.block_size
+        else:
+            with file_lock(self.counterfile):
+                counters = self._read_counters()
+                if id_base in counters:
+                    start = counters[id_base]
+                else:
+                    start = self._max_existing_number(id_base) + 1
+                counters[id_base] = start + self.block_size
+                atomic_write_json(
+                    self.counterfile,
+                    {'version': 1, 'counters': counters},
+                )
+        self.blocks[id_base] = [start, start + self.block_size]
+
+    def gen_id_base(self, site, method, year):
+        """Return the part of the id before the running number"""
+        return '{}{}_{}_{:04}_'.format(
+            self.prefix,
+            site.lower(),
+            method.lower(),
+            int(year),
+        )
+
+    def allocate(self, site, method, year):
+        """Return a new, unused id
+
+        Parameters
+        ----------
+        site : str
+            Site of field measurements, empty string for lab measurements
+        method : str
+            Measurement method
+        year : int|str
+            Year of the measurement
+
+        Returns
+        -------
+        new_id : str
+        """
+        id_base = self.gen_id_base(site, method, year)
+        while True:
+            block = self.blocks.get(id_base, None)
+            if block is None or block[0] >= block[1]:
+                self._reserve_block(id_base)
+                block = self.blocks[id_base]
+            new_id = '{}{:08}'.format(id_base, block[0])
+            block[0] += 1
+            if new_id in self.allocated:
+                continue
+            if not self.handler.check_id_present(new_id):
+                self.allocated.add(new_id)
+                return new_id
+
+    def get_next_free_id(self, metadata):
+        """Allocate an id for a measurement, based on its metadata
+
+        Parameters
+        ----------
+        metadata : configparser.ConfigParser|dict
+            Metadata (strings) with the entries [general] survey_type, method,
+            datetime_start and, for field measurements, [field] site
+        """
+        if metadata['general']['survey_type'] == 'field':
+            site = metadata['field']['site']
+        else:
+            site = ''
+        return self.allocate(
+            site,
+            metadata['general']['method'],
+            metadata['general']['datetime_start'][0:4],
+        )
@@ -7,7 +7,9 @@ import json
 import pathlib
 
 from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
 from ubg_data_toolbox.metadata import metadata_chain
+import ubg_data_toolbox.id_map_index as id_map_index
 
 
 class data_id_handler(object):
@@ -35,7 +37,8 @@ class data_id_handler(object):
         self.logger.debug('Initializing ID handler')
         # ids and paths are both unique within the data tree
         # we maintain two dictionaries for look-up in both directions
-        # Paths are absolute paths
+        # Paths are absolute paths. If loaded from the cache, these are
+        # read-only views on the cache file (see load_from_cache)
         self.id2path = {}
         self.path2id = {}
 
@@ -45,8 +48,13 @@ class data_id_handler(object):
         assert dr_root is not None, 'Could not find a data root directory'
         self.dr_root = dr_root
 
+        self.dr_root_abs = os.path.abspath(dr_root)
+
         # the management directory
         self.mgt_dir = dr_root + os.sep + '.management'
+        self.cachefile = self.mgt_dir + os.sep + 'id_maps.idx'
+        # old cache format (json, absolute paths), converted upon loading
+        self.legacy_cachefile = self.mgt_dir + os.sep + 'id_maps.cache'
 
         if try_cache:
             self.logger.debug('trying cache for existing id map')
@@ -65,41 +73,88 @@ class data_id_handler(object):
     def load_from_cache(self):
         """Load id maps from cache.
 
+        The id maps are memory-mapped from .management/id_maps.idx (see
+        ubg_data_toolbox.id_map_index) and exposed as read-only, dict-like
+        views, i.e., lookups do not require loading the complete map. If only
+        the old JSON cache (id_maps.cache) is found, it is converted to the
+        new format and removed.
+
         Returns
         -------
         cache_found: bool
             True if we found a cache, False if not
         """
-        cachefile = self.mgt_dir + os.sep + 'id_maps.cache'
-        if os.path.isfile(cachefile):
-            with open(cachefile, 'r') as fid:
-                id2path, path2id = json.load(fid)
-            assert isinstance(id2path, dict), "loaded data is not a dict"
-            assert isinstance(path2id, dict), "loaded data is not a dict"
-            self.id2path = id2path
-            self.path2id = path2id
+        if not os.path.isfile(self.cachefile) and \
+                os.path.isfile(self.legacy_cachefile):
+            self._migrate_legacy_cache()
+
+        if os.path.isfile(self.cachefile):
+            index = id_map_index.id_map_index(self.cachefile)
+            self.id2path = id_map_index.id2path_view(index, self.dr_root_abs)
+            self.path2id = id_map_index.path2id_view(index, self.dr_root_abs)
             return True
         return False
 
+    def _migrate_legacy_cache(self):
+        """Convert the JSON cache with absolute paths into the new format.
+        Paths are made relative by stripping everything up to and including
+        the dr_ directory, so caches of relocated trees can be migrated."""
+        self.logger.info('Converting {} to {}'.format(
+            self.legacy_cachefile, self.cachefile))
+        with open(self.legacy_cachefile, 'r') as fid:
+            id2path, path2id = json.load(fid)
+        assert isinstance(id2path, dict), "loaded data is not a dict"
+
+        id2relpath = {}
+        for m_id, path in id2path.items():
+            parts = path.split(os.sep)
+            dr_parts = [
+                nr for nr, part in enumerate(parts) if part.startswith('dr_')
+            ]
+            if len(dr_parts) == 0:
+                self.logger.warning(
+                    'Dropping id {} from the id map, path is not located in a '
+                    'data root: {}'.format(m_id, path))
+                continue
+            id2relpath[m_id] = os.sep.join(parts[dr_parts[0] + 1:])
+        id_map_index.write_id_map_index(self.cachefile, id2relpath)
+        os.unlink(self.legacy_cachefile)
+
     def save_to_cache(self):
-        """Save id maps into a json file in the .management subdirectory of the
-        dr_ directory level
+        """Save id maps into .management/id_maps.idx (see
+        ubg_data_toolbox.id_map_index)
 
         """
-        if not os.path.isdir(self.mgt_dir):
-            os.makedirs(self.mgt_dir)
-
-        outfile = self.mgt_dir + os.sep + 'id_maps.cache'
-        with open(outfile, 'w') as fid:
-            json.dump([self.id2path, self.path2id], fid)
-            return True
-        return False
-
-        # import IPython
-        # IPython.embed()
+        id2relpath = {
+            m_id: os.path.relpath(path, self.dr_root_abs)
+            for m_id, path in self.id2path.items()
+        }
+        id_map_index.write_id_map_index(self.cachefile, id2relpath)
+        return True
+
+    def get_ids_with_prefix(self, prefix):
+        """Return all ids starting with a given prefix"""
+        if isinstance(self.id2path, id_map_index.id2path_view):
+            return [
+                m_id for m_id, relpath in
+                self.id2path.index.iter_items(prefix=prefix)
+            ]
+        if isinstance(self.id2path, id_map_index.overlay_map):
+            id2path = self.id2path
+            return [
+                m_id for m_id, relpath in
+                id2path.base.index.iter_items(prefix=prefix)
+                if m_id in id2path and m_id not in id2path.added
+            ] + [x for x in id2path.added.keys() if x.startswith(prefix)]
+        return [x for x in self.id2path.keys() if x.startswith(prefix)]
 
     def update_id_maps_from_dirtree(self, subdir=None):
-        """Scan the complete tree and update the id maps
+        """Scan the directory tree and update the id maps
+
+        If a subdirectory is given, only this part of the tree is scanned:
+        all entries below the subdirectory are removed from the id maps and
+        replaced by the newly found ones, while the entries of the rest of the
+        tree are retained.
 
         Parameters
         ----------
@@ -111,44 +166,27 @@ class data_id_handler(object):
         if subdir is not None:
             start_dir = os.path.abspath(subdir)
         else:
-            start_dir = self.dr_root
-
-        print('inside id handler')
-        # import IPython
-        # IPython.embed()
+            start_dir = os.path.abspath(self.dr_root)
 
         assert os.path.isdir(start_dir), '{} directory must exist'.format(
             start_dir)
 
+        # check if path inside our data root
         p_start = pathlib.Path(start_dir)
-        p_dr = pathlib.Path(self.dr_root)
+        p_dr = pathlib.Path(os.path.abspath(self.dr_root))
         if p_start != p_dr and p_dr not in p_start.parents:
             raise Exception('The subdir must be located in the data root')
 
-        # check if path inside our data root
-
-        pwd = os.getcwd()
-        os.chdir(self.dr_root)
-        start_dir_rel = os.path.relpath(start_dir, start=self.dr_root)
         self.logger.debug(
             'starting to update ids from directory: {}'.format(
                 start_dir
             )
         )
-        # collect all measurement directories with a metadata.ini file
-        m_dirs = []
-        for root, dirs, files in os.walk(start_dir_rel):
-            if os.path.basename(root).startswith('m_'):
-                metadata_file = root + os.sep + 'metadata.ini'
-                if os.path.isfile(metadata_file):
-                    m_dirs.append(root)
-
-        print(m_dirs)
-        # extract ids
+        # extract ids of all measurement directories with a metadata.ini file
         sub_id2path = {}
         sub_path2id = {}
 
-        for mdir in m_dirs:
+        for mdir in find_measurement_directories(start_dir):
             chain = metadata_chain(mdir)
             data = chain.get_merged_metadata()
             if 'id' not in data['general']:
@@ -158,21 +196,74 @@ class data_id_handler(object):
             m_path = os.path.abspath(mdir)
 
             assert m_id not in sub_id2path, \
-                "IDs must be unique in a data directory tree!"
+                "IDs must be unique in a data directory tree! " + \
+                "{}: {} {}".format(m_id, sub_id2path.get(m_id), m_path)
             sub_id2path[m_id] = m_path
 
             assert m_path not in sub_path2id, \
                 "Paths must be unique in a data directory tree!"
             sub_path2id[m_path] = m_id
+        self.logger.debug('found {} ids'.format(len(sub_id2path)))
 
-        # now replace the global maps
-        self.id2path = sub_id2path
-        self.path2id = sub_path2id
+        if p_start == p_dr:
+            # complete scan: replace the global maps
+            self.id2path = sub_id2path
+            self.path2id = sub_path2id
+        else:
+            self._merge_subtree(start_dir, sub_id2path, sub_path2id)
 
         self.logger.debug('done updating id maps')
-        print(self.id2path)
 
-        os.chdir(pwd)
+    def _merge_subtree(self, start_dir, sub_id2path, sub_path2id):
+        """Replace all entries below start_dir by the given maps
+
+        Raises
+        ------
+        Exception
+            If ids of the subtree are already used outside of the subtree. The
+            id maps are not modified in this case.
+        """
+        # maps loaded from the cache are read-only: only the changes are
+        # stored on top of them, without copying the complete maps
+        if isinstance(self.path2id, id_map_index.path2id_view):
+            self.id2path = id_map_index.overlay_map(self.id2path)
+            self.path2id = id_map_index.overlay_map(self.path2id)
+
+        prefix = start_dir + os.sep
+        if isinstance(self.path2id, dict):
+            stale_paths = [
+                path for path in self.path2id.keys()
+                if path.startswith(prefix)
+            ]
+        else:
+            # binary search in the sorted path table of the index
+            stale_paths = [
+                path for path, m_id in
+                self.path2id.iter_items_below(start_dir)
+            ]
+
+        collisions = []
+        for m_id, m_path in sub_id2path.items():
+            other_path = self.id2path.get(m_id, None)
+            if other_path is not None and not other_path.startswith(prefix):
+                collisions.append((m_id, m_path, other_path))
+        if len(collisions) > 0:
+            raise Exception(
+                'IDs must be unique in a data directory tree! The following '
+                'ids are also used outside of {}:\n'.format(start_dir) +
+                '\n'.join(
+                    '    {}: {} (also in {})'.format(*x) for x in collisions)
+            )
+
+        for path in stale_paths:
+            m_id = self.path2id.pop(path)
+            if self.id2path.get(m_id, None) == path:
+                del self.id2path[m_id]
+        self.id2path.update(sub_id2path)
+        self.path2id.update(sub_path2id)
+        self.logger.debug(
+            'removed {} stale entries, merged {} entries'.format(
+                len(stale_paths), len(sub_path2id)))
 
     def check_id_present(self, test_id, update_tree=False):
         """Check if a given id is present in the tree
@@ -0,0 +1,288 @@
+"""Compact, memory-mapped on-disk format of the id maps of a data tree
+
+The id maps (id -> measurement directory and measurement directory -> id) are
+stored in .management/id_maps.idx. Paths are stored relative to the data root
+(dr_ directory), so the file stays valid if the data tree is moved or mounted
+elsewhere.
+
+File layout (all integers little endian):
+
+    header:      magic (8 bytes, b'UBGIDMAP'), version (uint32),
+                 number of entries n (uint32), offsets of the id table, the
+                 path table and the string blob (3 x uint64)
+    id table:    n records (id offset, id length, path offset, path length)
+                 of type (uint64, uint32, uint64, uint32), sorted by id
+    path table:  n records of the same type, sorted by path
+    string blob: utf-8 encoded ids and paths, referenced by the offsets
+                 (relative to the start of the blob)
+
+The file is memory-mapped for reading, and lookups in both directions are
+binary searches in the sorted tables, i.e., no need to load the complete map
+to look up a single id.
+"""
+import os
+import mmap
+import struct
+import bisect
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+
+from ubg_data_toolbox.dm_file_utils import atomic_write
+
+MAGIC = b'UBGIDMAP'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQ')
+RECORD = struct.Struct('<QIQI')
+
+
+def write_id_map_index(filename, id2relpath):
+    """Write the id map to an index file
+
+    Parameters
+    ----------
+    filename : str
+        Output file (usually .management/id_maps.idx)
+    id2relpath : dict
+        id: path of the measurement directory, relative to the data root
+    """
+    blob = bytearray()
+    entries = []
+    for m_id, relpath in id2relpath.items():
+        id_bytes = m_id.encode('utf-8')
+        path_bytes = relpath.encode('utf-8')
+        id_offset = len(blob)
+        blob += id_bytes
+        path_offset = len(blob)
+        blob += path_bytes
+        entries.append((
+            id_bytes, path_bytes,
+            RECORD.pack(
+                id_offset, len(id_bytes), path_offset, len(path_bytes)),
+        ))
+
+    id_table = b''.join(x[2] for x in sorted(entries, key=lambda x: x[0]))
+    path_table = b''.join(x[2] for x in sorted(entries, key=lambda x: x[1]))
+
+    offset_id_table = HEADER.size
+    offset_path_table = offset_id_table + len(id_table)
+    offset_blob = offset_path_table + len(path_table)
+    header = HEADER.pack(
+        MAGIC, VERSION, len(entries),
+        offset_id_table, offset_path_table, offset_blob,
+    )
+    atomic_write(
+        filename,
+        header + id_table + path_table + bytes(blob),
+        mode='wb',
+    )
+
+
+class _sorted_table(object):
+    """Sequence-like access to the keys of one sorted table of the index,
+    used for binary searches with the bisect module"""
+    def __init__(self, index, table_offset, key_field):
+        self.index = index
+        self.table_offset = table_offset
+        self.key_field = key_field
+
+    def __len__(self):
+        return self.index.nr_entries
+
+    def __getitem__(self, position):
+        record = self.index.get_record(self.table_offset, position)
+        return self.index.get_string(
+            record[2 * self.key_field], record[2 * self.key_field + 1])
+
+
+class id_map_index(object):
+    """Read-only access to an id map index file (see write_id_map_index)"""
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fid:
+            self.mm = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.nr_entries, self.offset_id_table,
+            self.offset_path_table, self.offset_blob) = HEADER.unpack_from(
+                self.mm, 0)
+        if magic != MAGIC:
+            raise IOError('Not an id map index file: {}'.format(filename))
+        if version != VERSION:
+            raise IOError('Unsupported version {} of id map index: {}'.format(
+                version, filename))
+        self.ids = _sorted_table(self, self.offset_id_table, 0)
+        self.paths = _sorted_table(self, self.offset_path_table, 1)
+
+    def get_record(self, table_offset, position):
+        return RECORD.unpack_from(
+            self.mm, table_offset + position * RECORD.size)
+
+    def get_string(self, offset, length):
+        start = self.offset_blob + offset
+        return self.mm[start:start + length].decode('utf-8')
+
+    def _lookup(self, table, key):
+        """Return the record of a key in a given table, or None"""
+        position = bisect.bisect_left(table, key)
+        if position < self.nr_entries and table[position] == key:
+            return self.get_record(table.table_offset, position)
+        return None
+
+    def get_path(self, m_id):
+        """Return the relative path of an id, or None"""
+        record = self._lookup(self.ids, m_id)
+        if record is None:
+            return None
+        return self.get_string(record[2], record[3])
+
+    def get_id(self, relpath):
+        """Return the id of a relative path, or None"""
+        record = self._lookup(self.paths, relpath)
+        if record is None:
+            return None
+        return self.get_string(record[0], record[1])
+
+    def iter_items(self, prefix=''):
+        """Yield (id, relative path) pairs in order of the ids. If a prefix is
+        given, only ids starting with the prefix are returned"""
+        position = bisect.bisect_left(self.ids, prefix)
+        while position < self.nr_entries:
+            record = self.get_record(self.offset_id_table, position)
+            m_id = self.get_string(record[0], record[1])
+            if not m_id.startswith(prefix):
+                break
+            yield m_id, self.get_string(record[2], record[3])
+            position += 1
+
+    def iter_paths(self, prefix=''):
+        """Yield (relative path, id) pairs in order of the paths. If a prefix
+        is given, only paths starting with the prefix are returned"""
+        position = bisect.bisect_left(self.paths, prefix)
+        while position < self.nr_entries:
+            record = self.get_record(self.offset_path_table, position)
+            relpath = self.get_string(record[2], record[3])
+            if not relpath.startswith(prefix):
+                break
+            yield relpath, self.get_string(record[0], record[1])
+            position += 1
+
+    def close(self):
+        self.mm.close()
+
+
+class id2path_view(Mapping):
+    """Read-only dict-like view id -> absolute path on an id_map_index"""
+    def __init__(self, index, dr_root):
+        self.index = index
+        self.dr_root = dr_root
+
+    def __getitem__(self, m_id):
+        relpath = self.index.get_path(m_id)
+        if relpath is None:
+            raise KeyError(m_id)
+        return self.dr_root + os.sep + relpath
+
+    def __contains__(self, m_id):
+        return self.index.get_path(m_id) is not None
+
+    def __iter__(self):
+        for m_id, relpath in self.index.iter_items():
+            yield m_id
+
+    def __len__(self):
+        return self.index.nr_entries
+
+
+class path2id_view(Mapping):
+    """Read-only dict-like view absolute path -> id on an id_map_index"""
+    def __init__(self, index, dr_root):
+        self.index = index
+        self.dr_root = dr_root
+
+    def _relpath(self, path):
+        if not path.startswith(self.dr_root + os.sep):
+            return None
+        return path[len(self.dr_root) + 1:]
+
+    def __getitem__(self, path):
+        relpath = self._relpath(path)
+        m_id = None
+        if relpath is not None:
+            m_id = self.index.get_id(relpath)
+        if m_id is None:
+            raise KeyError(path)
+        return m_id
+
+    def __contains__(self, path):
+        relpath = self._relpath(path)
+        return relpath is not None and self.index.get_id(relpath) is not None
+
+    def __iter__(self):
+        for position in range(self.index.nr_entries):
+            yield self.dr_root + os.sep + self.index.paths[position]
+
+    def __len__(self):
+        return self.index.nr_entries
+
+    def iter_items_below(self, directory):
+        """Yield (absolute path, id) of all paths located below a directory,
+        using a binary search in the path table"""
+        relpath = self._relpath(directory)
+        if relpath is None:
+            return
+        for path, m_id in self.index.iter_paths(prefix=relpath + os.sep):
+            yield self.dr_root + os.sep + path, m_id
+
+
+class overlay_map(MutableMapping):
+    """Modifiable dict-like map on top of a read-only view, which stores
+    only the changes (added/replaced and removed keys), so that modifying a
+    few entries does not require a copy of the complete map"""
+    def __init__(self, base):
+        self.base = base
+        self.added = {}
+        self.removed = set()
+        self._size = len(base)
+
+    def __getitem__(self, key):
+        if key in self.added:
+            return self.added[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __contains__(self, key):
+        if key in self.added:
+            return True
+        return key not in self.removed and key in self.base
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._size += 1
+        self.added[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.added.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+        self._size -= 1
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.removed and key not in self.added:
+                yield key
+        yield from self.added
+
+    def __len__(self):
+        return self._size
+
+    def iter_items_below(self, directory):
+        """Yield (absolute path, id) of all paths located below a directory
+        (base: path2id_view)"""
+        for path, m_id in self.base.iter_items_below(directory):
+            if path not in self.removed and path not in self.added:
+                yield path, m_id
+        prefix = directory + os.sep
+        for path, m_id in self.added.items():
+            if path.startswith(prefix):
+                yield path, m_id
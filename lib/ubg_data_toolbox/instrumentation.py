@@ -0,0 +1,142 @@
+"""Counters and per-phase timings of tree operations
+
+The library counts the work done during a run in a set of process-wide
+counters:
+
+    directories_visited   directories listed while walking a data tree
+    stat_calls            explicit os.stat calls on files of the tree
+    metadata_files_parsed metadata.ini files parsed by configparser
+    parse_cache_hits      metadata.ini files taken from the parse cache
+    parse_cache_misses    metadata.ini files not found in the parse cache
+    checks_executed       directory checks run by dm_check_dirtree
+    bytes_copied          bytes copied by the copy engine
+    bytes_hashed          bytes read to compute checksums
+    bytes_compressed      bytes written to compressed archives
+    trees_scanned         data trees scanned to build their id maps
+
+In addition, the wall-clock time of phases (e.g., scan, merge, check, write)
+is accumulated with the phase() context manager:
+
+    >>> from ubg_data_toolbox import instrumentation
+    >>> with instrumentation.phase('scan'):
+    ...     m_dirs = list(find_measurement_directories('dr_data'))
+
+Console scripts log the report at the end of every run, print it with --stats
+and write it as JSON with --stats=FILE (see ubg_data_toolbox.dm_cli).
+"""
+import json
+import time
+import threading
+import contextlib
+
+COUNTERS = (
+    'directories_visited',
+    'stat_calls',
+    'metadata_files_parsed',
+    'parse_cache_hits',
+    'parse_cache_misses',
+    'checks_executed',
+    'bytes_copied',
+    'bytes_hashed',
+    'bytes_compressed',
+    'trees_scanned',
+)
+
+_lock = threading.Lock()
+_counters = dict.fromkeys(COUNTERS, 0)
+# name: [accumulated seconds, number of calls]
+_phases = {}
+
+
+def increment(name, value=1):
+    """Increase a counter by value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def add_counters(counters):
+    """Add a dict of counter values, e.g., the result of get_counters() of a
+    worker process"""
+    with _lock:
+        for name, value in counters.items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def get_counters():
+    with _lock:
+        return dict(_counters)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager that adds the wall-clock time of its body to the phase
+    name. Phases can be nested, e.g., a write phase within a merge phase, in
+    which case the time is accounted to both phases."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with _lock:
+            entry = _phases.setdefault(name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+
+
+def reset():
+    """Set all counters and phase timings to zero"""
+    with _lock:
+        _counters.clear()
+        _counters.update(dict.fromkeys(COUNTERS, 0))
+        _phases.clear()
+
+
+def get_report():
+    """Return all counters and phase timings
+
+    Returns
+    -------
+    report : dict
+        {'counters': {name: value}, 'phases': {name: {'seconds': float,
+        'calls': int}}}
+    """
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'phases': {
+                name: {'seconds': entry[0], 'calls': entry[1]}
+                for name, entry in _phases.items()
+            },
+        }
+
+
+def format_report(report=None):
+    """Return the report as a human readable table (str)"""
+    if report is None:
+        report = get_report()
+    lines = ['Counters:']
+    for name, value in report['counters'].items():
+        lines.append('    {:<24} {:>14}'.format(name, value))
+    if len(report['phases']) > 0:
+        lines.append('Phases:')
+        for name, entry in report['phases'].items():
+            lines.append('    {:<24} {:>12.3f} s {:>8} calls'.format(
+                name, entry['seconds'], entry['calls']))
+    return '\n'.join(lines)
+
+
+def write_report(filename, extra=None):
+    """Write the report to a JSON file
+
+    Parameters
+    ----------
+    filename : str
+        Output file
+    extra : dict|None, optional
+        Additional entries of the JSON object (e.g., script name, runtime)
+    """
+    report = get_report()
+    if extra is not None:
+        report.update(extra)
+    with open(filename, 'w') as fid:
+        json.dump(report, fid, indent=1)
@@ -0,0 +1,303 @@
+"""Typed, column-oriented metadata database of a data tree
+
+dm_gen_db collects the merged metadata of all measurements in one table (one
+row per measurement id, one column per metadata entry, named
+[section].[key]). The table is stored in .management/ in one of the following
+formats:
+
+    parquet   db.parquet (requires pyarrow or fastparquet)
+    feather   db.feather (requires pyarrow)
+    csv       db.csv, plus the column types in db.types.json; used if no
+              Arrow engine is available
+    pickle    db.pickle, the format of previous versions (all strings,
+              columns as (section, key) MultiIndex)
+
+Columns are converted to native types when writing, using the data types of
+the metadata entries (see ubg_data_toolbox.md_types): datetimes to
+datetime64 and numeric entries to floats. Entries such as method, survey type
+and site are stored as categoricals (see CATEGORY_COLUMNS). Entries that
+cannot be converted are stored as missing values (NaT/NaN). Lists (e.g.,
+keywords) are stored as strings.
+
+If a db.pickle exists, it is updated whenever the database is written in
+another format. Use load_database to read the most recently written
+database, e.g., only selected columns:
+
+    >>> from ubg_data_toolbox.md_database import load_database
+    >>> db = load_database('dr_data', columns=['general.datetime_start'])
+"""
+import os
+import json
+
+from ubg_data_toolbox.metadata_definitions import get_md_values
+import ubg_data_toolbox.md_types as md_types
+
+# (section, key) of columns stored as categoricals
+CATEGORY_COLUMNS = (
+    ('general', 'survey_type'),
+    ('general', 'method'),
+    ('general', 'completed'),
+    ('field', 'site'),
+    ('field', 'area'),
+    ('laboratory', 'site'),
+    ('device', 'device'),
+)
+# data types stored in the database, all others are stored as strings
+COLUMN_DATA_TYPES = {
+    'datetime': md_types.DATETIME_LONG,
+    'float': md_types.FLOAT,
+}
+
+FORMATS = ('parquet', 'feather', 'csv', 'pickle')
+# formats tried by load_database, in this order
+FILENAMES = {
+    'parquet': 'db.parquet',
+    'feather': 'db.feather',
+    'csv': 'db.csv',
+    'pickle': 'db.pickle',
+}
+CSV_TYPES_FILE = 'db.types.json'
+
+
+def get_arrow_engine():
+    """Return the name of an available parquet engine, or None"""
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return engine
+        except ImportError:
+            pass
+    return None
+
+
+def get_default_format():
+    if get_arrow_engine() is not None:
+        return 'parquet'
+    return 'csv'
+
+
+def get_database_directory(dr_root):
+    return dr_root + os.sep + '.management'
+
+
+def build_database(records):
+    """Build the database from the merged metadata of measurements
+
+    Parameters
+    ----------
+    records : iterable
+        One dict {'[section].[key]': value (str|None)} per measurement, must
+        contain 'general.id'
+
+    Returns
+    -------
+    db : pandas.DataFrame
+        All-string table, indexed by id
+    """
+    import pandas as pd
+
+    records = list(records)
+    db = pd.DataFrame.from_records(records)
+    if len(records) > 0:
+        db.index = db['general.id'].values
+    return db
+
+
+def convert_column(values, column_type):
+    """Convert a column of strings (pandas.Series) to the given type
+    (datetime, float, category or str)"""
+    if column_type == 'category':
+        return values.astype('category')
+    if column_type in COLUMN_DATA_TYPES:
+        return COLUMN_DATA_TYPES[column_type].parse_column(values)
+    return values
+
+
+def get_column_types(columns):
+    """Return the types of the given [section].[key] columns (datetime,
+    float, category or str), based on the data types of the metadata
+    entries"""
+    md_entries = get_md_values()
+    types = {}
+    for column in columns:
+        section, key = column.split('.', 1)
+        column_type = 'str'
+        if (section, key) in CATEGORY_COLUMNS:
+            column_type = 'category'
+        elif section in md_entries and key in md_entries[section]:
+            data_type = md_entries[section][key].data_type.name
+            if data_type in COLUMN_DATA_TYPES:
+                column_type = data_type
+        types[column] = column_type
+    return types
+
+
+def convert_types(db):
+    """Return a copy of the all-string database with typed columns"""
+    db = db.copy()
+    for column, column_type in get_column_types(db.columns).items():
+        if column_type != 'str':
+            db[column] = convert_column(db[column], column_type)
+    return db
+
+
+def flatten_columns(db):
+    """Convert (section, key) MultiIndex columns (db.pickle of previous
+    versions) to [section].[key]"""
+    if db.columns.nlevels > 1:
+        db = db.copy()
+        db.columns = ['.'.join(x) for x in db.columns]
+    return db
+
+
+def _write_file(db, directory, db_format):
+    """Write the database in one format, return the filename"""
+    filename = directory + os.sep + FILENAMES[db_format]
+    if db_format == 'pickle':
+        import pandas as pd
+        # format of previous versions: strings, MultiIndex columns
+        db_pickle = db.copy()
+        db_pickle.columns = pd.MultiIndex.from_tuples(
+            [tuple(x.split('.', 1)) for x in db.columns])
+        db_pickle.to_pickle(filename + '.tmp')
+    else:
+        typed = convert_types(db).reset_index(drop=True)
+        if db_format == 'parquet':
+            typed.to_parquet(filename + '.tmp', engine=get_arrow_engine())
+        elif db_format == 'feather':
+            typed.to_feather(filename + '.tmp')
+        else:
+            typed.to_csv(filename + '.tmp', index=False)
+            with open(directory + os.sep + CSV_TYPES_FILE, 'w') as fid:
+                json.dump(get_column_types(typed.columns), fid, indent=1)
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def write_database(db, dr_root, db_format=None, remove_other_formats=False):
+    """Write the database to the .management directory of a data tree
+
+    An existing db.pickle (the format of previous versions) is updated as
+    well, so that tools reading it directly keep working. Files of other
+    formats are left alone, unless remove_other_formats is True;
+    load_database uses the most recently written database.
+
+    Parameters
+    ----------
+    db : pandas.DataFrame
+        All-string database, see build_database
+    dr_root : str
+        Data root of the tree
+    db_format : None|str, optional
+        One of FORMATS, default: parquet if available, otherwise csv
+    remove_other_formats : bool, optional
+        Delete the database files of all other formats (including db.pickle)
+
+    Returns
+    -------
+    filename : str
+        Path of the written file
+    """
+    if db_format is None:
+        db_format = get_default_format()
+    assert db_format in FORMATS, 'unknown format: {}'.format(db_format)
+    directory = get_database_directory(dr_root)
+    os.makedirs(directory, exist_ok=True)
+
+    legacy_file = directory + os.sep + FILENAMES['pickle']
+    if db_format != 'pickle' and not remove_other_formats and \
+            os.path.isfile(legacy_file):
+        _write_file(db, directory, 'pickle')
+    # written last, so that it is the most recent database
+    filename = _write_file(db, directory, db_format)
+
+    if remove_other_formats:
+        for other_format, other_file in FILENAMES.items():
+            if other_format != db_format and os.path.isfile(
+                    directory + os.sep + other_file):
+                os.unlink(directory + os.sep + other_file)
+        if db_format != 'csv' and os.path.isfile(
+                directory + os.sep + CSV_TYPES_FILE):
+            os.unlink(directory + os.sep + CSV_TYPES_FILE)
+    return filename
+
+
+def find_database(dr_root):
+    """Return (format, filename) of the most recently written database of a
+    data tree, or (None, None)"""
+    directory = get_database_directory(dr_root)
+    found = []
+    for db_format in FORMATS:
+        filename = directory + os.sep + FILENAMES[db_format]
+        if os.path.isfile(filename):
+            found.append((os.stat(filename).st_mtime_ns, db_format, filename))
+    if len(found) == 0:
+        return None, None
+    # most recent first; for equal times, the order of FORMATS
+    found.sort(key=lambda x: (-x[0], FORMATS.index(x[1])))
+    return found[0][1], found[0][2]
+
+
+def load_database(dr_root, columns=None):
+    """Load the metadata database of a data tree
+
+    Parameters
+    ----------
+    dr_root : str
+        Data root of the tree
+    columns : None|list, optional
+        [section].[key] columns to load. Only these columns are read from
+        parquet and feather files. Default: all columns
+
+    Returns
+    -------
+    db : pandas.DataFrame
+        Database with [section].[key] columns, indexed by id
+    """
+    import pandas as pd
+
+    db_format, filename = find_database(dr_root)
+    if db_format is None:
+        raise IOError(
+            'No metadata database found in {}, run dm_gen_db first'.format(
+                get_database_directory(dr_root)))
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns)
+        if 'general.id' not in read_columns:
+            read_columns.append('general.id')
+
+    if db_format == 'pickle':
+        db = flatten_columns(pd.read_pickle(filename))
+        if read_columns is not None:
+            db = db[read_columns]
+    elif db_format == 'parquet':
+        db = pd.read_parquet(
+            filename, columns=read_columns, engine=get_arrow_engine())
+    elif db_format == 'feather':
+        db = pd.read_feather(filename, columns=read_columns)
+    else:
+        types_file = get_database_directory(dr_root) + os.sep + \
+            CSV_TYPES_FILE
+        types = {}
+        if os.path.isfile(types_file):
+            with open(types_file, 'r') as fid:
+                types = json.load(fid)
+        db = pd.read_csv(
+            filename, usecols=read_columns, dtype=str, keep_default_na=False,
+            na_values=[''],
+        )
+        for column in db.columns:
+            column_type = types.get(column, 'str')
+            if column_type == 'datetime':
+                db[column] = pd.to_datetime(
+                    db[column], format='ISO8601').astype('datetime64[ns]')
+            elif column_type != 'str':
+                db[column] = convert_column(db[column], column_type)
+
+    if db_format != 'pickle':
+        db.index = db['general.id'].values
+    if columns is not None:
+        db = db[list(columns)]
+    return db
@@ -0,0 +1,308 @@
+"""Metadata snapshots of a data tree and their comparison
+
+A snapshot stores the merged metadata of all measurements of a data tree at
+one point in time. Snapshots are gzip-compressed text files; after a header
+line (# followed by a JSON object), each line describes one measurement by
+four tab-separated fields:
+
+    key      JSON string, the measurement id (see get_snapshot_key)
+    hash     sha1 of the merged metadata
+    path     JSON string, measurement directory relative to the data root
+    metadata JSON object {"[section].[key]": value}
+
+Lines are sorted by key. Two snapshots can therefore be compared in one pass
+(merge join, see diff_snapshots), reading one line of each file at a time.
+Only the hashes are compared for most measurements: the metadata of a line
+are only decoded if the hashes differ.
+
+    >>> save_snapshot('dr_data')
+    'dr_data/.management/snapshots/md_20230415_133000_123456.jsonl.gz'
+    >>> old = read_snapshot(find_snapshots('dr_data')[-1])
+    >>> for change in diff_snapshots(old, get_tree_records('dr_data')):
+    ...     print(change.kind, change.key)
+"""
+import os
+import gzip
+import json
+import hashlib
+import datetime
+
+from ubg_data_toolbox.dirtree_nav import find_measurement_directories
+from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.metadata import _parse_metadata_file
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_SUFFIX = '.jsonl.gz'
+# key prefix of measurements without id
+NO_ID_PREFIX = 'path:'
+
+
+class snapshot_record(object):
+    """One measurement of a snapshot. The metadata are only decoded when
+    accessed"""
+    def __init__(self, key, md_hash, path, md_json=None, md=None):
+        self.key = key
+        self.hash = md_hash
+        self.path = path
+        self._md_json = md_json
+        self._md = md
+
+    @property
+    def md(self):
+        """Merged metadata {"[section].[key]": value}"""
+        if self._md is None:
+            self._md = json.loads(self._md_json)
+        return self._md
+
+    def to_line(self):
+        if self._md_json is None:
+            self._md_json = json.dumps(
+                self._md, sort_keys=True, separators=(',', ':'))
+        return '{}\t{}\t{}\t{}\n'.format(
+            json.dumps(self.key), self.hash, json.dumps(self.path),
+            self._md_json)
+
+    @classmethod
+    def from_line(cls, line):
+        key, md_hash, path, md_json = line.rstrip('\n').split('\t', 3)
+        return cls(json.loads(key), md_hash, json.loads(path), md_json)
+
+
+class change(object):
+    """Difference of one measurement between two snapshots
+
+    Attributes
+    ----------
+    kind : str
+        added, removed, changed (metadata changed) or moved (only the path
+        changed)
+    key : str
+        Key of the measurement
+    old, new : None|snapshot_record
+    entries : list
+        (entry, old value, new value) of all changed entries. Values of added
+        or removed entries are None.
+    """
+    def __init__(self, kind, key, old=None, new=None, entries=None):
+        self.kind = kind
+        self.key = key
+        self.old = old
+        self.new = new
+        self.entries = [] if entries is None else entries
+
+
+def get_metadata_hash(md):
+    """Return the sha1 hash of merged metadata {"[section].[key]": value}"""
+    return hashlib.sha1(json.dumps(
+        md, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')).hexdigest()
+
+
+def get_merged_entries(m_dir):
+    """Return the merged metadata of a measurement as flat dict
+    {"[section].[key]": value}, including custom entries. Entries of later
+    metadata files override earlier ones (as in metadata_chain)."""
+    md = {}
+    for filename in metadata_chain(m_dir).get_available_metadata_files():
+        for section, entries in _parse_metadata_file(filename).items():
+            if section == 'DEFAULT':
+                continue
+            for key, value in entries.items():
+                md[section + '.' + key] = value
+    return md
+
+
+def get_snapshot_key(md, path):
+    """Return the key of a measurement: its id, or NO_ID_PREFIX + path for
+    measurements without id"""
+    m_id = md.get('general.id', '').strip()
+    if m_id == '':
+        return NO_ID_PREFIX + path
+    return m_id
+
+
+def get_tree_records(dr_root):
+    """Return the snapshot records of all measurements of a data tree,
+    sorted by key
+
+    Ids used by multiple measurements are made unique by appending the path
+    to the key of each of these measurements.
+
+    The tree is walked in the order of the paths, not of the keys (ids):
+    unlike the records of a saved snapshot, the records of the current tree
+    are therefore held in memory and sorted (O(n log n)). Only the encoded
+    metadata are kept per record.
+    """
+    records = []
+    for m_dir in find_measurement_directories(dr_root):
+        md = get_merged_entries(m_dir)
+        path = os.path.relpath(m_dir, dr_root)
+        md_json = json.dumps(md, sort_keys=True, separators=(',', ':'))
+        records.append(snapshot_record(
+            get_snapshot_key(md, path),
+            hashlib.sha1(md_json.encode('utf-8')).hexdigest(),
+            path,
+            md_json=md_json,
+        ))
+
+    counts = {}
+    for record in records:
+        counts[record.key] = counts.get(record.key, 0) + 1
+    for record in records:
+        if counts[record.key] > 1:
+            record.key = record.key + ' ' + record.path
+    records.sort(key=lambda x: x.key)
+    return records
+
+
+def get_snapshot_directory(dr_root):
+    return dr_root + os.sep + '.management' + os.sep + SNAPSHOT_DIR
+
+
+def write_snapshot(records, filename, dr_root=None):
+    """Write snapshot records (sorted by key) to a file"""
+    records = list(records)
+    header = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'created': datetime.datetime.now().isoformat(),
+        'nr_measurements': len(records),
+    }
+    if dr_root is not None:
+        header['dr_root'] = os.path.abspath(dr_root)
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    with gzip.open(filename + '.tmp', 'wt', encoding='utf-8') as fid:
+        fid.write('#' + json.dumps(header) + '\n')
+        for record in records:
+            fid.write(record.to_line())
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def _get_snapshot_filename(dr_root):
+    """Return a new file name md_[date]_[time]_[microseconds].jsonl.gz in
+    the snapshot directory. The names sort chronologically; a counter is
+    appended if the file already exists"""
+    base = get_snapshot_directory(dr_root) + os.sep + 'md_{}'.format(
+        datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+    filename = base + SNAPSHOT_SUFFIX
+    counter = 0
+    while os.path.exists(filename):
+        counter += 1
+        filename = '{}_{}{}'.format(base, counter, SNAPSHOT_SUFFIX)
+    return filename
+
+
+def save_snapshot(dr_root, filename=None):
+    """Save a snapshot of the current metadata of a data tree
+
+    Parameters
+    ----------
+    dr_root : str
+        Data root of the tree
+    filename : None|str, optional
+        Output file. Default: md_[date]_[time]_[microseconds].jsonl.gz in
+        .management/snapshots/ of the data tree
+
+    Returns
+    -------
+    filename : str
+    """
+    if filename is None:
+        filename = _get_snapshot_filename(dr_root)
+    return write_snapshot(get_tree_records(dr_root), filename, dr_root)
+
+
+def find_snapshots(dr_root):
+    """Return the saved snapshots of a data tree, oldest first"""
+    directory = get_snapshot_directory(dr_root)
+    if not os.path.isdir(directory):
+        return []
+    return [
+        directory + os.sep + x for x in sorted(os.listdir(directory))
+        if x.startswith('md_') and x.endswith(SNAPSHOT_SUFFIX)
+    ]
+
+
+def read_snapshot_header(filename):
+    with gzip.open(filename, 'rt', encoding='utf-8') as fid:
+        line = fid.readline()
+    if not line.startswith('#'):
+        raise IOError('{} is not a metadata snapshot'.format(filename))
+    header = json.loads(line[1:])
+    if header.get('snapshot_version', None) != SNAPSHOT_VERSION:
+        raise IOError('Unsupported snapshot version in {}'.format(filename))
+    return header
+
+
+def read_snapshot(filename):
+    """Read the records of a snapshot file, one line at a time
+
+    Yields
+    ------
+    record : snapshot_record
+    """
+    read_snapshot_header(filename)
+    with gzip.open(filename, 'rt', encoding='utf-8') as fid:
+        fid.readline()
+        for line in fid:
+            yield snapshot_record.from_line(line)
+
+
+def _diff_entries(old_md, new_md):
+    entries = []
+    for entry in sorted(set(old_md) | set(new_md)):
+        old_value = old_md.get(entry, None)
+        new_value = new_md.get(entry, None)
+        if old_value != new_value:
+            entries.append((entry, old_value, new_value))
+    return entries
+
+
+def diff_snapshots(old_records, new_records):
+    """Compare two sequences of snapshot records, both sorted by key
+
+    The sequences are only iterated once (merge join), so that the
+    comparison requires linear time and constant memory (in addition to the
+    memory of the sequences, see get_tree_records).
+
+    Yields
+    ------
+    change : change
+        One object per added, removed, changed or moved measurement. The
+        changes are yielded in the order of the keys.
+    """
+    old_iter = iter(old_records)
+    new_iter = iter(new_records)
+    old = next(old_iter, None)
+    new = next(new_iter, None)
+    last_keys = [None, None]
+
+    def _check_order(record, index):
+        if last_keys[index] is not None and record.key <= last_keys[index]:
+            raise ValueError(
+                'Snapshot records are not sorted by key: {} after {}'.format(
+                    record.key, last_keys[index]))
+        last_keys[index] = record.key
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.key < new.key):
+            _check_order(old, 0)
+            yield change('removed', old.key, old=old)
+            old = next(old_iter, None)
+        elif old is None or new.key < old.key:
+            _check_order(new, 1)
+            yield change('added', new.key, new=new)
+            new = next(new_iter, None)
+        else:
+            _check_order(old, 0)
+            _check_order(new, 1)
+            if old.hash != new.hash:
+                yield change(
+                    'changed', old.key, old, new,
+                    _diff_entries(old.md, new.md))
+            elif old.path != new.path:
+                yield change('moved', old.key, old, new)
+            old = next(old_iter, None)
+            new = next(new_iter, None)
@@ -0,0 +1,203 @@
+"""Data types of metadata entries
+
+Metadata are stored as strings in the metadata.ini files. Each metadata entry
+(ubg_data_toolbox.metadata_definitions.md_entry) has a data type, which
+converts between the string representation and the native Python value:
+
+    >>> md_types.DATETIME.parse('20230415_1330')
+    datetime.datetime(2023, 4, 15, 13, 30)
+    >>> md_types.KEYWORDS.parse('ERT, monitoring,  Spiekeroog')
+    ['ERT', 'monitoring', 'Spiekeroog']
+
+In addition, parse_column converts a complete column of values at once
+(pandas.Series of strings), e.g., for the metadata database.
+"""
+import re
+import datetime
+
+
+class string_type(object):
+    """Plain strings (the default data type)"""
+    name = 'str'
+
+    def parse(self, value):
+        """Convert a (non-empty) string to the native value. Raises a
+        ValueError for invalid strings"""
+        return value
+
+    def serialize(self, value):
+        """Convert a native value to its string representation"""
+        return str(value)
+
+    def parse_column(self, values):
+        """Convert a pandas.Series of strings. Invalid and empty values are
+        converted to missing values (None/NaN/NaT)"""
+        return values
+
+
+class float_type(string_type):
+    """Floating point numbers"""
+    name = 'float'
+
+    def parse(self, value):
+        return float(value)
+
+    def serialize(self, value):
+        return repr(float(value))
+
+    def parse_column(self, values):
+        import pandas as pd
+        return pd.to_numeric(values, errors='coerce').astype(float)
+
+
+class datetime_type(string_type):
+    """Datetimes in one of multiple formats, e.g., YYYYmmdd_HHMM"""
+    name = 'datetime'
+
+    def __init__(self, formats):
+        """
+        Parameters
+        ----------
+        formats : tuple
+            Allowed strptime formats. The first format is used to serialize
+            dates without time of day, the last format is used otherwise.
+        """
+        self.formats = formats
+
+    def parse(self, value):
+        for dt_format in self.formats:
+            try:
+                return datetime.datetime.strptime(value, dt_format)
+            except ValueError:
+                pass
+        raise ValueError(
+            '"{}" does not match any of the formats {}'.format(
+                value, ', '.join(self.formats)))
+
+    def serialize(self, value):
+        if value.time() == datetime.time(0, 0):
+            return value.strftime(self.formats[0])
+        return value.strftime(self.formats[-1])
+
+    def parse_column(self, values):
+        import pandas as pd
+        result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        for dt_format in self.formats:
+            missing = result.isna()
+            if not missing.any():
+                break
+            result[missing] = pd.to_datetime(
+                values[missing], format=dt_format, errors='coerce'
+            ).astype('datetime64[ns]')
+        return result
+
+
+class list_type(string_type):
+    """Lists of strings, e.g., keywords"""
+    name = 'list'
+
+    def __init__(self, separator=','):
+        """
+        Parameters
+        ----------
+        separator : str
+            Separator of the list items when serializing. When parsing, line
+            breaks are always accepted as separators, too.
+        """
+        self.separator = separator
+        self._split = re.compile('[{}\n]'.format(re.escape(separator)))
+
+    def parse(self, value):
+        return [x.strip() for x in self._split.split(value) if x.strip()]
+
+    def serialize(self, value):
+        if self.separator == '\n':
+            return '\n'.join(value)
+        return (self.separator + ' ').join(value)
+
+    def parse_column(self, values):
+        return values.map(
+            lambda x: self.parse(x) if isinstance(x, str) else None)
+
+
+class array_type(string_type):
+    """Numerical arrays, one row per line (e.g., electrode positions).
+    Columns can be separated by whitespace, commas or semicolons; empty lines
+    and lines starting with # are ignored."""
+    name = 'array'
+
+    def __init__(self, nr_columns=None):
+        """
+        Parameters
+        ----------
+        nr_columns : None|tuple, optional
+            Allowed numbers of columns, e.g., (2, 3)
+        """
+        self.nr_columns = nr_columns
+        self._split = re.compile(r'[\s,;]+')
+
+    def parse(self, value):
+        import numpy as np
+        rows = []
+        for line in value.splitlines():
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            rows.append(self._split.split(line))
+        if len(rows) == 0:
+            raise ValueError('no data rows')
+        lengths = set(len(x) for x in rows)
+        if len(lengths) != 1:
+            raise ValueError(
+                'rows have different numbers of columns: {}'.format(
+                    sorted(lengths)))
+        if self.nr_columns is not None and \
+                len(rows[0]) not in self.nr_columns:
+            raise ValueError('{} columns, expected: {}'.format(
+                len(rows[0]), ' or '.join(str(x) for x in self.nr_columns)))
+        return np.array(rows, dtype=float)
+
+    def serialize(self, value):
+        return '\n'.join(
+            ' '.join(repr(float(x)) for x in row) for row in value)
+
+    def parse_column(self, values):
+        def _parse(value):
+            try:
+                return self.parse(value)
+            except (ValueError, TypeError, AttributeError):
+                return None
+        return values.map(_parse)
+
+
+STRING = string_type()
+FLOAT = float_type()
+# see also dir_level_checks._check_metadata_datetime_is_correct_format
+DATETIME = datetime_type((
+    '%Y%m%d',
+    '%Y%m%d_%H%M',
+    '%Y%m%d_%H%M_%S',
+))
+# survey/experiment start and end: yyyymmdd hh:mm:ss
+DATETIME_LONG = datetime_type((
+    '%Y%m%d',
+    '%Y%m%d_%H%M',
+    '%Y%m%d_%H%M_%S',
+    '%Y%m%d %H:%M:%S',
+))
+KEYWORDS = list_type(',')
+LINES = list_type('\n')
+# (x, z) or (x, y, z) coordinates
+POSITIONS = array_type(nr_columns=(2, 3))
+
+
+def get_type(data_type):
+    """Return the data type object of a data type given as md_types object or
+    Python type (str, float)"""
+    if isinstance(data_type, string_type):
+        return data_type
+    if data_type is None or data_type is str:
+        return STRING
+    if data_type is float:
+        return FLOAT
+    raise Exception('Unsupported data type: {}'.format(data_type))
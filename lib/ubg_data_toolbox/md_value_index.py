@@ -0,0 +1,273 @@
+"""Index of all metadata values used in a data tree
+
+For each metadata entry ([section].[key]), the index counts how often each
+value is used in the metadata.ini files of a data tree. It is used to provide
+frequency-ranked auto-completion during interactive metadata input (see
+ubg_data_toolbox.dm_metadata_user_input).
+
+The per-file contributions are stored in .management/md_value_index.cache.
+Upon refresh, only metadata.ini files whose size or modification time changed
+are parsed again.
+"""
+import os
+import json
+import bisect
+import logging
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.metadata import _get_configparser
+from ubg_data_toolbox.dm_file_utils import file_lock
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
+
+
+class md_value_index(object):
+    """Frequency-ranked index of metadata values of a data tree
+
+    Examples
+    --------
+    >>> index = md_value_index('dr_data')
+    >>> index.refresh()
+    >>> index.complete('general.person_responsible', 'ma')
+    [('Max Weigand', 120), ('Maria Mustermann', 3)]
+    """
+    def __init__(self, datatree, loglevel=logging.INFO):
+        """
+        Parameters
+        ----------
+        datatree : str
+            Path to the data tree, or any directory within it
+        loglevel : int, optional
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(loglevel)
+
+        self.dr_root = find_data_root(os.path.abspath(datatree))
+        assert self.dr_root is not None, 'No data root found: {}'.format(
+            datatree)
+        self.cachefile = self.dr_root + os.sep + '.management' + os.sep + \
+            'md_value_index.cache'
+
+        # relative path of metadata.ini: [mtime_ns, size, {key: [values]}]
+        self.files = {}
+        # key: {value: count}
+        self.counts = {}
+        # key: lookup structures, computed on demand (see _get_lookup)
+        self._lookup = {}
+
+    def _add_contribution(self, contribution, sign):
+        for key, values in contribution.items():
+            key_counts = self.counts.setdefault(key, {})
+            for value in values:
+                count = key_counts.get(value, 0) + sign
+                if count > 0:
+                    key_counts[value] = count
+                else:
+                    key_counts.pop(value, None)
+            self._lookup.pop(key, None)
+
+    def load(self):
+        """Load the index from the cache file, if present"""
+        self.files = {}
+        self.counts = {}
+        self._lookup = {}
+        if not os.path.isfile(self.cachefile):
+            return
+        try:
+            with file_lock(self.cachefile, shared=True):
+                with open(self.cachefile, 'r') as fid:
+                    data = json.load(fid)
+        except json.JSONDecodeError:
+            self.logger.warning(
+                'Ignoring corrupted cache file: {}'.format(self.cachefile))
+            return
+        if data.get('version', None) != 1:
+            return
+        self.files = data['files']
+        for mtime_ns, size, contribution in self.files.values():
+            self._add_contribution(contribution, 1)
+
+    def save(self):
+        with file_lock(self.cachefile):
+            atomic_write_json(
+                self.cachefile,
+                {'version': 1, 'files': self.files},
+            )
+
+    @staticmethod
+    def _parse_file(filename):
+        """Return all single-line values of a metadata.ini file as a dict
+        [section].[key]: [value]"""
+        config = _get_configparser()
+        try:
+            config.read(filename)
+        except Exception:
+            # broken files are reported by dm_check_dirtree, not here
+            return {}
+        contribution = {}
+        for section in config.sections():
+            for key, value in config[section].items():
+                value = value.strip()
+                if value == '' or '\n' in value:
+                    continue
+                contribution['{}.{}'.format(section, key)] = [value]
+        return contribution
+
+    def _scan(self):
+        """Yield (relative path, stat result) of all metadata.ini files"""
+        for root, dirs, files in os.walk(self.dr_root):
+            dirs[:] = sorted(x for x in dirs if not x.startswith('.'))
+            if 'metadata.ini' in files:
+                filename = root + os.sep + 'metadata.ini'
+                yield os.path.relpath(filename, self.dr_root), os.stat(
+                    filename)
+
+    def refresh(self, save=True):
+        """Bring the index up to date with the data tree
+
+        The cache file is loaded (if not done yet), and only new or changed
+        metadata.ini files are parsed.
+
+        Returns
+        -------
+        nr_parsed : int
+            Number of parsed metadata.ini files
+        """
+        if len(self.files) == 0:
+            self.load()
+        nr_parsed = 0
+        found = set()
+        for relpath, stat in self._scan():
+            found.add(relpath)
+            old = self.files.get(relpath, None)
+            if old is not None and old[0] == stat.st_mtime_ns and \
+                    old[1] == stat.st_size:
+                continue
+            if old is not None:
+                self._add_contribution(old[2], -1)
+            contribution = self._parse_file(self.dr_root + os.sep + relpath)
+            self._add_contribution(contribution, 1)
+            self.files[relpath] = [
+                stat.st_mtime_ns, stat.st_size, contribution]
+            nr_parsed += 1
+
+        removed = set(self.files.keys()) - found
+        for relpath in removed:
+            self._add_contribution(self.files.pop(relpath)[2], -1)
+
+        self.logger.debug(
+            'md value index: {} files, {} parsed, {} removed'.format(
+                len(self.files), nr_parsed, len(removed)))
+        if save and (nr_parsed > 0 or len(removed) > 0):
+            self.save()
+        return nr_parsed
+
+    def _get_lookup(self, key):
+        """Return the lookup structures of a key:
+
+            * values sorted by their lower-case representation, together with
+              the sorted lower-case keys (for prefix searches using bisect)
+            * values sorted by decreasing frequency
+            * character masks of the values sorted by frequency (used to
+              quickly exclude values for fuzzy matching)
+        """
+        lookup = self._lookup.get(key, None)
+        if lookup is None:
+            import numpy as np
+            key_counts = self.counts.get(key, {})
+            by_name = sorted(key_counts.keys(), key=str.lower)
+            by_frequency = sorted(
+                key_counts.keys(), key=lambda x: -key_counts[x])
+            lookup = (
+                [x.lower() for x in by_name],
+                by_name,
+                by_frequency,
+                np.array(
+                    [_character_mask(x.lower()) for x in by_frequency],
+                    dtype=np.uint64,
+                ),
+            )
+            self._lookup[key] = lookup
+        return lookup
+
+    def get_values(self, key, limit=None):
+        """Return the values of a key, most frequent first"""
+        return self._get_lookup(key)[2][0:limit]
+
+    def get_count(self, key, value):
+        return self.counts.get(key, {}).get(value, 0)
+
+    def complete(self, key, text, limit=20, fuzzy=True):
+        """Return completions for a given input text
+
+        Values starting with the text (case insensitive) are returned first,
+        ordered by decreasing frequency. If fewer than limit values are found,
+        values containing the characters of the text in the same order (fuzzy
+        matches) are appended.
+
+        Parameters
+        ----------
+        key : str
+            [section].[key]
+        text : str
+            Input text
+        limit : int, optional
+            Maximum number of returned values
+        fuzzy : bool, optional
+            Also return fuzzy matches
+
+        Returns
+        -------
+        completions : list of (value, count) tuples
+        """
+        lower_keys, by_name, by_frequency, masks = self._get_lookup(key)
+        key_counts = self.counts.get(key, {})
+        text = text.lower()
+
+        start = bisect.bisect_left(lower_keys, text)
+        end = bisect.bisect_right(lower_keys, text + '\uffff', lo=start)
+        if end - start <= 4 * limit:
+            matches = sorted(
+                by_name[start:end], key=lambda x: -key_counts[x])[0:limit]
+        else:
+            # many candidates: walk the values in order of frequency instead
+            matches = []
+            for value in by_frequency:
+                if value.lower().startswith(text):
+                    matches.append(value)
+                    if len(matches) == limit:
+                        break
+
+        if fuzzy and len(matches) < limit and text != '':
+            found = set(matches)
+            # only values containing all characters of the text can match
+            import numpy as np
+            text_mask = np.uint64(_character_mask(text))
+            candidates = np.nonzero((masks & text_mask) == text_mask)[0]
+            for index in candidates:
+                value = by_frequency[index]
+                if value in found:
+                    continue
+                if _is_subsequence(text, value.lower()):
+                    matches.append(value)
+                    if len(matches) == limit:
+                        break
+
+        return [(x, key_counts[x]) for x in matches]
+
+
+def _character_mask(text):
+    """Return a 64 bit mask of the characters contained in a text"""
+    mask = 0
+    for character in text:
+        mask |= 1 << (ord(character) % 64)
+    return mask
+
+
+def _is_subsequence(text, value):
+    """Check if all characters of text appear in value, in the same order"""
+    position = 0
+    for character in text:
+        position = value.find(character, position) + 1
+        if position == 0:
+            return False
+    return True
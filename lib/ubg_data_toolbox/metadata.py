@@ -7,6 +7,12 @@ import configparser
 from ubg_data_toolbox.metadata_definitions import get_md_values
 from ubg_data_toolbox.metadata_definitions import md_entry
 from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox import instrumentation
+
+# maximum number of parsed metadata.ini files kept in memory
+PARSE_CACHE_SIZE = 10000
+# (filename, mtime_ns, size): {section: {key: value}}
+_parse_cache = {}
 
 
 def _get_configparser():
@@ -16,6 +22,45 @@ def _get_configparser():
     )
 
 
+def _parse_metadata_file(filename):
+    """Parse one metadata.ini file and return its content as a nested dict
+    {section: {key: value}}.
+
+    Metadata files of higher directory levels are shared by many
+    measurements, so the parsed content is cached per process, keyed by
+    filename, modification time and size of the file. Missing files are
+    ignored (as by configparser.ConfigParser.read).
+    """
+    instrumentation.increment('stat_calls')
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return {}
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    content = _parse_cache.get(key, None)
+    if content is not None:
+        instrumentation.increment('parse_cache_hits')
+        return content
+    instrumentation.increment('parse_cache_misses')
+
+    config = _get_configparser()
+    config.read(filename)
+    instrumentation.increment('metadata_files_parsed')
+    content = {}
+    if len(config.defaults()) > 0:
+        content[config.default_section] = dict(config.defaults())
+    for section in config.sections():
+        content[section] = {
+            key: config.get(section, key, raw=True)
+            for key in config.options(section)
+        }
+
+    if len(_parse_cache) >= PARSE_CACHE_SIZE:
+        _parse_cache.clear()
+    _parse_cache[key] = content
+    return content
+
+
 def merge_md_dicts(md1, md2):
     """
     Merge two md_dicts by copying all entries from md2 into md1
@@ -96,12 +141,31 @@ class metadata_chain(object):
                 md_files.append(filename)
         return md_files
 
+    def get_merged_config(self):
+        """Return the merged content of all metadata files of the chain as
+        configparser object (strings), merged in the same order as
+        get_merged_metadata"""
+        return self._import_metadata_files(
+            self.get_available_metadata_files())
+
     def get_merged_metadata(self):
-        filenames = self.get_available_metadata_files()
-        config_raw = self._import_metadata_files(filenames)
+        config_raw = self.get_merged_config()
         metadata_tree = self._import_metadata_files_to_md_dict(config_raw)
         return metadata_tree
 
+    def get_electrode_positions(self, mmap=True):
+        """Return the [geoelectrics] electrode_positions of the chain as
+        numpy array, or None if not defined. The parsed array is cached in
+        the .management directory and returned as read-only memory map, see
+        ubg_data_toolbox.electrode_positions"""
+        from ubg_data_toolbox import electrode_positions
+        source = electrode_positions.find_definition(
+            self.get_available_metadata_files())
+        if source is None:
+            return None
+        return electrode_positions.load_electrode_positions(
+            source, mmap=mmap)
+
     def _import_metadata_files(self, filenames=None, debug=False):
         """merge the metafiles provided in filenames.
 
@@ -126,7 +190,7 @@ class metadata_chain(object):
                     'Loading filename',
                     os.path.relpath(filename, os.path.dirname(dataroot))
                 )
-            config.read(str(filename))
+            config.read_dict(_parse_metadata_file(str(filename)))
 
         return config
 
@@ -206,7 +270,7 @@ class metadata_manager(object):
 
         # read in config files
         for filename in filenames:
-            config.read(str(filename))
+            config.read_dict(_parse_metadata_file(str(filename)))
 
         return config
 
@@ -335,7 +399,7 @@ class metadata_manager(object):
     def import_metafile(self, filename):
         config = _get_configparser()
         if filename is not None:
-            config.read(str(filename))
+            config.read_dict(_parse_metadata_file(str(filename)))
         return config
 
 
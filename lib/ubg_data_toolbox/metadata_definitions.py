@@ -6,6 +6,7 @@ import os
 import configparser
 
 import ubg_data_toolbox.dir_levels as dir_levels
+import ubg_data_toolbox.md_types as md_types
 
 
 class colors:
@@ -109,7 +110,9 @@ class md_entry(object):
         #     one entry means that this plevel is used in both field and lab
         #     two entries correspond to [field, lab] entries
         self.plevel = kwargs.get('plevel', None)
-        self.data_type = str
+        # converts the value (str) to its native type and back, see
+        # ubg_data_toolbox.md_types
+        self.data_type = md_types.get_type(kwargs.get('data_type', str))
         # sometime we want to restrict possible values
         self.allowed_values = kwargs.get('allowed_values', None)
         # this should be a dict or None
@@ -123,6 +126,7 @@ class md_entry(object):
         self.autocomplete = kwargs.get('autocomplete', None)
         # this variable is used to store actual values when we construct
         # meta data
+        self._typed_value = None
         self.value = kwargs.get('value', None)
         # This setting can be used to indicate a newly, on-the-fly created
         # metadata set. This can happen if existing metadata files are imported
@@ -130,6 +134,51 @@ class md_entry(object):
         # with new keys/sections
         self.is_extra = kwargs.get('is_extra', False)
 
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        # the typed value is converted again on next access
+        self._typed_value = None
+
+    @property
+    def typed_value(self):
+        """The value converted to the data type of the entry (None for empty
+        entries). The conversion is done once and cached until the value
+        changes. Raises a ValueError if the value cannot be converted."""
+        if self._typed_value is None:
+            if self.is_empty():
+                return None
+            try:
+                self._typed_value = (
+                    True, self.data_type.parse(self._value))
+            except ValueError as e:
+                self._typed_value = (False, e)
+        valid, result = self._typed_value
+        if not valid:
+            raise ValueError('Invalid value of {}: {}'.format(
+                self.name, result))
+        return result
+
+    @typed_value.setter
+    def typed_value(self, typed_value):
+        if typed_value is None:
+            self.value = None
+        else:
+            self.value = self.data_type.serialize(typed_value)
+
+    def is_valid(self):
+        """Return True if the entry is empty or its value can be converted to
+        the data type of the entry"""
+        try:
+            self.typed_value
+        except ValueError:
+            return False
+        return True
+
     def is_empty(self):
         # Return True if the value is None or ''
         if self.value is None or self.value == '':
@@ -282,7 +331,7 @@ def get_md_values():
         )),
         plevel=[
             dir_levels.datetime_group_field, dir_levels.datetime_group_lab],
-        data_type=str,
+        data_type=md_types.DATETIME,
         allowed_values=None,
     )
 
@@ -389,7 +438,7 @@ def get_md_values():
             'e.g. Maximilian Weigand (mweigand@geo.uni-bonn.de)'
         )),
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.KEYWORDS,
         allowed_values=None,
     )
 
@@ -405,7 +454,7 @@ def get_md_values():
             'Format: yyyymmdd hh:mm:ss'
         )),
         plevel=[dir_levels.datetime_group_field],
-        data_type=str,
+        data_type=md_types.DATETIME_LONG,
         allowed_values=None,
         conditions={
             md_survey_type: 'field',
@@ -424,7 +473,7 @@ def get_md_values():
             'Format: yyyymmdd hh:mm:ss (same as survey_start)'
         )),
         plevel=[dir_levels.datetime_group_field],
-        data_type=str,
+        data_type=md_types.DATETIME_LONG,
         allowed_values=None,
         conditions={
             md_survey_type: 'field',
@@ -443,7 +492,7 @@ def get_md_values():
             'Format: yyyymmdd hh:mm:ss'
         )),
         plevel=[dir_levels.datetime_group_lab],
-        data_type=str,
+        data_type=md_types.DATETIME_LONG,
         allowed_values=None,
         conditions={
             md_survey_type: 'laboratory',
@@ -492,7 +541,7 @@ def get_md_values():
             'Format: yyyymmdd hh:mm:ss (same as experiment_start)'
         )),
         plevel=[dir_levels.datetime_group_lab],
-        data_type=str,
+        data_type=md_types.DATETIME_LONG,
         allowed_values=None,
         conditions={
             md_survey_type: 'laboratory',
@@ -509,7 +558,7 @@ def get_md_values():
         description='Ending datetime of the measurement/measurements',
         plevel=[
             dir_levels.datetime_group_field, dir_levels.datetime_group_lab],
-        data_type=str,
+        data_type=md_types.DATETIME,
         allowed_values=None,
     )
 
@@ -601,7 +650,7 @@ def get_md_values():
         dublin_core='subject',
         description='Keywords, separated by comma.',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.KEYWORDS,
         allowed_values=None,
     )
 
@@ -651,7 +700,7 @@ def get_md_values():
         dublin_core='references',
         description='',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.LINES,
         allowed_values=None,
     )
 
@@ -663,7 +712,7 @@ def get_md_values():
         dublin_core=None,
         description='?',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.LINES,
         allowed_values=None,
     )
 
@@ -786,7 +835,7 @@ def get_md_values():
         dublin_core=None,
         description='Porosity of sample material',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.FLOAT,
         allowed_values=None,
         conditions={
             md_survey_type: 'laboratory',
@@ -801,7 +850,7 @@ def get_md_values():
         dublin_core=None,
         description='Permeability of sample material',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.FLOAT,
         allowed_values=None,
         conditions={
             md_survey_type: 'laboratory',
@@ -818,7 +867,7 @@ def get_md_values():
         dublin_core=None,
         description='Electrode spacing',
         plevel=[dir_levels.measurement_field, dir_levels.measurement_lab],
-        data_type=str,
+        data_type=md_types.FLOAT,
         allowed_values=None,
     )
 
@@ -854,7 +903,7 @@ def get_md_values():
             'to yield these coordinates',
         )),
         plevel=[dir_levels.measurement_field, ],
-        data_type=str,
+        data_type=md_types.POSITIONS,
         allowed_values=None,
         conditions={
             md_survey_type: 'field',
@@ -937,6 +986,62 @@ def get_empty_metadata_tree():
     return md_tree
 
 
+def get_missing_required_entries(md):
+    """Find all required entries that are missing or empty, honoring the
+    survey type and the conditions of the individual entries
+
+    Parameters
+    ----------
+    md : metadata_tree
+        Metadata to check. The entry [general] survey_type must be set to
+        either 'field' or 'laboratory'
+
+    Returns
+    -------
+    missing : list of (section, key, reason) tuples
+        reason is either 'missing' (the value is None, i.e., the entry is not
+        present) or 'empty'
+    """
+    survey_type = md['general']['survey_type'].value
+    assert survey_type in ['field', 'laboratory'], \
+        "metadata.ini: [general] survey_type must be 'field' or 'laboratory'"
+
+    # later we need to check if a given entry is required for this survey_type
+    check_key = 'required_{}'.format(
+        {
+            'field': 'field',
+            'laboratory': 'lab',
+        }[survey_type]
+    )
+
+    missing = []
+    for section in md.keys():
+        for key, item in md[section].items():
+            # is this item required
+            if not getattr(item, check_key):
+                continue
+            # now check if there are conditions to be met
+            if item.conditions is not None:
+                all_met = True
+                for cond_obj, condition in item.conditions.items():
+                    # check if this condition is met
+                    if isinstance(condition, tuple):
+                        test_result = cond_obj.value in condition
+                    else:
+                        test_result = cond_obj.value == condition
+                    all_met = all_met & test_result
+                if not all_met:
+                    continue
+            # if .value is None, this means we do not have this entry in
+            # the metadata.ini file
+            if item.value is None:
+                missing.append((section, key, 'missing'))
+            # check if it is empty
+            elif item.value == '':
+                missing.append((section, key, 'empty'))
+    return missing
+
+
 def export_metadata_to_latex():
     """Export the metadata structure as a Latex table
 
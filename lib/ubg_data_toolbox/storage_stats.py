@@ -0,0 +1,309 @@
+"""Storage statistics (number of files and bytes) of a data tree
+
+Sizes and file counts are computed bottom-up for every directory of a data
+tree and aggregated along the levels of the directory structure
+(ubg_data_toolbox.dirtree.tree), e.g., per theme complex, site, method or
+measurement.
+
+The tree is traversed in one pass, breadth first, listing the directories of
+each depth in parallel (os.scandir). For each directory, the number and size
+of the files directly located in it and the names of its subdirectories are
+stored in .management/storage_stats.cache, together with the modification
+time of the directory. Upon the next refresh, directories with unchanged
+modification time are not listed again: their entries are taken from the
+cache, so that an unchanged subtree costs one stat call per directory instead
+of one per file.
+
+Note that the modification time of a directory only changes if entries are
+added, removed or renamed. Files modified in place (changing their size) are
+not detected; use refresh(rescan=True) in this case.
+
+Sizes are apparent sizes (st_size, as du --apparent-size -b), symbolic links
+are not followed and counted as files.
+
+    >>> stats = storage_stats('dr_data')
+    >>> stats.refresh()
+    >>> for row in stats.get_report(level='md', by_value=True):
+    ...     print(row['path'], row['files'], format_size(row['bytes']))
+"""
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import START_STATE
+from ubg_data_toolbox.dm_file_utils import file_lock
+from ubg_data_toolbox.dm_file_utils import atomic_write_json
+from ubg_data_toolbox import instrumentation
+
+CACHE_VERSION = 1
+# directories modified less than this number of seconds before the scan are
+# not cached: their modification time could change again within the time
+# resolution of the file system without being noticed
+RACY_SECONDS = 2
+
+
+def format_size(nr_bytes):
+    """Return a human-readable size"""
+    size = float(nr_bytes)
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            break
+        size /= 1024
+    if unit == 'B':
+        return '{} B'.format(nr_bytes)
+    return '{:.1f} {}'.format(size, unit)
+
+
+def _join(relpath, name):
+    return relpath + '/' + name if relpath else name
+
+
+class storage_stats(object):
+    """Per-directory storage statistics of a data tree, see module
+    documentation"""
+    def __init__(self, datatree, workers=None, loglevel=logging.INFO):
+        """
+        Parameters
+        ----------
+        datatree : str
+            Path to the data tree, or any directory within it
+        workers : None|int, optional
+            Number of directories listed in parallel (default: 4 x number of
+            CPUs, listing directories is mostly waiting for the file system)
+        loglevel : int, optional
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(loglevel)
+
+        self.dr_root = find_data_root(os.path.abspath(datatree))
+        assert self.dr_root is not None, 'No data root found: {}'.format(
+            datatree)
+        self.dr_root = os.path.abspath(self.dr_root)
+        self.cachefile = self.dr_root + os.sep + '.management' + os.sep + \
+            'storage_stats.cache'
+        if workers is None:
+            workers = 4 * (os.cpu_count() or 1)
+        self.workers = workers
+
+        # relative path: [mtime_ns, files, bytes, [subdirectories]], in the
+        # order of a breadth-first traversal
+        self.directories = {}
+        # relative path: [files, bytes, directories] of the complete subtree
+        self.totals = {}
+        # relative path: directory level (None for directories that do not
+        # correspond to a level of the directory structure)
+        self.levels = {}
+
+    def load(self):
+        """Load the directory entries from the cache file, if present"""
+        self.directories = {}
+        if not os.path.isfile(self.cachefile):
+            return
+        try:
+            with file_lock(self.cachefile, shared=True):
+                with open(self.cachefile, 'r') as fid:
+                    data = json.load(fid)
+        except json.JSONDecodeError:
+            self.logger.warning(
+                'Ignoring corrupted cache file: {}'.format(self.cachefile))
+            return
+        if data.get('version', None) != CACHE_VERSION:
+            return
+        self.directories = data['directories']
+
+    def save(self):
+        with file_lock(self.cachefile):
+            atomic_write_json(
+                self.cachefile,
+                {'version': CACHE_VERSION, 'directories': self.directories},
+            )
+
+    def _scan_directory(self, relpath, cached, racy_limit):
+        """Return the entry [mtime_ns, files, bytes, [subdirectories]] of a
+        directory, and whether it was taken from the cache"""
+        path = self.dr_root + (os.sep + relpath if relpath else '')
+        try:
+            # subdirectories are never symbolic links (see below), but the
+            # data root itself can be
+            mtime_ns = os.stat(path).st_mtime_ns
+            if cached is not None and cached[0] == mtime_ns:
+                return cached, True
+            nr_files = 0
+            nr_bytes = 0
+            subdirs = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        nr_files += 1
+                        nr_bytes += entry.stat(follow_symlinks=False).st_size
+        except OSError as e:
+            self.logger.warning('Cannot read {}: {}'.format(path, e))
+            return [None, 0, 0, []], False
+        if mtime_ns >= racy_limit:
+            mtime_ns = None
+        return [mtime_ns, nr_files, nr_bytes, sorted(subdirs)], False
+
+    def refresh(self, rescan=False, save=True):
+        """Bring the statistics up to date with the data tree
+
+        The cache file is loaded (if not done yet), and only directories
+        whose modification time changed are listed again.
+
+        Parameters
+        ----------
+        rescan : bool, optional
+            Ignore the cache and list all directories
+        save : bool, optional
+            Write the cache file afterwards
+
+        Returns
+        -------
+        report : dict
+            Number of directories listed (scanned) and taken from the cache
+            (reused)
+        """
+        if rescan:
+            self.directories = {}
+        elif len(self.directories) == 0:
+            self.load()
+        cache = self.directories
+        racy_limit = time.time_ns() - RACY_SECONDS * 10 ** 9
+
+        directories = {}
+        report = {'scanned': 0, 'reused': 0}
+        frontier = ['']
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while len(frontier) > 0:
+                results = executor.map(
+                    lambda relpath: self._scan_directory(
+                        relpath, cache.get(relpath, None), racy_limit),
+                    frontier,
+                )
+                next_frontier = []
+                for relpath, (entry, reused) in zip(frontier, results):
+                    directories[relpath] = entry
+                    report['reused' if reused else 'scanned'] += 1
+                    next_frontier.extend(
+                        _join(relpath, name) for name in entry[3])
+                frontier = next_frontier
+        instrumentation.increment('directories_visited', report['scanned'])
+        instrumentation.increment(
+            'stat_calls', report['scanned'] + report['reused'])
+        self.logger.debug(
+            'listed {scanned} directories, reused {reused}'.format(**report))
+
+        self.directories = directories
+        self._aggregate()
+        if save:
+            self.save()
+        return report
+
+    def _aggregate(self):
+        """Compute the totals of all subtrees (bottom-up) and the directory
+        levels (top-down)"""
+        self.totals = {}
+        # children are located after their parents in breadth-first order
+        for relpath in reversed(list(self.directories.keys())):
+            mtime_ns, nr_files, nr_bytes, subdirs = self.directories[relpath]
+            total = [nr_files, nr_bytes, 1]
+            for name in subdirs:
+                sub_total = self.totals[_join(relpath, name)]
+                total[0] += sub_total[0]
+                total[1] += sub_total[1]
+                total[2] += sub_total[2]
+            self.totals[relpath] = total
+
+        automaton = get_automaton()
+        self.levels = {}
+        states = {}
+        node, state = automaton.step(
+            START_STATE, os.path.basename(self.dr_root))
+        self.levels[''] = node
+        states[''] = state
+        for relpath, entry in self.directories.items():
+            state = states.pop(relpath, None)
+            allowed = None
+            if state is not None:
+                allowed = automaton.get_allowed_children(state)
+            for name in entry[3]:
+                sub_relpath = _join(relpath, name)
+                node = None
+                if allowed:
+                    node, sub_state = automaton.step(state, name)
+                    if node is not None:
+                        states[sub_relpath] = sub_state
+                self.levels[sub_relpath] = node
+
+    def _collect_rows(self, level, get_key):
+        """Aggregate the totals of the directories of a level (None: all
+        levels) into rows, grouped by get_key(relpath, node)"""
+        rows = {}
+        for relpath, node in self.levels.items():
+            if node is None:
+                continue
+            if level is not None and level not in (
+                    node.name, node.abbreviation):
+                continue
+            total = self.totals[relpath]
+            key = get_key(relpath, node)
+            row = rows.get(key, None)
+            if row is None:
+                row = rows[key] = {
+                    'path': key,
+                    'level': node.abbreviation,
+                    'directories': 0,
+                    'files': 0,
+                    'bytes': 0,
+                }
+            row['directories'] += 1
+            row['files'] += total[0]
+            row['bytes'] += total[1]
+        return rows
+
+    def get_report(self, level=None, by_value=False):
+        """Return the statistics of the directories of a directory level
+
+        Parameters
+        ----------
+        level : None|str, optional
+            Name (e.g., theme_complex) or abbreviation (e.g., tc) of the
+            level. Abbreviations select the corresponding levels of all
+            branches (e.g., md: method_field and method_lab). Default: all
+            directories that correspond to a level
+        by_value : bool, optional
+            Aggregate all directories of the same name (e.g., all md_ERT
+            directories of the tree)
+
+        Returns
+        -------
+        rows : list
+            dicts with the keys path (relative to the data root, or the
+            directory name if by_value is True), level, directories (number
+            of directories aggregated in the row), files and bytes, sorted by
+            path
+        """
+        root_name = os.path.basename(self.dr_root)
+
+        def _get_key(relpath, node):
+            if not by_value:
+                return relpath
+            if relpath == '':
+                return root_name
+            return relpath[relpath.rfind('/') + 1:]
+
+        rows = self._collect_rows(level, _get_key)
+        return [rows[key] for key in sorted(rows.keys())]
+
+    def get_level_summary(self):
+        """Return the number of directories, files and bytes per directory
+        level (as rows of get_report, with the name of the level as path),
+        in the order of the levels of the directory structure"""
+        rows = self._collect_rows(None, lambda relpath, node: node.name)
+        order = [x.name for x in get_automaton().nodes]
+        return sorted(rows.values(), key=lambda x: order.index(x['path']))
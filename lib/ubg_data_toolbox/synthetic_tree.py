@@ -0,0 +1,282 @@
+"""Generate synthetic data trees, e.g., for benchmarks
+
+The generated trees follow the field branch of the directory schema
+(ubg_data_toolbox.dirtree.tree) and, optionally, its laboratory branch:
+
+    dr_[name]/tc_[theme complex]/t_field/s_[site]/a_[area]/md_[method]/
+        p_[profile]/exp_[experiment]/m_[label]
+    dr_[name]/tc_[theme complex]/t_laboratory/s_[lab]/g_[group]/
+        exp_[experiment]/md_[method]/spe_[specimen]/m_[label]
+
+Each directory level contains a metadata.ini file with the metadata entry the
+level maps to (plus a few additional entries), so that the merged metadata of
+each measurement contains all entries required for field or laboratory
+measurements.
+Optionally, sparse raw data files are created in each measurement directory.
+
+Examples
+--------
+>>> from ubg_data_toolbox.synthetic_tree import generate_synthetic_tree
+>>> info = generate_synthetic_tree('/tmp/bench', sites=2, experiments=5,
+...                                measurements=100)
+>>> info['nr_measurements']
+1000
+"""
+import os
+import random
+
+from ubg_data_toolbox.dirtree import tree
+
+METHODS = ('ERT', 'SIP', 'GPR', 'EMI', 'SP', 'TDIP', 'Seismics', 'NMR')
+PERSONS = ('Max Mustermann', 'Erika Musterfrau', 'John Doe', 'Jane Roe')
+
+
+# names of the directory levels of each branch (value of the target level)
+BRANCH_LEVELS = {
+    'field': [
+        'theme_complex', 'target', 'field_site', 'area', 'method_field',
+        'profile', 'experiment_field', 'label_field',
+    ],
+    'laboratory': [
+        'theme_complex', 'target', 'laboratory_site', 'group',
+        'experiment_lab', 'method_lab', 'specimen', 'label_lab',
+    ],
+}
+
+
+def _get_schema_levels(branch='field'):
+    """Return the directory levels used for synthetic trees of a branch
+    (field or laboratory), checked against the schema. Returns a list of
+    (name, abbreviation) tuples, starting with the theme complex."""
+    levels = []
+    node = tree
+    for name in BRANCH_LEVELS[branch]:
+        if len(node.conditional_children) > 0:
+            candidates = [node.conditional_children[branch]]
+        else:
+            candidates = node.children
+        matches = [x for x in candidates if x.name == name]
+        assert len(matches) == 1, \
+            'directory level {} not found in schema'.format(name)
+        node = matches[0]
+        levels.append((node.name, node.abbreviation))
+    return levels
+
+
+def _write_metadata(directory, entries):
+    """Write a metadata.ini file. Entries is a list of (section, key, value)
+    tuples (sections must be grouped)"""
+    lines = []
+    section = None
+    for entry_section, key, value in entries:
+        if entry_section != section:
+            if section is not None:
+                lines.append('')
+            lines.append('[{}]'.format(entry_section))
+            section = entry_section
+        lines.append('{} = {}'.format(
+            key, str(value).replace('\n', '\n\t')))
+    with open(directory + os.sep + 'metadata.ini', 'w') as fid:
+        fid.write('\n'.join(lines) + '\n')
+
+
+def _create_raw_files(directory, raw_files, raw_size):
+    raw_dir = directory + os.sep + 'RawData'
+    os.makedirs(raw_dir)
+    for nr in range(raw_files):
+        with open(raw_dir + os.sep + 'data_{:03}.bin'.format(nr), 'wb') as fid:
+            # sparse file: only the size is set, no data is written
+            fid.truncate(raw_size)
+
+
+def generate_synthetic_tree(
+        directory, name='dr_synthetic', theme_complexes=1, sites=2, areas=1,
+        methods=2, profiles=1, experiments=5, measurements=10,
+        raw_files=0, raw_size=0, seed=0, lab_sites=0):
+    """Generate a synthetic data tree
+
+    The number of field measurements is the product of all numbers of
+    directories per level. Laboratory sites (t_laboratory branch) contain one
+    group, and the same numbers of experiments, methods, specimens (number of
+    profiles) and measurements as the areas of the field sites.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which the data root is created
+    name : str, optional
+        Name of the data root directory (must start with dr_)
+    theme_complexes : int, optional
+        Number of theme complexes
+    sites : int, optional
+        Number of field sites per theme complex (0: no field branch)
+    areas : int, optional
+        Number of areas per site
+    methods : int, optional
+        Number of methods per area
+    profiles : int, optional
+        Number of profiles per method
+    experiments : int, optional
+        Number of experiments per profile
+    measurements : int, optional
+        Number of measurements per experiment
+    raw_files : int, optional
+        Number of (sparse) raw data files per measurement
+    raw_size : int, optional
+        Size of each raw data file in bytes
+    seed : int, optional
+        Seed of the random number generator (metadata values)
+    lab_sites : int, optional
+        Number of laboratory sites per theme complex (0: no laboratory
+        branch)
+
+    Returns
+    -------
+    info : dict
+        dr_root (path of the data root), nr_measurements, nr_directories
+    """
+    assert name.startswith('dr_'), 'name of data root must start with dr_'
+    assert methods <= len(METHODS), 'at most {} methods'.format(len(METHODS))
+    rng = random.Random(seed)
+
+    dr_root = os.path.abspath(directory) + os.sep + name
+    os.makedirs(dr_root)
+
+    counts = {
+        'theme_complex': theme_complexes,
+        'target': 1,
+        'field_site': sites,
+        'area': areas,
+        'method_field': methods,
+        'profile': profiles,
+        'experiment_field': experiments,
+        'label_field': measurements,
+        'laboratory_site': lab_sites,
+        'group': 1,
+        'experiment_lab': experiments,
+        'method_lab': methods,
+        'specimen': profiles,
+        'label_lab': measurements,
+    }
+    branches = [
+        (branch, _get_schema_levels(branch))
+        for branch, nr_sites in (('field', sites), ('laboratory', lab_sites))
+        if nr_sites > 0
+    ]
+    info = {'dr_root': dr_root, 'nr_measurements': 0, 'nr_directories': 1}
+
+    def _level_values(level_name, nr):
+        if level_name == 'theme_complex':
+            return 'Theme{:02}'.format(nr), [
+                ('general', 'theme_complex', 'Theme{:02}'.format(nr)),
+                ('general', 'person_responsible', rng.choice(PERSONS)),
+                ('general', 'person_email', 'someone@example.org'),
+            ]
+        if level_name == 'field_site':
+            return 'Site{:03}'.format(nr), [
+                ('field', 'site', 'Site{:03}'.format(nr)),
+                ('field', 'coordinates', '{:.5f} {:.5f}'.format(
+                    rng.uniform(50, 51), rng.uniform(7, 8))),
+            ]
+        if level_name == 'area':
+            return 'Area{:02}'.format(nr), [
+                ('field', 'area', 'Area{:02}'.format(nr))]
+        if level_name == 'laboratory_site':
+            return 'Lab{:02}'.format(nr), [
+                ('laboratory', 'site', 'Lab{:02}'.format(nr))]
+        if level_name == 'group':
+            return 'Group{:02}'.format(nr), [
+                ('laboratory', 'group', 'Group{:02}'.format(nr))]
+        if level_name == 'specimen':
+            return 'Specimen{:02}'.format(nr), [
+                ('laboratory', 'specimen', 'Specimen{:02}'.format(nr))]
+        if level_name in ('method_field', 'method_lab'):
+            return METHODS[nr], [('general', 'method', METHODS[nr])]
+        if level_name == 'profile':
+            nr_electrodes = 48
+            return 'P{:02}'.format(nr), [
+                ('field', 'profile', 'P{:02}'.format(nr)),
+                ('geoelectrics', 'profile_direction', 'normal'),
+                ('geoelectrics', 'spacing', '1'),
+                ('geoelectrics', 'electrode_positions', '\n'.join(
+                    '{} 0'.format(x) for x in range(nr_electrodes))),
+            ]
+        if level_name in ('experiment_field', 'experiment_lab'):
+            return 'Exp{:03}'.format(nr), [
+                ('general', 'experiment', 'Exp{:03}'.format(nr)),
+                ('general', 'description_exp', 'Synthetic experiment'),
+            ]
+        # measurements
+        year = 2000 + rng.randrange(24)
+        label = '{}{:02}{:02}_{:05}'.format(
+            year, rng.randrange(1, 13), rng.randrange(1, 29), nr)
+        info['nr_measurements'] += 1
+        return label, [
+            ('general', 'label', label),
+            ('general', 'id', 'syn_{:09}'.format(info['nr_measurements'])),
+            ('general', 'datetime_start', '{}_{:02}{:02}'.format(
+                label[0:8], rng.randrange(24), rng.randrange(60))),
+            ('general', 'description', 'Synthetic measurement'),
+            ('general', 'completed', 'yes'),
+            ('general', 'keywords', 'synthetic, benchmark'),
+            ('device', 'device', 'Device{}'.format(rng.randrange(5))),
+        ]
+
+    def _create_directory(parent, abbreviation, value, entries):
+        subdir = parent + os.sep + abbreviation + '_' + value
+        os.makedirs(subdir)
+        info['nr_directories'] += 1
+        _write_metadata(subdir, entries)
+        return subdir
+
+    def _create(parent, levels, depth):
+        level_name, abbreviation = levels[depth]
+        for nr in range(counts[level_name]):
+            subdir = _create_directory(
+                parent, abbreviation, *_level_values(level_name, nr))
+            if depth + 1 < len(levels):
+                _create(subdir, levels, depth + 1)
+            elif raw_files > 0:
+                _create_raw_files(subdir, raw_files, raw_size)
+
+    # the theme complex and target levels are shared by both branches
+    for nr in range(theme_complexes):
+        tc_dir = _create_directory(
+            dr_root, 'tc', *_level_values('theme_complex', nr))
+        for branch, levels in branches:
+            target_dir = _create_directory(
+                tc_dir, 't', branch,
+                [('general', 'survey_type', branch)])
+            _create(target_dir, levels, 2)
+    return info
+
+
+def get_parameters_for_size(nr_measurements, lab_fraction=0):
+    """Return keyword arguments of generate_synthetic_tree for a tree with
+    (approximately) the given number of measurements. Up to 20 measurements
+    are placed in each experiment, up to 10 experiments in each profile, and
+    the tree is grown by adding methods and sites. A fraction lab_fraction
+    (0 to 1) of the sites are laboratory sites. Both branches contain at
+    least one site if 0 < lab_fraction < 1."""
+    assert 0 <= lab_fraction <= 1, 'lab_fraction must be in [0, 1]'
+    measurements = max(1, min(20, nr_measurements))
+    rest = max(1, nr_measurements // measurements)
+    experiments = max(x for x in range(1, 11) if rest % x == 0)
+    rest //= experiments
+    methods = 2 if rest % 2 == 0 else 1
+    sites = rest // methods
+    lab_sites = int(round(sites * lab_fraction))
+    if lab_fraction > 0:
+        lab_sites = max(lab_sites, 1)
+    field_sites = sites - lab_sites
+    if lab_fraction < 1 and field_sites == 0:
+        # only one site: split the measurements between both branches
+        field_sites = 1
+        measurements = max(1, measurements // 2)
+    return {
+        'sites': field_sites,
+        'lab_sites': lab_sites,
+        'methods': methods,
+        'experiments': experiments,
+        'measurements': measurements,
+    }
@@ -0,0 +1,259 @@
+"""Snapshots of the skeleton and the metadata of a data tree
+
+Read-only tools such as dm_list_measurements, dm_collect_ids and dm_gen_db
+need the directory levels of a tree and the content of all of its
+metadata.ini files. On a cold (or remote) file system, collecting these costs
+thousands of round trips. A tree snapshot stores them in one compressed file:
+
+    directories   all directories of the tree that correspond to a level of
+                  the directory structure (relative to the data root, the
+                  content of measurement directories is not included)
+    metadata      the parsed content {section: {key: value}} of the
+                  metadata.ini files of these directories
+
+Snapshots are written with dm_snapshot (default location:
+.management/tree_snapshot.json.gz) and used with the --snapshot option of the
+read-only tools:
+
+    >>> snapshot = create_snapshot('dr_data')
+    >>> snapshot.save(get_default_filename('dr_data'))
+    >>> snapshot = load_snapshot('dr_data/.management/tree_snapshot.json.gz')
+    >>> for m_dir in snapshot.find_measurement_directories():
+    ...     md = snapshot.get_metadata_chain(m_dir).get_merged_metadata()
+"""
+import os
+import gc
+import gzip
+import json
+import datetime
+
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import START_STATE
+from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.metadata import _get_configparser
+from ubg_data_toolbox.metadata import _parse_metadata_file
+from ubg_data_toolbox import electrode_positions
+import ubg_data_toolbox.md_types as md_types
+from ubg_data_toolbox import instrumentation
+
+SNAPSHOT_VERSION = 1
+DEFAULT_FILENAME = 'tree_snapshot.json.gz'
+# directories that can contain arbitrary content (see dm_check_dirtree)
+PASSIVE_DIRECTORIES = ('Documentation', )
+
+
+def get_default_filename(dr_root):
+    return dr_root + os.sep + '.management' + os.sep + DEFAULT_FILENAME
+
+
+class snapshot_chain(metadata_chain):
+    """Metadata chain of a directory, read from a tree snapshot instead of the
+    file system. Filenames are given relative to the data root."""
+    def __init__(self, snapshot, relpath):
+        self.snapshot = snapshot
+        self.directory = relpath
+
+    def get_available_metadata_files(self):
+        # same order as metadata_chain: lowest directory first
+        md_files = []
+        directory = self.directory
+        while True:
+            if directory in self.snapshot.metadata:
+                md_files.append(
+                    (directory + '/' if directory else '') + 'metadata.ini')
+            if directory == '':
+                break
+            index = directory.rfind('/')
+            directory = directory[0:index] if index >= 0 else ''
+        return md_files
+
+    def _get_content(self, filename):
+        return self.snapshot.metadata.get(os.path.dirname(filename), {})
+
+    def get_electrode_positions(self, mmap=True):
+        """Return the [geoelectrics] electrode_positions of the chain as
+        numpy array, or None if not defined. The positions are parsed from
+        the snapshot each time (no cache, mmap is ignored)"""
+        source = electrode_positions.find_definition(
+            self.get_available_metadata_files(), self._get_content)
+        if source is None:
+            return None
+        return md_types.POSITIONS.parse(self._get_content(source)[
+            electrode_positions.SECTION][electrode_positions.KEY])
+
+    def _import_metadata_files(self, filenames=None, debug=False):
+        if filenames is None:
+            filenames = self.get_available_metadata_files()
+        config = _get_configparser()
+        for filename in filenames:
+            config.read_dict(
+                self.snapshot.metadata[os.path.dirname(filename)])
+        return config
+
+
+class tree_snapshot(object):
+    """Skeleton and metadata of a data tree, see module documentation
+
+    Attributes
+    ----------
+    root_name : str
+        Name of the data root directory (e.g., dr_data)
+    dr_root : str
+        Absolute path of the data root when the snapshot was created
+    created : str
+        Creation time (ISO format)
+    directories : list
+        Directories of the skeleton, relative to the data root ('' is the
+        data root itself), in the order of a sorted walk
+    measurements : list
+        The measurement directories among them
+    metadata : dict
+        directory: parsed content of its metadata.ini
+    """
+    def __init__(self, root_name, dr_root, created, directories,
+                 measurements, metadata):
+        self.root_name = root_name
+        self.dr_root = dr_root
+        self.created = created
+        self.directories = directories
+        self.measurements = measurements
+        self.metadata = metadata
+
+    def find_measurement_directories(self, with_metadata=True):
+        """Return the measurement directories (relative to the data root)
+
+        Parameters
+        ----------
+        with_metadata : bool, optional
+            If True, only return measurement directories with a metadata.ini
+            file (see dirtree_nav.find_measurement_directories)
+        """
+        if not with_metadata:
+            return list(self.measurements)
+        return [x for x in self.measurements if x in self.metadata]
+
+    def get_metadata_chain(self, relpath):
+        """Return the metadata chain (see metadata.metadata_chain) of a
+        directory of the snapshot"""
+        return snapshot_chain(self, relpath)
+
+    def save(self, filename):
+        # directories are stored as (index of parent, name) and referenced by
+        # their index, which keeps the file (and loading it) small
+        index = {}
+        skeleton = []
+        for nr, relpath in enumerate(self.directories):
+            index[relpath] = nr
+            if relpath == '':
+                skeleton.append([-1, ''])
+                continue
+            position = relpath.rfind('/')
+            parent = relpath[0:position] if position >= 0 else ''
+            skeleton.append([index[parent], relpath[position + 1:]])
+        content = {
+            'snapshot_version': SNAPSHOT_VERSION,
+            'root_name': self.root_name,
+            'dr_root': self.dr_root,
+            'created': self.created,
+            'directories': skeleton,
+            'measurements': [index[x] for x in self.measurements],
+            'metadata': [
+                [index[x], self.metadata[x]] for x in self.directories
+                if x in self.metadata
+            ],
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with gzip.open(filename + '.tmp', 'wt', encoding='utf-8',
+                       compresslevel=6) as fid:
+            json.dump(content, fid, separators=(',', ':'))
+        os.replace(filename + '.tmp', filename)
+
+
+def create_snapshot(dr_root):
+    """Create a snapshot of a data tree
+
+    The tree is walked along the directory structure: only directories that
+    match a directory level are included, measurement directories are not
+    descended into.
+    """
+    automaton = get_automaton()
+    dr_root = os.path.abspath(dr_root)
+    directories = []
+    measurements = []
+    metadata = {}
+
+    def _walk(path, relpath, state):
+        instrumentation.increment('directories_visited')
+        directories.append(relpath)
+        allowed = automaton.get_allowed_children(state)
+        is_measurement = allowed is not None and len(allowed) == 0
+        if is_measurement:
+            measurements.append(relpath)
+        md_file = path + os.sep + 'metadata.ini'
+        content = _parse_metadata_file(md_file)
+        if content or os.path.isfile(md_file):
+            metadata[relpath] = content
+        if is_measurement or allowed is None:
+            return
+        with os.scandir(path) as entries:
+            subdirs = sorted(
+                x.name for x in entries if x.is_dir(follow_symlinks=True))
+        for name in subdirs:
+            if name in PASSIVE_DIRECTORIES or name.startswith('.'):
+                continue
+            node, sub_state = automaton.step(state, name)
+            if node is None:
+                continue
+            _walk(
+                path + os.sep + name,
+                (relpath + '/' if relpath else '') + name,
+                sub_state,
+            )
+
+    root_node, root_state = automaton.step(
+        START_STATE, os.path.basename(dr_root))
+    assert root_node is not None, \
+        '{} is not a data root directory'.format(dr_root)
+    _walk(dr_root, '', root_state)
+    return tree_snapshot(
+        root_name=os.path.basename(dr_root),
+        dr_root=dr_root,
+        created=datetime.datetime.now().isoformat(),
+        directories=directories,
+        measurements=measurements,
+        metadata=metadata,
+    )
+
+
+def load_snapshot(filename):
+    """Load a tree snapshot written by tree_snapshot.save"""
+    with gzip.open(filename, 'rb') as fid:
+        raw = fid.read()
+    # the cyclic garbage collector would repeatedly scan the many containers
+    # created while decoding, without finding anything to collect
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        content = json.loads(raw)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if content.get('snapshot_version', None) != SNAPSHOT_VERSION:
+        raise IOError('{} is not a tree snapshot of version {}'.format(
+            filename, SNAPSHOT_VERSION))
+    directories = []
+    for parent, name in content['directories']:
+        if parent == -1:
+            directories.append('')
+        elif parent == 0:
+            directories.append(name)
+        else:
+            directories.append(directories[parent] + '/' + name)
+    return tree_snapshot(
+        root_name=content['root_name'],
+        dr_root=content['dr_root'],
+        created=content['created'],
+        directories=directories,
+        measurements=[directories[x] for x in content['measurements']],
+        metadata={directories[x]: md for x, md in content['metadata']},
+    )
@@ -33,6 +33,9 @@ if __name__ == '__main__':
             'ubg_data_toolbox',
             'ubg_data_toolbox.checks',
         ],
+        package_data={
+            'ubg_data_toolbox': ['html_assets/*'],
+        },
         entry_points=entry_points,
         py_modules=scripts,
         install_requires=[
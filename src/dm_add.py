@@ -3,29 +3,28 @@
 
 """
 import os
-import shutil
 import datetime
 
 # import data_toolbox.checks.tree as check_tree
 import argparse
-import IPython
-from prompt_toolkit import print_formatted_text, HTML
-from prompt_toolkit.shortcuts import yes_no_dialog
 
 import ubg_data_toolbox.dm_config as dm_config
-from ubg_data_toolbox.dm_metadata_user_input import ask_user_for_metadata
 from ubg_data_toolbox.dm_dirtree import gen_dirtree_from_metadata
 from ubg_data_toolbox.metadata import write_md_nested_dict_to_file
 from ubg_data_toolbox.metadata import merge_md_dicts
-import ubg_data_toolbox.checks.tree as tree_check
+import ubg_data_toolbox.copy_engine as copy_engine
+import ubg_data_toolbox.dm_batch as dm_batch
 from ubg_data_toolbox.dm_caches import md_cache_default_values
-
-IPython
+from ubg_data_toolbox.md_value_index import md_value_index
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Add one measurement to a given data directory structure',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-t', '--tree',
@@ -35,11 +34,48 @@ def handle_args():
     parser.add_argument(
         '-i', '--input',
         help='Path to measurement (data/directory/directory tree)',
-        required=True,
+        required=False,
         nargs='+',
     )
+    parser.add_argument(
+        '-b', '--batch',
+        help='Non-interactive mode: import all measurements described in ' +
+        'this manifest file (.csv or .ini, see ubg_data_toolbox.dm_batch)',
+        required=False,
+    )
+    parser.add_argument(
+        '--dry-run',
+        help='Batch mode: only validate the manifest and print the target ' +
+        'directories',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--move',
+        help='Move the input data into the data tree instead of copying it',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--resume',
+        help='Resume an interrupted import into an existing measurement ' +
+        'directory. Only files missing in the data tree will be copied',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of files (batch mode: measurements) copied in ' +
+        'parallel (default: 4)',
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        '--no-verify',
+        help='Do not verify the copied files using checksums',
+        action='store_true',
+    )
 
     args = parser.parse_args()
+    if (args.input is None) == (args.batch is None):
+        parser.error('exactly one of -i/--input and -b/--batch is required')
     data_tree = os.path.basename(args.tree)
     if not data_tree.startswith('dr_'):
         print('')
@@ -61,7 +97,8 @@ def handle_args():
     return args
 
 
-def copy_research_data(data_input, dir_to_m_dir, move=False, verbose=True):
+def copy_research_data(data_input, dir_to_m_dir, move=False, verbose=True,
+                       workers=4, verify=True):
     """ Copy or move the data into the data tree.
 
     Note that depending on the type of the parameter data_input (file or
@@ -74,107 +111,62 @@ def copy_research_data(data_input, dir_to_m_dir, move=False, verbose=True):
     the measurement (m_) directory. Then move all subdirectories to dirtree.
     Note that metadata.init files will NOT be moved/copied.
 
+    Files are copied in parallel and verified using checksums (see
+    ubg_data_toolbox.copy_engine). All transferred files are recorded in a
+    journal in the .management directory of the data root until the import
+    is complete, and an interrupted import can be resumed by calling this
+    function again: only the missing files will then be copied.
+
     Parameters
     ----------
-    data_input :
-
+    data_input : list of str
+        Input files, or one input directory
     dir_to_m_dir : str
         Measurement directory.
+    move : bool, optional
+        If True, move the data instead of copying it
+    verbose : bool, optional
+        If True, print each transferred file
+    workers : int, optional
+        Number of files copied in parallel
+    verify : bool, optional
+        If True, verify each copy using checksums
+
+    Returns
+    -------
+    report : dict
+        See ubg_data_toolbox.copy_engine.transfer_files
     """
-    def _transfer_file(source, target, move=move, verbose=True):
-        """Wrapper that either copies or moves a file"""
-        if move is True:
-            shutil.move(source, target)
-            if verbose:
-                print('Moved {} to {}'.format(source, target))
-        else:
-            shutil.copy(source, target)
-            if verbose:
-                print('Copied {} to {}'.format(source, target))
-
-    def _transfer_sub_directories(
-            source_dir, target_dir, move=move, act_on_files=False):
-        """Transfer or Copy all files and directories from one directory to
-        another. Be aware of the concept of measurement directories and, if
-        required, copy files/dirs into a RawData subdirectory. Also, be able to
-        only copy/move subdirectories.
-
-        Parameters
-        ----------
-        source_dir : str
-            Source directory from which files/directories are copied or moved
-        target_dir : str
-            Target directory to which files/directories are copied or moved
-        move : bool, optional
-            If True, then move files/directories. Otherwise copy
-        act_on_files : bool, optional
-            If True, also copy/move all files from source_dir to target_dir.
-            Otherwise only subdirectories are moved.
-
-        """
-        # get list of directories
-        subdirs = sorted(
-            [x for x in os.listdir(source_dir) if os.path.isdir(
-                source_dir + os.sep + x
-            )]
+    jobs, source_dir = copy_engine.plan_research_data_transfer(
+        data_input, dir_to_m_dir)
+
+    journal = copy_engine.import_journal(
+        copy_engine.get_journal_filename(dir_to_m_dir)
+    )
+    if len(journal.entries) > 0:
+        print('Resuming import, {} files already transferred'.format(
+            len(journal.entries)))
+
+    report = copy_engine.transfer_files(
+        jobs,
+        journal=journal,
+        move=move,
+        verify=verify,
+        workers=workers,
+        verbose=verbose,
+    )
+    if move and source_dir is not None:
+        copy_engine.remove_empty_directories(source_dir)
+
+    print(
+        'Transferred {} files ({} skipped), {:.1f} MiB in {:.1f} s'.format(
+            report['transferred'],
+            report['skipped'],
+            report['bytes_copied'] / 1024 ** 2,
+            report['seconds'],
         )
-        if move is True:
-            raise Exception('move not implemented yet')
-
-        if act_on_files is True:
-            file_list = sorted(
-                [x for x in os.listdir(source_dir) if os.path.isfile(
-                    source_dir + os.sep + x)]
-            )
-            for filename in file_list:
-                outfile = target_dir + os.sep + filename
-                assert not os.path.isfile(outfile), \
-                    'target file exists ' + outfile
-                shutil.copy(
-                    source_dir + os.sep + filename,
-                    outfile,
-                )
-
-        for subdir in subdirs:
-            shutil.copytree(
-                source_dir + os.sep + subdir,
-                target_dir + os.sep + subdir
-            )
-
-    # print(data_input)
-    # import IPython
-    # IPython.embed()
-    if len(data_input) > 1 or os.path.isfile(data_input[0]):
-        # create output directories
-        os.makedirs(dir_to_m_dir + os.sep + 'RawData')
-        if len(data_input) > 1:
-            for filename in data_input:
-                _transfer_file(
-                    filename, dir_to_m_dir + os.sep + 'RawData', verbose
-                )
-        else:
-            _transfer_file(
-                data_input[0], dir_to_m_dir + os.sep + 'RawData', verbose
-            )
-
-    elif os.path.isdir(data_input[0]):
-        if tree_check.is_measurement_directory(data_input[0]):
-            # copy the directory
-            _transfer_sub_directories(data_input[0], dir_to_m_dir, move=move)
-        else:
-            print(
-                'Input is not a measurement directory. It will be ' +
-                'treated as a data directory and all contents will be ' +
-                'moved into the RawData/ subdirectory'
-            )
-            datadir = dir_to_m_dir + os.sep + 'RawData'
-            os.makedirs(datadir, exist_ok=True)
-            _transfer_sub_directories(
-                data_input[0],
-                datadir,
-                move=move,
-                act_on_files=True,
-            )
+    )
+    return report
 
 
 def get_defaults_from_input_dirtree(data_input):
@@ -252,9 +244,68 @@ def get_existing_metadata(data_input, also_return_default_cache=True):
         return md
 
 
+def batch_import(args):
+    """Import all measurements of a manifest file without user interaction
+    """
+    from prompt_toolkit import print_formatted_text, HTML
+
+    rows = dm_batch.read_manifest(args.batch)
+    print('Read {} measurements from {}'.format(len(rows), args.batch))
+
+    # configuration and default values are only loaded once for all rows
+    config, metadata = dm_config.get_configuration(
+        get_default_metadata=True,
+        create_if_required=True,
+    )
+    rows = dm_batch.validate_rows(
+        rows, args.tree, defaults=metadata, resume=args.resume)
+
+    nr_invalid = 0
+    for row in rows:
+        if len(row['errors']) > 0:
+            nr_invalid += 1
+            # HTML.format escapes the name (which can contain < or &)
+            print_formatted_text(HTML(
+                '<ansired>INVALID: {}</ansired>').format(row['name']))
+            for error in row['errors']:
+                print(' ' * 4 + error)
+        else:
+            print('{}: {}'.format(row['name'], row['target']))
+
+    if nr_invalid > 0:
+        print('{} of {} rows are invalid, nothing was imported'.format(
+            nr_invalid, len(rows)))
+        exit(1)
+    if args.dry_run:
+        print('Dry run, nothing was imported')
+        return
+
+    reports = dm_batch.ingest_rows(
+        rows,
+        move=args.move,
+        verify=not args.no_verify,
+        workers=args.workers,
+    )
+    print('Imported {} measurements ({} files, {:.1f} MiB)'.format(
+        len(reports),
+        sum(x['transferred'] for x in reports),
+        sum(x['bytes_copied'] for x in reports) / 1024 ** 2,
+    ))
+
+
+@script_main
 def main():
     # get command line arguments
     args = handle_args()
+    if args.batch is not None:
+        batch_import(args)
+        return
+
+    # prompt_toolkit is only imported for interactive use (slow import)
+    from prompt_toolkit import print_formatted_text, HTML
+    from prompt_toolkit.shortcuts import yes_no_dialog
+    from ubg_data_toolbox.dm_metadata_user_input import ask_user_for_metadata
+
     # only one directory is allowed, but multiple files
     if len(args.input) > 1:
         for item in args.input:
@@ -298,6 +349,13 @@ def main():
     cache_default.merge_with_cache(cache_existing_md)
     metadata = merge_md_dicts(metadata, dict_existing_md)
 
+    # values already used in the data tree are offered for auto-completion
+    value_index = None
+    if os.path.isdir(args.tree) and find_data_root(
+            os.path.abspath(args.tree)) is not None:
+        value_index = md_value_index(args.tree)
+        value_index.refresh()
+
     # print('')
     # print('')
     # print('')
@@ -317,6 +375,7 @@ def main():
         md_entries=metadata,
         ask_for='required',
         cache_default_values=cache_default,
+        value_index=value_index,
     )
 
     print_formatted_text(HTML(
@@ -330,6 +389,7 @@ def main():
         md_entries=metadata,
         ask_for='dirtree_optional',
         cache_default_values=cache_default,
+        value_index=value_index,
     )
 
     result = yes_no_dialog(
@@ -348,6 +408,7 @@ def main():
             ask_for='optional',
             show_menu=True,
             cache_default_values=cache_default,
+            value_index=value_index,
         )
 
     print('')
@@ -368,10 +429,13 @@ def main():
     print(dirtree)
 
     # check if this output directory already exists, abort if it does
-    if os.path.isdir(dirtree):
-        raise IOError('output directory already exists')
+    if os.path.isdir(dirtree) and not args.resume:
+        raise IOError(
+            'output directory already exists (use --resume to continue an ' +
+            'interrupted import)'
+        )
 
-    os.makedirs(dirtree)
+    os.makedirs(dirtree, exist_ok=True)
 
     # write metadata file
     write_md_nested_dict_to_file(
@@ -384,7 +448,14 @@ def main():
     )
 
     # copy the data
-    copy_research_data(args.input, dirtree, verbose=True)
+    copy_research_data(
+        args.input,
+        dirtree,
+        move=args.move,
+        verbose=True,
+        workers=args.workers,
+        verify=not args.no_verify,
+    )
 
     # IPython.embed()
     # make sure that we are in a data directory structure
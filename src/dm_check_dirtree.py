@@ -8,17 +8,23 @@ TODOS:
 
 """
 import os
+import sys
 import argparse
 from pathlib import Path
 
-from ubg_data_toolbox.dirtree import tree
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import START_STATE
 from ubg_data_toolbox import id_handling
 from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Add one measurement to a given data directory structure',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-t', '--tree',
@@ -32,6 +38,21 @@ def handle_args():
         'reside within the data root indicated by -t/--tree',
         required=False,
     )
+    parser.add_argument(
+        '--listing',
+        help='Check the directory structure using a listing of the paths ' +
+        'of the tree instead of the tree itself (- for stdin). Supported ' +
+        'are the outputs of "find", "find -printf \'%%y\\t%%s\\t%%T@\\t%%p' +
+        '\\n\'" and "rsync -r --list-only", see ' +
+        'ubg_data_toolbox.dirtree_listing',
+        required=False,
+    )
+    parser.add_argument(
+        '--prune-cache',
+        help='Afterwards, remove cached electrode positions of outdated ' +
+        'metadata.ini files (.management/electrode_positions/)',
+        action='store_true',
+    )
     args = parser.parse_args()
     return args
 
@@ -50,48 +71,7 @@ class colors:
     BLUE = '\033[34m'
 
 
-def _get_prefix(directory):
-    workstr = os.path.basename(os.path.abspath(directory))
-    assert isinstance(directory, str)
-    if workstr.find('_') == -1:
-        return None
-    return workstr.split('_')[0]
-
-
-def _get_directory_name(directory):
-    """Return the name of the directory by removing the prefix.
-    Return None if no prefix was found
-    """
-    workstr = os.path.basename(os.path.abspath(directory))
-    assert isinstance(directory, str)
-    if workstr.find('_') == -1:
-        return None
-    return workstr.split('_')[1]
-
-
-def _get_prefix_and_name(directory):
-    """Return prefix and name of a given directory
-
-    Returns
-    -------
-    prefix: str
-        Prefix of the directory level
-    name: str
-        Name of the directory level, separated using '_' by the name
-
-    """
-    workstr = os.path.basename(os.path.abspath(directory))
-    assert isinstance(directory, str)
-    index = workstr.find('_')
-    if index == -1:
-        return None
-
-    prefix = workstr.split('_')[0]
-    name = workstr[index + 1:]
-    return prefix, name
-
-
-def _get_starting_node(start_level_raw, tree, dr_root):
+def _get_starting_state(start_level_raw, dr_root):
     """
 
     Parameters
@@ -99,8 +79,6 @@ def _get_starting_node(start_level_raw, tree, dr_root):
     start_level_raw: str
         The path of the starting level directory that we want to get a
         corresponding tree node for
-    tree: ?
-        The complete directory tree structure that is used for the node search
     dr_root: str
         Path to the top level directory of the data tree (dr_*-directory)
 
@@ -108,45 +86,21 @@ def _get_starting_node(start_level_raw, tree, dr_root):
     -------
     starting_level: str
         Sanitized version of input start_level_raw
-    node: ?| None
-        The node corresponding to the starting_level directory path
+    state: tuple|None
+        The state (see ubg_data_toolbox.dirtree_automaton) of the parent
+        directory of the starting_level directory, None if the parent cannot
+        be resolved
 
     """
-    levels_to_match = os.path.relpath(start_level_raw, dr_root).split(os.sep)
-    node = tree
-
-    # assume no conditional value on first level!
-    last_value = None
-    for level_dir in levels_to_match:
-        # print('----------------------------')
-        # print(level_dir, 'last value:', last_value)
-        prefix, value = _get_prefix_and_name(level_dir)
-        # print('  prefix', prefix, ' value:', value)
-        new_node = None
-        for child in node.children:
-            # print(child)
-            if child.abbreviation == prefix:
-                # print('found it')
-                new_node = child
-                break
-        for child_condition in node.conditional_children.keys():
-            # print('conditional child', child_condition)
-            if last_value == child_condition:
-                # print('Found conditional')
-                abbreviation = node.conditional_children[
-                    last_value
-                ].abbreviation
-                if prefix == abbreviation:
-                    # print('    mathed conditioned', )
-                    new_node = node.conditional_children[last_value]
-                    break
-        if new_node is None:
-            print('ERROR')
-            break
-        last_value = value
-        node = new_node
-
-    return start_level_raw, node
+    automaton = get_automaton()
+    start_level = os.path.abspath(start_level_raw)
+    if start_level == os.path.abspath(dr_root):
+        return start_level_raw, START_STATE
+    nodes, state = automaton.classify_directory(
+        os.path.dirname(start_level), dr_root)
+    if state is None:
+        print('ERROR')
+    return start_level_raw, state
 
 
 def print_directory_path(directory, color=colors.RED, base_level=0):
@@ -154,20 +108,22 @@ def print_directory_path(directory, color=colors.RED, base_level=0):
         print(color + '    ' * (base_level + level) + dirpart + colors.ENDC)
 
 
-def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
+def walk_and_check_dirtree(directory, state, basedir, id_handler, level=0):
     """
 
     Parameters
     ----------
     directory : str
         Directory to check
-    nodes :
-
+    state : tuple
+        State of the parent directory (see
+        ubg_data_toolbox.dirtree_automaton), START_STATE for the data root
     basedir :
 
     level : int, default: 0
 
     """
+    automaton = get_automaton()
     directory_name = os.path.basename(os.path.abspath(directory))
     relpath = os.path.relpath(
         directory,
@@ -177,10 +133,6 @@ def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
     # the nodes list contains all dir levels allowed for this level
     print('    ' * level + 'Directory', relpath)
 
-    # print(
-    #     '    ' * level + 'Corresponding tree entry',
-    #     [node.name for node in nodes])
-
     # We allow some directories that can contain arbitrary information.
     # Don't test them
     passive_directories = [
@@ -198,19 +150,9 @@ def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
         )
         return
 
-    # Go through all possible nodes and check if one fits
-    found_a_prefix = False
-    node = None
-    for test_node in nodes:
-        # check prefix
-        prefix = _get_prefix(directory)
-        check_prefix = test_node.abbreviation == prefix
-        # print('    ' * level + 'check_prefix', check_prefix)
-        if check_prefix:
-            found_a_prefix = True
-            # this is the node corresponding to this directory level here
-            node = test_node
-    if not found_a_prefix:
+    # find the directory level corresponding to this directory
+    node, node_state = automaton.step(state, directory_name)
+    if node is None:
         print('-' * 80)
         print(
             '    ' * level +
@@ -221,10 +163,10 @@ def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
         print(
             '    ' * level +
             'Allowed levels are:',
-            ['{} ({})'.format(node.name, node.abbreviation) for node in nodes])
+            ['{} ({})'.format(node.name, node.abbreviation)
+             for node in automaton.get_allowed_children(state)])
         print('-' * 80)
         return
-    # print(node.name, node.abbreviation, node)
     # TODO: Any level-specific tests could now be called here using the node
     # variable, which could also directly store these tests.
 
@@ -233,6 +175,7 @@ def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
     node_output = ''
     for check_label, check_function in node.checks.items():
         # print('@@@@@@@@@@@@@@@@@@ CHECK', check_label)
+        instrumentation.increment('checks_executed')
         node_output += '    ' * (level + 1) + check_label + ' '
         check_value, error_msg = check_function(
             os.path.relpath(
@@ -258,44 +201,80 @@ def walk_and_check_dirtree(directory, nodes, basedir, id_handler, level=0):
     if found_something:
         print(node_output)
 
+    # for levels with conditional children, the allowed levels depend on
+    # the value of this directory
+    child_nodes = automaton.get_allowed_children(node_state)
+    if child_nodes is None:
+        print(
+            'ERROR: This node has the value: "{}".'.format(node_state[1]) +
+            ' However, we only allowed those values {}'.format(
+                node.conditional_children.keys()
+            )
+        )
+        return
+
+    # do not continue of there are no remaining node children
+    if len(child_nodes) == 0:
+        return
+
     # Next level:
+    instrumentation.increment('directories_visited')
     subdirs = [
         os.path.normpath(
             directory + os.sep + x
         ) for x in sorted(
             os.listdir(directory)) if os.path.isdir(directory + os.sep + x)]
-    # print('   ' * level + 'subdirs', subdirs)
 
-    # we ignore "normal" children in case of conditional children
-    if len(node.conditional_children) > 0:
-        name = _get_directory_name(directory)
-        if name not in node.conditional_children:
+    for subdir in subdirs:
+        walk_and_check_dirtree(
+            subdir, node_state, basedir, id_handler, level + 1)
+
+
+def check_listing(filename):
+    """Check the directory structure given by a listing file, see
+    ubg_data_toolbox.dirtree_listing"""
+    from ubg_data_toolbox import dirtree_listing
+
+    print('Checking directory structure of listing: {}'.format(filename))
+    print('.' * 80)
+    checker = dirtree_listing.listing_checker()
+    nr_problems = 0
+    fid = dirtree_listing.open_listing(filename)
+    try:
+        for kind, relpath, message in dirtree_listing.check_listing(
+                fid, checker):
+            nr_problems += 1
             print(
-                'ERROR: This node has the value: "{}".'.format(name) +
-                ' However, we only allowed those values {}'.format(
-                    node.conditional_children.keys()
-                )
+                colors.RED + 'ERROR ({}): '.format(kind) + colors.ENDC +
+                dirtree_listing.get_relative_path(
+                    relpath, checker.root_name) +
+                ' ({})'.format(message)
             )
-            return
-        else:
-            child_nodes = [node.conditional_children[name], ]
-            for subdir in subdirs:
-                # found a condition
-                walk_and_check_dirtree(
-                    subdir, child_nodes, basedir, id_handler, level + 1)
+    finally:
+        if fid is not sys.stdin:
+            fid.close()
+    print('.' * 80)
+    print(
+        '{lines} lines, {directories} directories, {measurements} '
+        'measurements, {files} files ({bytes} bytes)'.format(
+            **checker.stats))
+    if nr_problems == 0:
+        print(colors.GREEN + 'No problems found' + colors.ENDC)
     else:
-        # do not continue of there are no remaining node children
-        if len(node.children) == 0:
-            return
-
-        for subdir in subdirs:
-            walk_and_check_dirtree(
-                subdir, node.children, basedir, id_handler, level + 1)
+        print(colors.RED + '{} problems found'.format(nr_problems) +
+              colors.ENDC)
+    print('#' * 80)
 
 
+@script_main
 def main():
     args = handle_args()
 
+    if args.listing is not None:
+        with instrumentation.phase('check'):
+            check_listing(args.listing)
+        return
+
     if args.tree is None:
         # assume pwd as directory
         directory = os.getcwd()
@@ -317,7 +296,7 @@ def main():
     print('.' * 80)
 
     init_level = dr_root
-    init_node = tree
+    init_state = START_STATE
     if args.level is not None:
         assert os.path.isdir(args.level), \
             "-l/--level must point to a valid directory within the data tree!"
@@ -327,27 +306,34 @@ def main():
         assert p_dr_root in p_level.parents, \
             "-l/--level must be a subdirectory of the data tree"
 
-        start_level, start_node = _get_starting_node(args.level, tree, dr_root)
-        assert start_node is not None, "ERROR"
+        start_level, start_state = _get_starting_state(args.level, dr_root)
+        assert start_state is not None, "ERROR"
         init_level = start_level
-        init_node = start_node
+        init_state = start_state
 
     # re-scan the complete directory for ids
-    id_handler = id_handling.data_id_handler(
-        dr_root,
-        try_cache=True,
-        update_cache=False,
-    )
+    with instrumentation.phase('scan'):
+        id_handler = id_handling.data_id_handler(
+            dr_root,
+            try_cache=True,
+            update_cache=False,
+        )
 
     # TODO: I forgot what the basedir parameter actually does
-    walk_and_check_dirtree(
-        init_level,
-        [init_node, ],
-        basedir=os.getcwd(),
-        id_handler=id_handler,
-        # basedir=dr_root,
-        level=0
-    )
+    with instrumentation.phase('check'):
+        walk_and_check_dirtree(
+            init_level,
+            init_state,
+            basedir=os.getcwd(),
+            id_handler=id_handler,
+            # basedir=dr_root,
+            level=0
+        )
+    if args.prune_cache:
+        from ubg_data_toolbox import electrode_positions
+        nr_removed = electrode_positions.prune_cache(dr_root)
+        print('Removed {} outdated cached electrode positions'.format(
+            nr_removed))
     print('#' * 80)
 
 
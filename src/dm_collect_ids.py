@@ -6,9 +6,12 @@ file dm_ids.info
 """
 import json
 import os
+import argparse
 
 from ubg_data_toolbox.dirtree_nav import find_data_root
 from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def get_all_measurement_directories(directory):
@@ -44,23 +47,63 @@ def get_all_measurement_directories(directory):
     return m_dirs
 
 
-def main():
-    m_dirs = get_all_measurement_directories(os.getcwd())
-
-    data_root = find_data_root(os.getcwd())
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Collect the ids of all measurements of a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-s', '--snapshot',
+        help='Read the metadata from a tree snapshot (see dm_snapshot) ' +
+        'instead of the data tree',
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+def collect_ids_from_snapshot(filename):
+    """Return the path: id pairs of all measurements of a tree snapshot
+    (see ubg_data_toolbox.tree_snapshot) and the data root of the snapshot
+    """
+    from ubg_data_toolbox.tree_snapshot import load_snapshot
 
-    # contains path: id pairs (paths relative to data root)
+    snapshot = load_snapshot(filename)
     id_dict = {}
-
-    for mdir in m_dirs:
-        chain = metadata_chain(mdir)
-        data = chain.get_merged_metadata()
+    for relpath in snapshot.find_measurement_directories():
+        data = snapshot.get_metadata_chain(relpath).get_merged_metadata()
         if 'id' in data['general']:
-            relpath = os.path.relpath(
-                mdir,
-                start=data_root
-            )
-            id_dict[relpath] = data['general']['id'].value
+            id_dict[relpath.replace('/', os.sep)] = \
+                data['general']['id'].value
+    return id_dict, snapshot.dr_root
+
+
+@script_main
+def main():
+    args = handle_args()
+
+    if args.snapshot is not None:
+        id_dict, snapshot_root = collect_ids_from_snapshot(args.snapshot)
+        # write to the current data tree, if any, otherwise to the tree of
+        # the snapshot
+        data_root = find_data_root(os.getcwd()) or snapshot_root
+    else:
+        m_dirs = get_all_measurement_directories(os.getcwd())
+
+        data_root = find_data_root(os.getcwd())
+
+        # contains path: id pairs (paths relative to data root)
+        id_dict = {}
+
+        for mdir in m_dirs:
+            chain = metadata_chain(mdir)
+            data = chain.get_merged_metadata()
+            if 'id' in data['general']:
+                relpath = os.path.relpath(
+                    mdir,
+                    start=data_root
+                )
+                id_dict[relpath] = data['general']['id'].value
 
     print('Found ids:')
     print(id_dict)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""Show the changes of the metadata of a data tree between two points in time
+
+Save a snapshot of the current metadata (in .management/snapshots/):
+
+    dm_diff --save-snapshot
+
+Compare the last saved snapshot with the current tree, a given snapshot with
+the current tree, or two snapshots:
+
+    dm_diff
+    dm_diff .management/snapshots/md_20230415_133000_123456.jsonl.gz
+    dm_diff old.jsonl.gz new.jsonl.gz
+
+Output (one block per measurement, in the order of the ids):
+
+    + [id] [path]               new measurement
+    - [id] [path]               removed measurement
+    ~ [id] [path]               changed metadata, followed by the changed
+                                entries
+    > [id] [old path] -> [new path]
+                                moved measurement
+
+Two snapshot files are compared one line at a time. The current metadata of
+the tree are read in the order of the directories and must be sorted by id
+before the comparison, i.e., comparing with the current tree holds the
+records of all measurements in memory and takes O(n log n) time.
+"""
+import os
+import sys
+import argparse
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Compare metadata snapshots of a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '--save-snapshot',
+        help='Save a snapshot of the current metadata and exit. The ' +
+        'snapshot is written to FILE, if given, otherwise to ' +
+        '.management/snapshots/',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='FILE',
+    )
+    parser.add_argument(
+        '-s', '--summary',
+        help='Only print the number of changes',
+        action='store_true',
+    )
+    parser.add_argument(
+        'old',
+        help='Old snapshot (default: last saved snapshot)',
+        nargs='?',
+        default=None,
+    )
+    parser.add_argument(
+        'new',
+        help='New snapshot (default: current metadata of the tree, which ' +
+        'are held in memory and sorted by id before the comparison)',
+        nargs='?',
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+def _format_value(value):
+    if value is None:
+        return '(not set)'
+    return repr(value)
+
+
+def print_change(item, fid=None):
+    if fid is None:
+        fid = sys.stdout
+    if item.kind == 'added':
+        fid.write('+ {} {}\n'.format(item.key, item.new.path))
+    elif item.kind == 'removed':
+        fid.write('- {} {}\n'.format(item.key, item.old.path))
+    elif item.kind == 'moved':
+        fid.write('> {} {} -> {}\n'.format(
+            item.key, item.old.path, item.new.path))
+    else:
+        fid.write('~ {} {}\n'.format(item.key, item.new.path))
+        if item.old.path != item.new.path:
+            fid.write('    (moved from {})\n'.format(item.old.path))
+        for entry, old_value, new_value in item.entries:
+            fid.write('    {}: {} -> {}\n'.format(
+                entry, _format_value(old_value), _format_value(new_value)))
+
+
+@script_main
+def main():
+    from ubg_data_toolbox import md_snapshot
+
+    args = handle_args()
+    directory = os.getcwd() if args.tree is None else args.tree
+    dr_root = find_data_root(directory)
+
+    if args.save_snapshot is not None:
+        assert dr_root is not None, \
+            'cannot find dr data root, must begin with dr_'
+        with instrumentation.phase('scan'):
+            filename = md_snapshot.save_snapshot(
+                dr_root, args.save_snapshot or None)
+        print('Snapshot written to', filename)
+        return
+
+    old_file = args.old
+    if old_file is None:
+        assert dr_root is not None, \
+            'cannot find dr data root, must begin with dr_'
+        snapshots = md_snapshot.find_snapshots(dr_root)
+        if len(snapshots) == 0:
+            print('No snapshots found, save one with --save-snapshot')
+            sys.exit(1)
+        old_file = snapshots[-1]
+    old_header = md_snapshot.read_snapshot_header(old_file)
+    old_records = md_snapshot.read_snapshot(old_file)
+
+    if args.new is None:
+        assert dr_root is not None, \
+            'cannot find dr data root, must begin with dr_'
+        print('Comparing {} ({}) with the current tree'.format(
+            old_file, old_header['created']))
+        with instrumentation.phase('scan'):
+            new_records = md_snapshot.get_tree_records(dr_root)
+    else:
+        new_header = md_snapshot.read_snapshot_header(args.new)
+        print('Comparing {} ({}) with {} ({})'.format(
+            old_file, old_header['created'],
+            args.new, new_header['created']))
+        new_records = md_snapshot.read_snapshot(args.new)
+
+    counts = dict.fromkeys(('added', 'removed', 'changed', 'moved'), 0)
+    with instrumentation.phase('compare'):
+        for item in md_snapshot.diff_snapshots(old_records, new_records):
+            counts[item.kind] += 1
+            if not args.summary:
+                print_change(item)
+    print('{added} added, {removed} removed, {changed} changed, '
+          '{moved} moved'.format(**counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Look up and list measurements across multiple data trees
+
+The data trees are registered in the [federation] section of the configuration
+file (see ubg_data_toolbox.federation):
+
+    [federation]
+    hydro = /data/hydrogeophysics/dr_data
+    sip_lab = /data/laboratory/dr_sip
+
+Measurement directories are printed as [namespace]:[path relative to the data
+root]:
+
+    dm_federation roots             registered trees and number of ids
+    dm_federation list              all ids (use --prefix to filter)
+    dm_federation lookup ID [ID..]  measurement directories of the given ids
+    dm_federation duplicates        ids used in more than one tree
+"""
+import sys
+import argparse
+
+from ubg_data_toolbox.federation import federation
+from ubg_data_toolbox.federation import get_federation_roots
+from ubg_data_toolbox.federation import get_namespaced_path
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Query the measurement ids of multiple data trees',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        'mode',
+        choices=['roots', 'list', 'lookup', 'duplicates'],
+        help='roots: show the registered trees. list: list the ids of all ' +
+        'trees. lookup: find the measurements of the given ids. ' +
+        'duplicates: list ids used in more than one tree',
+    )
+    parser.add_argument(
+        'ids',
+        help='lookup: ids to look up',
+        nargs='*',
+    )
+    parser.add_argument(
+        '-c', '--config',
+        help='Configuration file with a [federation] section (default: ' +
+        'ub_geoph_dm.cfg with the highest priority)',
+        default=None,
+    )
+    parser.add_argument(
+        '-n', '--namespace',
+        help='list: only list the measurements of this tree (can be given ' +
+        'multiple times)',
+        action='append',
+        default=None,
+    )
+    parser.add_argument(
+        '-p', '--prefix',
+        help='list, duplicates: only consider ids starting with PREFIX',
+        default='',
+    )
+    parser.add_argument(
+        '--rescan',
+        help='Rescan the trees (only those given by --namespace, if ' +
+        'given) and update their id maps',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of trees opened in parallel (default: all)',
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+@script_main
+def main():
+    args = handle_args()
+    roots = get_federation_roots(args.config)
+    if len(roots) == 0:
+        print('No data trees registered in the [federation] section of the '
+              'configuration file')
+        sys.exit(1)
+
+    fed = federation(roots, workers=args.workers)
+    with instrumentation.phase('scan'):
+        errors = fed.open(rescan=args.rescan, namespaces=args.namespace)
+    for namespace, error in sorted(errors.items()):
+        sys.stderr.write('WARNING: skipping {}: {}\n'.format(
+            namespace, error))
+
+    if args.mode == 'roots':
+        for root in fed.roots:
+            if root.index is None:
+                status = 'ERROR'
+            else:
+                status = '{} ids'.format(root.index.nr_entries)
+            print('{}\t{}\t{}'.format(root.namespace, root.dr_root, status))
+    elif args.mode == 'list':
+        for m_id, namespace, relpath in fed.iter_entries(
+                args.prefix, args.namespace):
+            print('{}\t{}'.format(m_id, get_namespaced_path(
+                namespace, relpath)))
+    elif args.mode == 'lookup':
+        not_found = 0
+        for m_id in args.ids:
+            entries = fed.lookup(m_id)
+            if len(entries) == 0:
+                print('{}\tNOT FOUND'.format(m_id))
+                not_found += 1
+            for entry in entries:
+                print('{}\t{}'.format(m_id, get_namespaced_path(*entry[1:])))
+        if not_found > 0:
+            sys.exit(1)
+    else:
+        nr_duplicates = 0
+        for m_id, entries in fed.find_duplicates(args.prefix):
+            nr_duplicates += 1
+            print('{}\t{}'.format(m_id, '\t'.join(
+                get_namespaced_path(x[1], x[2]) for x in entries)))
+        print('{} ids used in more than one tree'.format(nr_duplicates))
+    fed.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""dm_find_duplicates - Find files with identical content in the measurement
+directories of a data tree
+
+Files are first grouped by size, then by a partial hash (first and last block),
+and only the remaining candidates are hashed completely. Checksums stored by
+dm_fixity are reused if the files did not change in the meantime.
+
+"""
+import logging
+import os
+import json
+import argparse
+
+from ubg_data_toolbox.duplicates import duplicate_finder
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Find duplicate files in a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '-l', '--level',
+        help='Only consider measurements below this directory. This is a ' +
+        'directory that MUST reside within the data root',
+        required=False,
+    )
+    parser.add_argument(
+        '--min-size',
+        help='Ignore files smaller than this size in bytes (default: 1)',
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of worker threads (default: number of CPUs)',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Write the duplicate sets to this file (one JSON object per ' +
+        'line)',
+        required=False,
+    )
+    parser.add_argument(
+        '--debug', help='Debug output', required=False,
+        action='store_true',
+    )
+    args = parser.parse_args()
+    return args
+
+
+@script_main
+def main():
+    logging.basicConfig(
+        level=logging.INFO
+    )
+    args = handle_args()
+    if args.debug:
+        loglevel = logging.DEBUG
+    else:
+        loglevel = logging.INFO
+    logger = logging.getLogger(__name__)
+    logger.setLevel(loglevel)
+
+    if args.tree is None:
+        # assume pwd as directory
+        directory = os.getcwd()
+    else:
+        directory = args.tree
+        assert os.path.isdir(directory), 'Argument is not a valid directory'
+
+    finder = duplicate_finder(
+        directory,
+        min_size=args.min_size,
+        workers=args.workers,
+        loglevel=loglevel,
+    )
+
+    fid = None
+    if args.output is not None:
+        fid = open(args.output, 'w')
+
+    nr_sets = 0
+    reclaimable = 0
+    for duplicate_set in finder.find_duplicates(subdir=args.level):
+        nr_sets += 1
+        reclaimable += duplicate_set['reclaimable']
+        print('-' * 80)
+        print('{} identical files of size {} bytes (sha256: {})'.format(
+            len(duplicate_set['files']),
+            duplicate_set['size'],
+            duplicate_set['digest'],
+        ))
+        for item in duplicate_set['files']:
+            print('    [id: {}] {}'.format(item['id'], item['path']))
+        if fid is not None:
+            fid.write(json.dumps(duplicate_set) + '\n')
+
+    if fid is not None:
+        fid.close()
+
+    print('-' * 80)
+    logger.info('Found {} sets of duplicates'.format(nr_sets))
+    logger.info('Reclaimable storage: {:.1f} MiB'.format(
+        reclaimable / 1024 ** 2))
+    logger.info('Files read completely: {}'.format(finder.nr_full_reads))
+    if len(finder.errors) > 0:
+        logger.warning('{} files could not be read and were skipped'.format(
+            len(finder.errors)))
+
+
+if __name__ == '__main__':
+    main()
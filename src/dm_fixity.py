@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""dm_fixity - Compute and verify checksums of all files in measurement
+directories
+
+Digests are cached in .management/fixity_[ALGORITHM].cache of the data root.
+The "update" mode only hashes new or changed files, while the "verify" mode
+re-reads all (or a random sample of) files and compares the digests with the
+stored ones.
+
+Examples:
+
+    dm_fixity update
+    dm_fixity verify --sample-fraction 0.05
+    dm_fixity verify -l tc_Hydrogeophysics/t_field/s_Spiekeroog
+
+"""
+import logging
+import os
+import sys
+import argparse
+
+from ubg_data_toolbox.fixity import fixity_manifest
+from ubg_data_toolbox.fixity import ALGORITHMS
+from ubg_data_toolbox.fixity import format_throughput
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+
+
+def _sample_count(value):
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError(
+            'sample count must be at least 1: {}'.format(value))
+    return count
+
+
+def _sample_fraction(value):
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise argparse.ArgumentTypeError(
+            'sample fraction must be in (0, 1]: {}'.format(value))
+    return fraction
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Compute and verify checksums of measurement data',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        'mode',
+        choices=['update', 'verify'],
+        help='update: hash new or changed files. verify: re-read files and ' +
+        'compare with stored checksums',
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '-l', '--level',
+        help='Only work on measurements below this directory. This is a ' +
+        'directory that MUST reside within the data root',
+        required=False,
+    )
+    parser.add_argument(
+        '-a', '--algorithm',
+        help='Hash algorithm (default: sha256)',
+        choices=ALGORITHMS,
+        default='sha256',
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of worker threads (default: number of CPUs)',
+        type=int,
+        default=None,
+    )
+    sample_group = parser.add_mutually_exclusive_group()
+    sample_group.add_argument(
+        '--sample-count',
+        help='verify: only check this number of randomly chosen files',
+        type=_sample_count,
+        default=None,
+    )
+    sample_group.add_argument(
+        '--sample-fraction',
+        help='verify: only check this fraction (e.g., 0.1) of the files, ' +
+        'chosen randomly',
+        type=_sample_fraction,
+        default=None,
+    )
+    parser.add_argument(
+        '--seed',
+        help='verify: seed for the random sample',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '--debug', help='Debug output', required=False,
+        action='store_true',
+    )
+    args = parser.parse_args()
+    return args
+
+
+@script_main
+def main():
+    logging.basicConfig(
+        level=logging.INFO
+    )
+    args = handle_args()
+    if args.debug:
+        loglevel = logging.DEBUG
+    else:
+        loglevel = logging.INFO
+    logger = logging.getLogger(__name__)
+    logger.setLevel(loglevel)
+
+    if args.tree is None:
+        # assume pwd as directory
+        directory = os.getcwd()
+    else:
+        directory = args.tree
+        assert os.path.isdir(directory), 'Argument is not a valid directory'
+
+    manifest = fixity_manifest(
+        directory,
+        algorithm=args.algorithm,
+        workers=args.workers,
+        loglevel=loglevel,
+    )
+    logger.info('Data root: {}'.format(manifest.dr_root))
+
+    if args.mode == 'update':
+        report = manifest.update(subdir=args.level)
+        logger.info(
+            'new: {new}, changed: {changed}, unchanged: {unchanged}, '
+            'removed: {removed}'.format(**report)
+        )
+        logger.info('Hashed {:.1f} MiB in {:.1f} s ({})'.format(
+            report['bytes_hashed'] / 1024 ** 2,
+            report['seconds'],
+            format_throughput(report['bytes_hashed'], report['seconds']),
+        ))
+        return
+
+    if len(manifest.entries) == 0:
+        logger.warning(
+            'No checksums stored yet, run "dm_fixity update" first')
+    sample = args.sample_count
+    if args.sample_fraction is not None:
+        sample = args.sample_fraction
+    report = manifest.verify(
+        sample=sample, subdir=args.level, seed=args.seed)
+    for relpath in report['modified']:
+        logger.warning('MODIFIED (update required): {}'.format(relpath))
+    for relpath in report['missing']:
+        logger.error('MISSING: {}'.format(relpath))
+    for relpath in report['corrupted']:
+        logger.error('CORRUPTED: {}'.format(relpath))
+    logger.info(
+        'ok: {}, corrupted: {}, modified: {}, missing: {}'.format(
+            len(report['ok']),
+            len(report['corrupted']),
+            len(report['modified']),
+            len(report['missing']),
+        )
+    )
+    logger.info('Read {:.1f} MiB in {:.1f} s ({})'.format(
+        report['bytes_read'] / 1024 ** 2,
+        report['seconds'],
+        format_throughput(report['bytes_read'], report['seconds']),
+    ))
+    if len(report['corrupted']) > 0 or len(report['missing']) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
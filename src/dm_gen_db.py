@@ -1,22 +1,98 @@
 #!/usr/bin/env python
 """
-Generate a pandas dataframe with all metadata included.
+Generate a database (pandas dataframe) with the metadata of all measurements.
 
-WARNING: This is the really dumb way and I'm not sure this scales. However, I
-hope for now it is enough.
+The database is written to the .management directory of the data tree, by
+default as a typed Parquet file (or CSV, if no Arrow engine is installed). See
+ubg_data_toolbox.md_database for the formats and for loading the database.
 
 Todo: custom metadata entries are not imported at the moment
 
 """
 import os
-
-import pandas as pd
+import argparse
 
 from ubg_data_toolbox.dirtree_nav import find_data_root
 from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    from ubg_data_toolbox.md_database import FORMATS
+    parser = argparse.ArgumentParser(
+        description='Generate the metadata database of a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-f', '--format',
+        help='Format of the database (default: parquet if available, ' +
+        'otherwise csv)',
+        choices=FORMATS,
+        default=None,
+    )
+    parser.add_argument(
+        '--remove-other-formats',
+        help='Delete the database files of all other formats in ' +
+        '.management (including db.pickle of previous versions)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-s', '--snapshot',
+        help='Read the metadata from a tree snapshot (see dm_snapshot) ' +
+        'instead of the data tree',
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+def get_record(chain):
+    """Return the database record {[section].[key]: value} of the merged
+    metadata of a metadata chain"""
+    data = chain.get_merged_metadata()
+    assert 'id' in data['general'], 'ID required for processing'
+    record = {}
+    for section in data:
+        for item in data[section].values():
+            record[section + '.' + item.name] = item.value
+    return record
+
+
+def get_records_from_snapshot(filename):
+    """Return the database records of all measurements of a tree snapshot
+    (see ubg_data_toolbox.tree_snapshot) and the data root of the snapshot
+    """
+    from ubg_data_toolbox.tree_snapshot import load_snapshot
 
+    with instrumentation.phase('scan'):
+        snapshot = load_snapshot(filename)
+    records = []
+    with instrumentation.phase('merge'):
+        for relpath in snapshot.find_measurement_directories():
+            print('.' + os.sep + relpath)
+            records.append(get_record(snapshot.get_metadata_chain(relpath)))
+    return records, snapshot.dr_root
 
+
+@script_main
 def main():
+    from ubg_data_toolbox import md_database
+
+    args = handle_args()
+    if args.snapshot is not None:
+        records, snapshot_root = get_records_from_snapshot(args.snapshot)
+        # write to the current data tree, if any, otherwise to the tree of
+        # the snapshot
+        dr_root = find_data_root(os.getcwd()) or snapshot_root
+        db = md_database.build_database(records)
+        with instrumentation.phase('write'):
+            filename = md_database.write_database(
+                db, dr_root, args.format, args.remove_other_formats)
+        print('Database written to', filename)
+        return
+
     dr_root = find_data_root(os.getcwd())
     assert dr_root is not None, 'Could not find a data root directory'
     pwd = os.getcwd()
@@ -24,37 +100,28 @@ def main():
     os.chdir(dr_root)
 
     m_dirs = []
-    for root, dirs, files in os.walk('.'):
-        if os.path.basename(root).startswith('m_'):
-            metadata_file = root + os.sep + 'metadata.ini'
-            if os.path.isfile(metadata_file):
-                # print(root)
-                m_dirs.append(root)
-
-    global_df_list = []
-
-    for mdir in m_dirs:
-        print(mdir)
-        chain = metadata_chain(mdir)
-        data = chain.get_merged_metadata()
-        assert 'id' in data['general'], 'ID required for processing'
-        df_list = []
-        for section in data:
-            subdata = data[section]
-            subdf = pd.DataFrame(
-                {x[1].name: x[1].value for x in subdata.items()},
-                index=[data['general']['id'].value, ])
-            subdf.columns = pd.MultiIndex.from_product(
-                [[section, ], list(subdf.columns)])
-            df_list.append(subdf)
-        df = pd.concat(df_list, axis=1)
-        global_df_list.append(df)
-
-    df_all = pd.concat(global_df_list)
-    os.makedirs('.management', exist_ok=True)
-    filename = '.management/db.pickle'
-    print('Writing database file to', filename)
-    df_all.to_pickle(filename)
+    with instrumentation.phase('scan'):
+        for root, dirs, files in os.walk('.'):
+            instrumentation.increment('directories_visited')
+            if os.path.basename(root).startswith('m_'):
+                metadata_file = root + os.sep + 'metadata.ini'
+                if os.path.isfile(metadata_file):
+                    # print(root)
+                    m_dirs.append(root)
+
+    records = []
+
+    with instrumentation.phase('merge'):
+        for mdir in m_dirs:
+            print(mdir)
+            records.append(get_record(metadata_chain(mdir)))
+
+        db = md_database.build_database(records)
+
+    with instrumentation.phase('write'):
+        filename = md_database.write_database(
+            db, '.', args.format, args.remove_other_formats)
+    print('Database written to', filename)
     os.chdir(pwd)
 
 
@@ -1,29 +1,118 @@
 #!/usr/bin/env python
-import pandas as pd
+"""Generate a static HTML overview of the metadata database of a data tree
 
+The database must be generated first using dm_gen_db. The generated site
+bundles all its assets and can be opened directly from disk (index.html in
+the output directory), also on computers without internet access.
+
+In addition, a detail page is generated for each measurement. Detail pages
+are only rendered again if the metadata files or the files of the
+measurement changed since the last run.
+"""
+import os
+import argparse
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Generate a static HTML overview of a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Output directory (default: overview)',
+        default='overview',
+    )
+    parser.add_argument(
+        '--columns',
+        help='Comma-separated list of columns ([section].[key]) to show. ' +
+        'Use "all" for all columns. Default: a selection of general entries',
+        default=None,
+    )
+    parser.add_argument(
+        '--chunk-size',
+        help='Number of rows per data file (default: 250)',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '--no-details',
+        help='Do not generate the detail pages of the measurements',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help='Number of processes used to render the detail pages ' +
+        '(default: number of CPUs)',
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+@script_main
 def main():
-    data = pd.read_pickle('.management/db.pickle')
-    with open('overview.html', 'w') as fid:
-        fid.write('<html>\n')
-        fid.write('<head>\n')
-        fid.write("""<script src="https://ajax.googleapis.com/ajax/libs/jquery/3.6.0/jquery.min.js"></script>
-             <link rel="stylesheet" type="text/css" href="https://cdn.datatables.net/1.11.3/css/jquery.dataTables.css">
-            <script type="text/javascript" charset="utf8" src="https://cdn.datatables.net/1.11.3/js/jquery.dataTables.js"></script>
-            <script>
-                    $(document).ready( function () { $('#data_table').DataTable(
-                    {
-                        search: {
-                            return: true
-                        }
-                    }
-                    ); } );
-            </script>
-      </head>
-    <body>""")
-        fid.write(
-            data.to_html(classes=['display', ], table_id='data_table')
+    from ubg_data_toolbox import html_site
+    from ubg_data_toolbox.md_database import load_database
+
+    args = handle_args()
+    directory = os.getcwd() if args.tree is None else args.tree
+    dr_root = find_data_root(directory)
+    assert dr_root is not None, 'cannot find dr data root, must begin with dr_'
+
+    columns = None
+    if args.columns == 'all':
+        columns = 'all'
+    elif args.columns is not None:
+        columns = args.columns.split(',')
+
+    chunk_size = args.chunk_size
+    if chunk_size is None:
+        chunk_size = html_site.CHUNK_SIZE
+
+    column_links = None
+    if not args.no_details:
+        column_links = {'general.id': html_site.PAGE_DIR + '/{}.html'}
+
+    with instrumentation.phase('scan'):
+        data = load_database(dr_root)
+    with instrumentation.phase('write'):
+        info = html_site.write_overview_site(
+            data,
+            args.output,
+            columns=columns,
+            title=os.path.basename(dr_root),
+            chunk_size=chunk_size,
+            column_links=column_links,
         )
-        fid.write('</body></html>')
+    print('Wrote overview of {} measurements to {}'.format(
+        info['nr_rows'],
+        os.path.join(args.output, 'index.html'),
+    ))
+
+    if not args.no_details:
+        info = html_site.write_measurement_pages(
+            dr_root, args.output, workers=args.jobs)
+        print('Detail pages: {} rendered, {} unchanged, {} removed'.format(
+            info['nr_rendered'],
+            info['nr_pages'] - info['nr_rendered'],
+            info['nr_removed'],
+        ))
+        for m_dir in info['missing_ids']:
+            print('WARNING: no id, no detail page:', m_dir)
+
 
 if __name__ == '__main__':
     main()
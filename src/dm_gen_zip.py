@@ -9,11 +9,15 @@ import shutil
 import argparse
 
 from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Create a zip file for a data tree',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-t', '--tree',
@@ -66,18 +70,21 @@ def gen_zip(dr_tree_dir, output):
 
     os.chdir(pathlib.Path(os.path.abspath(dr_root)).parent)
 
-    shutil.make_archive(
-        output_abs,
-        'zip',
-        os.path.basename(dr_tree_dir),
-        base_dir=os.path.relpath(
-            os.path.abspath(dr_root),
-            start=os.path.basename(dr_root)
+    with instrumentation.phase('write'):
+        archive = shutil.make_archive(
+            output_abs,
+            'zip',
+            os.path.basename(dr_tree_dir),
+            base_dir=os.path.relpath(
+                os.path.abspath(dr_root),
+                start=os.path.basename(dr_root)
+            )
         )
-    )
+    instrumentation.increment('bytes_compressed', os.path.getsize(archive))
     os.chdir(pwd)
 
 
+@script_main
 def main():
     logging.basicConfig(
         level=logging.INFO
@@ -5,48 +5,18 @@ import argparse
 
 from ubg_data_toolbox.metadata import metadata_chain
 from ubg_data_toolbox import id_handling
+from ubg_data_toolbox.id_allocator import id_allocator
 from ubg_data_toolbox.dirtree_nav import find_data_root
-
-
-class id_generator_simple(object):
-    """A simple ID generator that generates alpha-numeric ID in the form
-        '[PREFIX]_[SITE]_[YEAR:%04i]_[RUNNING_NR:%08i]',
-    """
-    def __init__(self, handler, prefix=None, start_nr=None):
-        self.handler = handler
-        if prefix is None or prefix == '':
-            self.prefix = ''
-        else:
-            self.prefix = prefix + '_'
-        self.next_nr = start_nr
-
-    def gen_id(self, metadata):
-        if metadata['general']['survey_type'] == 'field':
-            site = metadata['field']['site'].lower()
-        else:
-            site = ''
-
-        new_id = '{}{}_{}_{:04}_{:08}'.format(
-            self.prefix,
-            site,
-            metadata['general']['method'].lower(),
-            metadata['general']['datetime_start'][0:4],
-            self.next_nr
-        )
-        self.next_nr += 1
-        return new_id
-
-    def get_next_free_id(self, metadata):
-        new_id = self.gen_id(metadata)
-        while self.handler.check_id_present(new_id):
-            new_id = self.gen_id()
-        return new_id
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Fill in missing ids using the Schema: ' +
-        '[SITE]_[YEAR]_[RUNNING_NR]',
+        '[PREFIX_][SITE]_[METHOD]_[YEAR]_[RUNNING_NR]. Running numbers ' +
+        'are stored in .management/id_counters.json',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '--level',
@@ -69,6 +39,7 @@ def handle_args():
     return args
 
 
+@script_main
 def main():
     args = handle_args()
 
@@ -79,16 +50,17 @@ def main():
     dr_root = find_data_root(datatree)
     assert dr_root is not None, 'Could not find a data root directory'
 
+    # the id map is required to guarantee unique ids
     handler = id_handling.data_id_handler(
         dr_root,
         try_cache=True,
-        update_cache=False
+        update_cache=True
     )
 
-    id_gen = id_generator_simple(
+    id_gen = id_allocator(
         handler,
         prefix=args.prefix,
-        start_nr=1,
+        persist=not args.dry_run,
     )
 
     print('Adding IDs to measurements missing an ID:')
@@ -125,24 +97,30 @@ def main():
         else:
             need_new_id = True
         if need_new_id:
+            # the id components can also be inherited from higher levels,
+            # merged in the same way as for all other tools
+            merged = chain.get_merged_config()
             required_entries = [
                 ('general', 'survey_type'),
                 ('general', 'method'),
                 ('general', 'datetime_start'),
             ]
 
-            for section, entry in required_entries:
-                if entry not in config[section]:
-                    print('Cannot generate an ID due to missing metadata')
-                    print('    missing entry:', entry)
-                    continue
+            missing = [
+                entry for section, entry in required_entries
+                if not merged.has_option(section, entry)
+            ]
+            if len(missing) > 0:
+                print('Cannot generate an ID due to missing metadata')
+                print('    missing entries:', missing)
+                continue
 
-            if config['general']['survey_type'] == 'field':
-                if 'site' not in config['field']:
+            if merged['general']['survey_type'] == 'field':
+                if not merged.has_option('field', 'site'):
                     print('site missing from [field] section')
                     continue
 
-            new_id = id_gen.get_next_free_id(config)
+            new_id = id_gen.get_next_free_id(merged)
 
             if args.level is not None:
                 mdir_short = os.path.relpath(mdir, args.level)
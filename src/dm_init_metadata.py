@@ -11,11 +11,14 @@ import argparse
 from ubg_data_toolbox.metadata import metadata_chain
 
 import ubg_data_toolbox.dm_dirtree as dm_dirtree
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Initialize a metadata.ini file',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '--overwrite',
@@ -39,6 +42,7 @@ def init_empty_config():
     return config
 
 
+@script_main
 def main():
     args = handle_args()
     if os.path.isfile('metadata.ini') and not args.overwrite:
@@ -5,58 +5,51 @@
 import os
 import argparse
 
-from ubg_data_toolbox.dirtree import tree
+from ubg_data_toolbox.dirtree_automaton import get_automaton
+from ubg_data_toolbox.dirtree_automaton import START_STATE
 from ubg_data_toolbox.dirtree_nav import find_data_root
 from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Add one measurement to a given data directory structure',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-g', '--general',
         help='Also print out metadata from [general] (separate keys with ;)',
         required=False,
     )
+    parser.add_argument(
+        '-s', '--snapshot',
+        help='List the measurements of a tree snapshot (see dm_snapshot) ' +
+        'instead of the data tree',
+        default=None,
+    )
     args = parser.parse_args()
     return args
 
 
-def _get_prefix(directory):
-    workstr = os.path.basename(os.path.abspath(directory))
-    assert isinstance(directory, str)
-    if workstr.find('_') == -1:
-        return None
-    return workstr.split('_')[0]
-
-
-def _get_directory_name(directory):
-    """Return the name of the directory by removing the prefix.
-    Return None if no prefix was found
-    """
-    workstr = os.path.basename(os.path.abspath(directory))
-    assert isinstance(directory, str)
-    if workstr.find('_') == -1:
-        return None
-    return workstr.split('_')[1]
-
-
 def walk_and_print_dirtree(
-        directory, nodes, basedir, level=0, metadata_entries=None):
-    dr_root = find_data_root(directory)
+        directory, state, basedir, level=0, metadata_entries=None,
+        dr_root=None):
+    """Print all measurement directories below a directory
+
+    Parameters
+    ----------
+    directory : str
+        Directory to start with
+    state : tuple
+        State of the parent directory (see
+        ubg_data_toolbox.dirtree_automaton), START_STATE for the data root
+    """
+    automaton = get_automaton()
+    if dr_root is None:
+        dr_root = find_data_root(directory)
     directory_name = os.path.basename(os.path.abspath(directory))
-    # print('@@@')
-    # print(directory)
-    # print(dr_root)
-    # relpath = os.path.relpath(directory, os.path.dirname(dr_root))
-
-    # the nodes list contains all dir levels allowed for this level
-    # print('    ' * level + 'Directory', relpath)
-
-    # print(
-    #     '    ' * level + 'Corresponding tree entry',
-    #     [node.name for node in nodes])
 
     # We allow some directories that can contain arbitrary information.
     # Don't test them
@@ -68,31 +61,14 @@ def walk_and_print_dirtree(
 
     # We also ignore .* directories - these are only used for temporary data
     if directory_name.startswith('.'):
-        # print(
-        #     '    ' * (level + 1) +
-        #     "Directory starts with a dot, will not be analysed"
-        # )
         return
 
-    # Go through all possible nodes and check if one fits
-    found_a_prefix = False
-    node = None
-    for test_node in nodes:
-        # check prefix
-        prefix = _get_prefix(directory)
-        check_prefix = test_node.abbreviation == prefix
-        # print('    ' * level + 'check_prefix', check_prefix)
-        if check_prefix:
-            found_a_prefix = True
-            # this is the node corresponding to this directory level here
-            node = test_node
-    if not found_a_prefix:
+    # find the directory level corresponding to this directory
+    node, node_state = automaton.step(state, directory_name)
+    if node is None:
         return
-    # print(node.name, node.abbreviation, node)
-    # TODO: Any level-specific tests could now be called here using the node
-    # variable, which could also directly store these tests.
 
-    if prefix == 'm':
+    if node.abbreviation == 'm':
         # found one measurement
         print(
             os.path.relpath(
@@ -102,16 +78,24 @@ def walk_and_print_dirtree(
         )
 
         if metadata_entries is not None:
-            chain = metadata_chain(directory)
-            mdata = chain.get_merged_metadata()
-            items = metadata_entries.split(';')
-            if 'general' in mdata:
-                for item in items:
-                    if item in mdata['general']:
-                        print(' ' * 8 + '{} = {}'.format(
-                            item,
-                            mdata['general'][item].value
-                        ))
+            _print_metadata_entries(
+                metadata_chain(directory), metadata_entries)
+
+    # for levels with conditional children, the allowed levels depend on
+    # the value of this directory
+    child_nodes = automaton.get_allowed_children(node_state)
+    if child_nodes is None:
+        print(
+            'ERROR: This node has the value: "{}".'.format(node_state[1]) +
+            ' However, we only allowed those values {}'.format(
+                node.conditional_children.keys()
+            )
+        )
+        return
+
+    # do not continue of there are no remaining node children
+    if len(child_nodes) == 0:
+        return
 
     # Next level:
     subdirs = [
@@ -119,40 +103,51 @@ def walk_and_print_dirtree(
             directory + os.sep + x
         ) for x in sorted(
             os.listdir(directory)) if os.path.isdir(directory + os.sep + x)]
-    # print('   ' * level + 'subdirs', subdirs)
-
-    # we ignore "normal" children in case of conditional children
-    if len(node.conditional_children) > 0:
-        name = _get_directory_name(directory)
-        if name not in node.conditional_children:
-            print(
-                'ERROR: This node has the value: "{}".'.format(name) +
-                ' However, we only allowed those values {}'.format(
-                    node.conditional_children.keys()
-                )
-            )
-            return
-        else:
-            child_nodes = [node.conditional_children[name], ]
-            for subdir in subdirs:
-                # found a condition
-                walk_and_print_dirtree(
-                    subdir, child_nodes, basedir, level + 1,
-                    metadata_entries
-                )
-    else:
-        # do not continue of there are no remaining node children
-        if len(node.children) == 0:
-            return
-
-        for subdir in subdirs:
-            walk_and_print_dirtree(
-                subdir, node.children, basedir, level + 1, metadata_entries
-            )
+    for subdir in subdirs:
+        walk_and_print_dirtree(
+            subdir, node_state, basedir, level + 1, metadata_entries,
+            dr_root=dr_root,
+        )
+
 
+def _print_metadata_entries(chain, metadata_entries):
+    mdata = chain.get_merged_metadata()
+    items = metadata_entries.split(';')
+    if 'general' in mdata:
+        for item in items:
+            if item in mdata['general']:
+                print(' ' * 8 + '{} = {}'.format(
+                    item,
+                    mdata['general'][item].value
+                ))
 
+
+def print_snapshot_measurements(filename, metadata_entries=None):
+    """Print all measurement directories of a tree snapshot (see
+    ubg_data_toolbox.tree_snapshot)"""
+    from ubg_data_toolbox.tree_snapshot import load_snapshot
+
+    snapshot = load_snapshot(filename)
+    print(
+        'Measurement directories found in data root: {} (snapshot of {})'
+        .format(snapshot.dr_root, snapshot.created)
+    )
+    print('.' * 80)
+    for relpath in snapshot.find_measurement_directories(
+            with_metadata=False):
+        print(snapshot.root_name + os.sep + relpath.replace('/', os.sep))
+        if metadata_entries is not None:
+            _print_metadata_entries(
+                snapshot.get_metadata_chain(relpath), metadata_entries)
+    print('.' * 80)
+
+
+@script_main
 def main():
     args = handle_args()
+    if args.snapshot is not None:
+        print_snapshot_measurements(args.snapshot, args.general)
+        return
 
     directory = os.getcwd()
     dr_root = find_data_root(directory)
@@ -165,10 +160,15 @@ def main():
     assert dr_root is not None, 'cannot find dr data root, must begin with dr_'
     walk_and_print_dirtree(
         dr_root,
-        [tree, ],
+        START_STATE,
         basedir=os.getcwd(),
         # basedir=dr_root,
         level=0,
         metadata_entries=args.general,
+        dr_root=dr_root,
     )
     print('.' * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,11 +5,10 @@ import os
 import sys
 import configparser
 
-from prompt_toolkit.shortcuts import button_dialog
-
 import ubg_data_toolbox.dirtree_nav as dirtree_nav
 from ubg_data_toolbox.dir_levels import measurement_lab, measurement_field
 from ubg_data_toolbox import id_handling
+from ubg_data_toolbox.dm_cli import script_main
 
 nodes = {
     'field': measurement_field,
@@ -31,6 +30,7 @@ class colors:
     BLUE = '\033[34m'
 
 
+@script_main
 def main():
     # get the directory to work on
     if len(sys.argv) == 2:
@@ -71,6 +71,8 @@ def main():
         pass
         print('ASKING USER')
 
+        # only import prompt_toolkit if required (slow import)
+        from prompt_toolkit.shortcuts import button_dialog
         result = button_dialog(
             title='Select survey type',
             text='What type of measurement is this?',
@@ -6,8 +6,10 @@ Normalize a metadata.ini file in the present directory.
 import os
 
 from ubg_data_toolbox.metadata import metadata_chain
+from ubg_data_toolbox.dm_cli import script_main
 
 
+@script_main
 def main():
     if os.path.isfile('metadata.ini'):
         mdir = os.getcwd()
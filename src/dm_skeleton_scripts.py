@@ -7,11 +7,14 @@ import os
 
 import logging
 import argparse
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
         description='Update the ID map found in .management/id_maps.cache',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-m',
@@ -41,6 +44,7 @@ class update_md_from_path(object):
         self.logger.setLevel(loglevel)
 
 
+@script_main
 def main():
     logging.basicConfig(
         level=logging.INFO
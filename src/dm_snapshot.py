@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Write a snapshot of the directory skeleton and of all metadata.ini files of
+a data tree into one compressed file
+
+The read-only tools dm_list_measurements, dm_collect_ids and dm_gen_db can
+then run from the snapshot (--snapshot option) without accessing the tree.
+See ubg_data_toolbox.tree_snapshot.
+"""
+import os
+import time
+import argparse
+
+from ubg_data_toolbox.dirtree_nav import find_data_root
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Write a snapshot of the skeleton and the metadata of ' +
+        'a data tree',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Output file (default: .management/tree_snapshot.json.gz)',
+        default=None,
+    )
+    args = parser.parse_args()
+    return args
+
+
+@script_main
+def main():
+    from ubg_data_toolbox import tree_snapshot
+
+    args = handle_args()
+    directory = os.getcwd() if args.tree is None else args.tree
+    dr_root = find_data_root(directory)
+    assert dr_root is not None, 'cannot find dr data root, must begin with dr_'
+
+    filename = args.output
+    if filename is None:
+        filename = tree_snapshot.get_default_filename(dr_root)
+
+    start = time.perf_counter()
+    with instrumentation.phase('scan'):
+        snapshot = tree_snapshot.create_snapshot(dr_root)
+    with instrumentation.phase('write'):
+        snapshot.save(filename)
+    print(
+        'Snapshot of {} directories, {} measurements and {} metadata files '
+        'written to {} ({:.1f} s)'.format(
+            len(snapshot.directories),
+            len(snapshot.measurements),
+            len(snapshot.metadata),
+            filename,
+            time.perf_counter() - start,
+        ))
+
+
+if __name__ == '__main__':
+    main()
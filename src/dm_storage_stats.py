@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Report the number of files and bytes of a data tree per directory level
+
+The statistics are cached in .management/storage_stats.cache; only
+directories that changed since the last run are listed again (see
+ubg_data_toolbox.storage_stats).
+
+    dm_storage_stats                    summary per directory level
+    dm_storage_stats -l tc              per theme complex
+    dm_storage_stats -l md --by-value   per method (e.g., all md_ERT
+                                        directories combined)
+    dm_storage_stats -l m -f json       per measurement, as JSON
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+
+from ubg_data_toolbox.storage_stats import storage_stats
+from ubg_data_toolbox.storage_stats import format_size
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
+from ubg_data_toolbox import instrumentation
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(
+        description='Storage statistics of a data tree per directory level',
+        parents=[get_common_options()],
+    )
+    parser.add_argument(
+        '-t', '--tree',
+        help='Path of data tree (should start with: dr_). If not given, ' +
+        'use PWD ',
+        required=False,
+    )
+    parser.add_argument(
+        '-l', '--level',
+        help='Report the directories of this level (name or abbreviation, ' +
+        'e.g., tc, s, md, m). If not given, print a summary per level',
+        default=None,
+    )
+    parser.add_argument(
+        '--by-value',
+        help='Combine all directories of the level with the same name',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-f', '--format',
+        help='Output format (default: table)',
+        choices=['table', 'json'],
+        default='table',
+    )
+    parser.add_argument(
+        '--rescan',
+        help='Ignore the cache and list all directories (required to ' +
+        'notice files modified in place)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of directories listed in parallel ' +
+        '(default: 4 x number of CPUs)',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '--debug', help='Debug output', required=False,
+        action='store_true',
+    )
+    args = parser.parse_args()
+    return args
+
+
+def print_table(rows, fid=None):
+    if fid is None:
+        fid = sys.stdout
+    width = max([len(x['path']) for x in rows] + [4])
+    fid.write('{:<{w}}  {:>5}  {:>8}  {:>12}  {:>12}\n'.format(
+        'path', 'level', 'dirs', 'files', 'size', w=width))
+    for row in rows:
+        fid.write('{:<{w}}  {:>5}  {:>8}  {:>12}  {:>12}\n'.format(
+            row['path'], row['level'], row['directories'], row['files'],
+            format_size(row['bytes']), w=width))
+
+
+@script_main
+def main():
+    logging.basicConfig(
+        level=logging.INFO
+    )
+    args = handle_args()
+    if args.debug:
+        loglevel = logging.DEBUG
+    else:
+        loglevel = logging.INFO
+    logger = logging.getLogger(__name__)
+    logger.setLevel(loglevel)
+
+    if args.tree is None:
+        # assume pwd as directory
+        directory = os.getcwd()
+    else:
+        directory = args.tree
+        assert os.path.isdir(directory), 'Argument is not a valid directory'
+
+    stats = storage_stats(
+        directory, workers=args.workers, loglevel=loglevel)
+    with instrumentation.phase('scan'):
+        report = stats.refresh(rescan=args.rescan)
+    logger.info('{}: listed {scanned} directories, {reused} unchanged'.format(
+        stats.dr_root, **report))
+
+    if args.level is None:
+        rows = stats.get_level_summary()
+    else:
+        rows = stats.get_report(level=args.level, by_value=args.by_value)
+        if len(rows) == 0:
+            logger.warning('No directories of level {} found'.format(
+                args.level))
+
+    if args.format == 'json':
+        json.dump({
+            'dr_root': stats.dr_root,
+            'level': args.level,
+            'rows': rows,
+        }, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,14 @@ import argparse
 from ubg_data_toolbox.dirtree_nav import find_data_root
 # from ubg_data_toolbox.metadata import metadata_chain
 from ubg_data_toolbox.id_handling import data_id_handler
+from ubg_data_toolbox.dm_cli import script_main
+from ubg_data_toolbox.dm_cli import get_common_options
 
 
 def handle_args():
     parser = argparse.ArgumentParser(
-        description='Update the ID map found in .management/id_maps.cache',
+        description='Update the ID map found in .management/id_maps.idx',
+        parents=[get_common_options()],
     )
     parser.add_argument(
         '-t', '--tree',
@@ -23,7 +26,8 @@ def handle_args():
     )
     parser.add_argument(
         '-l', '--level',
-        help='Level to start checking on. This is a directory that MUST ' +
+        help='Only rescan this directory and merge the results into the ' +
+        'existing id map. This is a directory that MUST ' +
         'reside within the data root indicated by -t/--tree',
         required=False,
     )
@@ -36,6 +40,7 @@ def handle_args():
     return args
 
 
+@script_main
 def main():
     logging.basicConfig(
         level=logging.INFO
@@ -55,7 +60,7 @@ def main():
         directory = args.tree
         assert os.path.isdir(directory), 'Argument is not a valid directory'
 
-    logger.debug('Working in directory', directory)
+    logger.debug('Working in directory {}'.format(directory))
     dr_root = find_data_root(directory)
     assert dr_root is not None, 'cannot find dr data root, must begin with dr_'
 
@@ -63,11 +68,14 @@ def main():
     id_handler = data_id_handler(
         datatree=dr_root,
         try_cache=True,
-        update_cache=False,
+        # partial updates require a complete map to start with
+        update_cache=args.level is not None,
         loglevel=loglevel,
     )
-    id_handler
     id_handler.update_id_maps_from_dirtree(subdir=args.level)
     id_handler.save_to_cache()
-    # import IPython
-    # IPython.embed()
+    logger.info('id map contains {} ids'.format(len(id_handler.id2path)))
+
+
+if __name__ == '__main__':
+    main()